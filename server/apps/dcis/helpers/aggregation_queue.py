@@ -0,0 +1,75 @@
+"""Модуль очереди отложенного пересчета агрегации родительских документов.
+
+При сохранении значений дочернего документа агрегирующие ячейки родительского документа
+помечаются как ожидающие пересчета. Пометка добавляется атомарно, поэтому задача пересчета
+ставится в очередь только для ячеек, которые еще не ожидают пересчета, а изменения
+одной ячейки родительского документа в течение задержки объединяются в один пересчет.
+
+Пометка хранит время первого изменения и удаляется перед началом пересчета,
+чтобы изменения во время пересчета поставили новую задачу. Если задачу не удалось поставить
+в очередь, пометки удаляются сразу. Пометки живут задержку запуска задачи и время ожидания в очереди,
+при повторе задачи после ошибки они восстанавливаются на время до следующего запуска.
+"""
+
+from time import time
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+AGGREGATION_PENDING_KEY_TEMPLATE = 'cache.aggregation.pending.%s.%s'
+
+# Время ожидания задачи пересчета в очереди в секундах, после которого пометка истекает
+AGGREGATION_PENDING_QUEUE_TIMEOUT = 10 * 60
+
+
+def get_aggregation_pending_timeout(countdown: int | None) -> int:
+    """Получение времени жизни пометки ожидания пересчета в секундах.
+
+    :param countdown: задержка запуска задачи пересчета в секундах
+    """
+    return (countdown or 0) + AGGREGATION_PENDING_QUEUE_TIMEOUT
+
+
+def get_aggregation_pending_key(document_id: int | str, cell_id: int | str) -> str:
+    """Получение ключа пометки ожидания пересчета агрегирующей ячейки документа."""
+    return AGGREGATION_PENDING_KEY_TEMPLATE % (document_id, cell_id)
+
+
+def mark_aggregations_pending(document_id: int | str, cell_ids: Iterable[int]) -> list[int]:
+    """Пометка агрегирующих ячеек документа как ожидающих пересчета.
+
+    :return: идентификаторы ячеек, которые ранее не ожидали пересчета
+    """
+    marked_at = time()
+    timeout = get_aggregation_pending_timeout(settings.AGGREGATION_PROPAGATION_DELAY)
+    return [
+        cell_id for cell_id in dict.fromkeys(cell_ids)
+        if cache.add(get_aggregation_pending_key(document_id, cell_id), marked_at, timeout=timeout)
+    ]
+
+
+def refresh_aggregations_pending(document_id: int | str, cell_ids: Iterable[int], countdown: int) -> None:
+    """Восстановление пометок ожидания пересчета агрегирующих ячеек документа до повторного запуска задачи.
+
+    :param countdown: задержка повторного запуска задачи пересчета в секундах
+    """
+    marked_at = time()
+    cache.set_many(
+        {get_aggregation_pending_key(document_id, cell_id): marked_at for cell_id in cell_ids},
+        timeout=get_aggregation_pending_timeout(countdown),
+    )
+
+
+def clear_aggregations_pending(document_id: int | str, cell_ids: Iterable[int]) -> None:
+    """Удаление пометок ожидания пересчета агрегирующих ячеек документа."""
+    cache.delete_many([get_aggregation_pending_key(document_id, cell_id) for cell_id in cell_ids])
+
+
+def get_pending_aggregations(document_id: int | str, cell_ids: Iterable[int]) -> dict[int, float]:
+    """Получение агрегирующих ячеек документа, ожидающих пересчета.
+
+    :return: время первого изменения в виде {cell_id: timestamp}
+    """
+    keys: dict[str, int] = {get_aggregation_pending_key(document_id, cell_id): cell_id for cell_id in cell_ids}
+    return {keys[key]: marked_at for key, marked_at in cache.get_many(keys.keys()).items()}
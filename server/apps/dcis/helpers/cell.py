@@ -1,12 +1,13 @@
 """Вспомогательный модуль для расчета формул."""
 
-from collections import defaultdict
-from itertools import groupby
-from typing import Iterable, TypedDict
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, TypedDict
 
-from django.db.models import Q, QuerySet
-from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
-from xlsx_evaluate import Evaluator, Model, ModelCompiler
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+from openpyxl.utils.cell import coordinate_from_string, get_column_letter
+from xlsx_evaluate import Evaluator
 from xlsx_evaluate.functions.xlerrors import (
     DivZeroExcelError, NaExcelError, NameExcelError,
     NullExcelError, NumExcelError, RefExcelError,
@@ -14,8 +15,155 @@ from xlsx_evaluate.functions.xlerrors import (
 )
 
 from apps.dcis.models import Cell, Document, Sheet, Value
+from .formula_model import CompiledFormulaModel, get_compiled_formula_model
+from .sheet_cell_index import get_sheets_cell_indices
 from .sheet_formula_cache import SheetFormulaContainerCache
-from ..models.sheet import KindCell
+from ..models.sheet import KindCell, get_value_number
+
+
+CYCLE_ERROR = 'Циклическая ссылка'
+
+
+@dataclass
+class RecalculationPlan:
+    """План пересчета ячеек.
+
+        - dependency_cells - ячейки, значения которых нужны для расчета;
+        - inversion_cells - ячейки с формулами, которые нужно пересчитать, в порядке расчета;
+        - sequence_evaluate - последовательность расчета листов;
+        - cycles - группы ячеек, образующих циклические ссылки, включая ячейки, ссылающиеся сами на себя.
+    """
+    dependency_cells: list[str]
+    inversion_cells: list[str]
+    sequence_evaluate: list[str]
+    cycles: list[list[str]]
+
+    @classmethod
+    def build(cls, sheet_containers: list[SheetFormulaContainerCache], cells: Iterable[str]) -> 'RecalculationPlan':
+        """Построение плана пересчета для изменившихся ячеек.
+
+        Каждая затронутая ячейка посещается один раз. Ячейки циклов объединяются в компоненты,
+        а порядок расчета строится по графу компонент с предпочтением текущего листа,
+        чтобы минимизировать количество проходов по листам.
+        :param sheet_containers: контейнеры зависимостей формул листов
+        :param cells: изменившиеся ячейки в виде ['Лист1!A1']
+        """
+        containers: dict[str, SheetFormulaContainerCache] = {c.sheet_name: c for c in sheet_containers}
+        cells_dependencies: dict[str, list[str]] = {}
+        inversion_cells: dict[str, None] = {}
+        stack: list[str] = list(dict.fromkeys(cells))
+        visited: set[str] = set(stack)
+        while stack:
+            cell = stack.pop()
+            sheet_name, _, coordinate = cell.rpartition('!')
+            container = containers.get(sheet_name)
+            cells_dependencies[cell] = [
+                coord if '!' in coord else f'{sheet_name}!{coord}'
+                for coord in (container.dependency.get(coordinate, {}) if container is not None else {})
+            ]
+            for sheet_container in sheet_containers:
+                key = coordinate if sheet_container.sheet_name == sheet_name else cell
+                for coord in sheet_container.inversion.get(key, []):
+                    inversion = f'{sheet_container.sheet_name}!{coord}'
+                    inversion_cells[inversion] = None
+                    if inversion not in visited:
+                        visited.add(inversion)
+                        stack.append(inversion)
+        edges: dict[str, list[str]] = {
+            cell: [coord for coord in cells_dependencies[cell] if coord in inversion_cells] for cell in inversion_cells
+        }
+        components = cls._find_components(list(inversion_cells), edges)
+        order, sequence_evaluate = cls._sort_cells(components, edges)
+        return cls(
+            dependency_cells=list(dict.fromkeys(coord for deps in cells_dependencies.values() for coord in deps)),
+            inversion_cells=order,
+            sequence_evaluate=sequence_evaluate,
+            cycles=[
+                component for component in components
+                if len(component) > 1 or component[0] in edges[component[0]]
+            ],
+        )
+
+    @staticmethod
+    def _find_components(cells: list[str], edges: dict[str, list[str]]) -> list[list[str]]:
+        """Поиск компонент сильной связности алгоритмом Тарьяна.
+
+        Компоненты возвращаются в порядке, в котором зависимости предшествуют зависимым ячейкам.
+        """
+        indices: dict[str, int] = {}
+        low_links: dict[str, int] = {}
+        stack: list[str] = []
+        on_stack: set[str] = set()
+        components: list[list[str]] = []
+        for root in cells:
+            if root in indices:
+                continue
+            indices[root] = low_links[root] = len(indices)
+            stack.append(root)
+            on_stack.add(root)
+            work: list[tuple[str, Iterator[str]]] = [(root, iter(edges[root]))]
+            while work:
+                cell, children = work[-1]
+                for child in children:
+                    if child not in indices:
+                        indices[child] = low_links[child] = len(indices)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(edges[child])))
+                        break
+                    if child in on_stack:
+                        low_links[cell] = min(low_links[cell], indices[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low_links[parent] = min(low_links[parent], low_links[cell])
+                    if low_links[cell] == indices[cell]:
+                        component: list[str] = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == cell:
+                                break
+                        components.append(component)
+        return components
+
+    @staticmethod
+    def _sort_cells(components: list[list[str]], edges: dict[str, list[str]]) -> tuple[list[str], list[str]]:
+        """Топологическая сортировка ячеек и построение последовательности расчета листов.
+
+        Связи внутри одной компоненты не учитываются, поэтому ячейки цикла становятся доступными
+        для расчета одновременно.
+        """
+        cell_components: dict[str, int] = {cell: i for i, component in enumerate(components) for cell in component}
+        degrees: dict[str, int] = {}
+        dependents: dict[str, list[str]] = defaultdict(list)
+        ready: dict[str, deque[str]] = defaultdict(deque)
+        for component in components:
+            for cell in component:
+                dependencies = [coord for coord in edges[cell] if cell_components[coord] != cell_components[cell]]
+                for coord in dependencies:
+                    dependents[coord].append(cell)
+                degrees[cell] = len(dependencies)
+                if not dependencies:
+                    ready[cell.rpartition('!')[0]].append(cell)
+        order: list[str] = []
+        sequence_evaluate: list[str] = []
+        while True:
+            sheet_name = next((name for name, cells in ready.items() if cells), None)
+            if sheet_name is None:
+                break
+            sequence_evaluate.append(sheet_name)
+            cells = ready[sheet_name]
+            while cells:
+                cell = cells.popleft()
+                order.append(cell)
+                for dependent in dependents[cell]:
+                    degrees[dependent] -= 1
+                    if degrees[dependent] == 0:
+                        ready[dependent.rpartition('!')[0]].append(dependent)
+        return order, sequence_evaluate
 
 
 def get_dependency_cells(
@@ -29,33 +177,30 @@ def get_dependency_cells(
         - inversion - список связных ячеек, которые нужно пересчитать;
         - sheet_containers - последовательность расчета листов.
     """
-    dependency_cells: list[str] = []
-    inversion_cells: list[str] = []
-    sequence_evaluate: list[str] = []
+    plan = get_recalculation_plan(sheet_containers, vcs)
+    return plan.dependency_cells, plan.inversion_cells, plan.sequence_evaluate
+
 
+def get_recalculation_plan(
+    sheet_containers: list[SheetFormulaContainerCache],
+    vcs: Iterable[Value | Cell]
+) -> RecalculationPlan:
+    """Построение плана пересчета для значений или ячеек."""
     cells: list[str] = []
     for vc in vcs:
         sheet_name = vc.sheet.name if isinstance(vc, Value) else vc.column.sheet.name
         cells.append(f'{sheet_name}!{get_column_letter(vc.column.index)}{vc.row.index}')
-    while cells:
-        cell = cells.pop()
-        sheet_name, column_letter, row_index = parse_coordinate(cell)
-        sequence_evaluate.append(sheet_name)
-        sheet_container: SheetFormulaContainerCache
-        for sheet_container in sheet_containers:
-            coordinate: str = f'{column_letter}{row_index}' if sheet_name == sheet_container.sheet_name else cell
-            inversions: list[str] = [
-                normalize_coordinate(coord, sheet_container.sheet_name)
-                for coord in sheet_container.inversion.get(coordinate, [])
-            ]
-            dependency: list[str] = [
-                normalize_coordinate(coord, sheet_container.sheet_name)
-                for coord in sheet_container.dependency.get(coordinate, {}).keys()
-            ]
-            dependency_cells.extend(dependency)
-            inversion_cells.extend(inversions)
-            cells.extend(inversions)
-    return dependency_cells, inversion_cells, [el for el, _ in groupby(sequence_evaluate)]
+    return RecalculationPlan.build(sheet_containers, cells)
+
+
+# Пары (column_id, row_id) в виде таблицы для соединения со значениями в одном запросе
+RESOLVE_VALUES_SQL = f'''
+    SELECT cell_value.id FROM {Value._meta.db_table} cell_value
+    INNER JOIN unnest(%s::integer[], %s::integer[]) AS coordinates(column_id, row_id) ON
+        cell_value.column_id = coordinates.column_id AND
+        cell_value.row_id = coordinates.row_id
+    WHERE cell_value.document_id = %s
+'''
 
 
 def resolve_cells(
@@ -63,33 +208,48 @@ def resolve_cells(
     document: Document,
     cells: set[str]
 ) -> tuple[QuerySet[Cell], QuerySet[Value]]:
-    """Получаем строки в зависимости от координат."""
+    """Получаем строки в зависимости от координат.
+
+    Координаты разрешаются по кешируемым индексам ячеек листов,
+    а значения документа получаются одним запросом по парам колонок и строк.
+    """
+    resolved_cells = resolve_coordinates(sheets, cells)
+    return resolved_cells, resolve_values(document, resolved_cells)
+
+
+def resolve_coordinates(sheets: Iterable[Sheet], cells: Iterable[str]) -> QuerySet[Cell]:
+    """Получение ячеек строк верхнего уровня по координатам вида ['Лист1!A1'].
+
+    Индексы ячеек получаются только для листов, на которые ссылаются координаты.
+    """
     sheet_mapping: dict[str, int] = {sheet.name: sheet.pk for sheet in sheets}
-    sheet_cells: defaultdict[int, list[tuple[int, int]]] = defaultdict(list)
+    coordinates: list[tuple[int, str]] = []
     for cell in cells:
         sheet_name, column_letter, row = parse_coordinate(cell)
-        sheet_cells[sheet_mapping[sheet_name]].append((column_index_from_string(column_letter), row,))
-
-    cells_query_filter = Q()
-    values_query_filter = Q()
-    for sheet_id, coordinates in sheet_cells.items():
-        for column_index, row_index in coordinates:
-            cells_query_filter |= Q(
-                column__sheet_id=sheet_id,
-                column__index=column_index,
-                row__index=row_index,
-                row__parent__isnull=True
-            )
-            values_query_filter |= Q(
-                column__sheet_id=sheet_id,
-                document=document,
-                column__index=column_index,
-                row__index=row_index
-            )
-    related = ['row', 'column', 'column__sheet']
-    cells: QuerySet[Cell] = Cell.objects.filter(cells_query_filter).select_related(*related)
-    values: QuerySet[Value] = Value.objects.filter(values_query_filter).select_related(*related)
-    return cells, values
+        coordinates.append((sheet_mapping[sheet_name], f'{column_letter}{row}'))
+    indices = get_sheets_cell_indices({sheet_id for sheet_id, _ in coordinates})
+    cell_ids: list[int] = []
+    for sheet_id, coordinate in coordinates:
+        entry = indices[sheet_id].get(coordinate)
+        if entry is not None:
+            cell_ids.append(entry.cell_id)
+    if not cell_ids:
+        return Cell.objects.none()
+    return Cell.objects.filter(pk__in=cell_ids).select_related('row', 'column', 'column__sheet')
+
+
+def resolve_values(document: Document, cells: Iterable[Cell]) -> QuerySet[Value]:
+    """Получение значений документа для ячеек одним запросом по парам колонок и строк."""
+    column_ids: list[int] = []
+    row_ids: list[int] = []
+    for cell in cells:
+        column_ids.append(cell.column_id)
+        row_ids.append(cell.row_id)
+    if not column_ids:
+        return Value.objects.none()
+    return Value.objects.filter(
+        pk__in=RawSQL(RESOLVE_VALUES_SQL, (column_ids, row_ids, document.pk))
+    ).select_related('row', 'column', 'column__sheet')
 
 
 class ValueState(TypedDict):
@@ -116,22 +276,26 @@ def resolve_evaluate_state(
         - cells - массив ячеек для расчета;
         - values - массив уже существующих значений, для расчета новых значений ячейки;
         - inversion_cells - ячейки от которых зависит расчет.
+
+    Для числовых ячеек используется сохраненное числовое представление значения,
+    разбирается только значение по умолчанию ячеек без сохраненного значения.
     """
     state: dict[str, ValueState] = {}
-    values_state: dict[str, str] = {get_coordinate(v.column.sheet, v): v.value.strip() for v in values}
+    inversion = set(inversion_cells)
+    values_state: dict[str, Value] = {get_coordinate(v.column.sheet, v): v for v in values}
     cell: Cell
     for cell in cells:
         coord = get_coordinate(cell.column.sheet, cell)
-        value = values_state.get(coord, cell.default)
+        stored_value = values_state.get(coord)
+        value = stored_value.value.strip() if stored_value is not None else cell.default
         if cell.kind == KindCell.NUMERIC and value is not None:
-            try:
-                value = float(value)
-            except ValueError:
-                pass
+            number = stored_value.number if stored_value is not None else get_value_number(value)
+            if number is not None:
+                value = number
         state[coord]: ValueState = {
             'value': value,
             'error': None,
-            'formula': cell.formula if cell.formula and coord in inversion_cells else None,
+            'formula': cell.formula if cell.formula and coord in inversion else None,
             'cell': cell
         }
     return state
@@ -146,24 +310,26 @@ def evaluate_state(state: dict[str, ValueState], sequence_evaluate: list[str]):
         - Лист2!С4 -> Лист2!С4
       - все формулы не из текущего листа заменяем значениями
       - все формулы текущего листа рассчитываем и обновляем результаты
+
+    Формулы листа разбираются один раз и берутся из кеша скомпилированных моделей,
+    для каждого расчета в модель передаются только значения ячеек.
     """
     for sheet_name in sequence_evaluate:
-        input_state: dict[str, str | int | float] = {}
+        formulas: dict[str, str] = {}
+        values: dict[str, str | int | float] = {}
         cell_name: str
         cell_state: ValueState
         for cell_name, cell_state in state.items():
-            sn, column, row = parse_coordinate(cell_name)
-            if sn == sheet_name:
-                if cell_state['formula']:
-                    input_state[f'{column}{row}'] = cell_state['formula']
-                elif cell_state['value'] is not None:
-                    input_state[f'{column}{row}'] = cell_state['value']
+            formula = cell_state['formula'] if cell_name.rpartition('!')[0] == sheet_name else None
+            if is_formula(formula):
+                formulas[cell_name] = formula
+            elif formula:
+                values[cell_name] = formula
             elif cell_state['value'] is not None:
-                input_state[cell_name] = cell_state['value']
-        compiler: ModelCompiler = ModelCompiler()
-        model: Model = compiler.read_and_parse_dict(input_dict=input_state, default_sheet=sheet_name)
-        evaluator = Evaluator(model)
-        for coordinate in model.formulae:
+                values[cell_name] = cell_state['value']
+        compiled_model: CompiledFormulaModel = get_compiled_formula_model(sheet_name, formulas)
+        evaluator = Evaluator(compiled_model.build_model(values))
+        for coordinate in compiled_model.order:
             success, value = evaluate_formula(evaluator, coordinate)
             state[coordinate]['value'] = value if success else ''
             state[coordinate]['error'] = value if not success else None
@@ -194,6 +360,11 @@ def normalize_coordinate(coord: str, sheet_name: str | None = None) -> str:
     return f'{sheet_name}!{column}{row}'
 
 
+def is_formula(formula: str | None) -> bool:
+    """Является ли строка формулой."""
+    return formula is not None and formula.startswith('=')
+
+
 def evaluate_formula(evaluator: Evaluator, coordinate: str) -> tuple[bool, str]:
     """Вычисление формулы с возвратом возможной ошибки.
 
@@ -207,7 +378,7 @@ def evaluate_formula(evaluator: Evaluator, coordinate: str) -> tuple[bool, str]:
         return True, str(value)
     except RuntimeError as e:
         if 'Cycle detected' in str(e):
-            return False, 'Циклическая ссылка'
+            return False, CYCLE_ERROR
         raise e
 
 
@@ -1,12 +1,31 @@
-"""Модуль с кешем для расчета формул."""
+"""Модуль с кешем для расчета формул.
+
+Зависимости хранятся в кеше по узлам: отдельная запись для каждой координаты с формулой,
+индекс координат, разбитый на части по хешу координаты, и заголовок с полями структуры.
+При сохранении записываются только измененные узлы и части индекса, в которых добавились
+или удалились координаты. Инверсивная зависимость не хранится, а восстанавливается при получении из кеша.
+Узлы и части индекса кодируются в компактном формате модуля `formula_cache_codec`.
+"""
 from abc import ABC, abstractmethod
 from collections import Counter, defaultdict
+from dataclasses import fields
+from time import time_ns
+from typing import Any, Optional
+from zlib import crc32
 
+from django.core.cache import cache
 from xlsx_evaluate.functions.xl import flatten
 from xlsx_evaluate.parser import FormulaParser
+from xlsx_evaluate.tokenizer import f_token
 from xlsx_evaluate.utils import resolve_ranges
 
 from apps.dcis.helpers.cache import Cache
+from apps.dcis.helpers.formula_cache_codec import (
+    decode_coordinates,
+    decode_counter,
+    encode_coordinates,
+    encode_counter,
+)
 
 
 class FormulaDependencyCache(Cache, ABC):
@@ -18,6 +37,130 @@ class FormulaDependencyCache(Cache, ABC):
     dependency: dict[str, dict[str, int]]
     inversion: dict[str, list[str]]
 
+    # Время жизни узлов и индекса в секундах
+    TIMEOUT = 60 * 60 * 24
+    # Количество частей индекса координат
+    INDEX_SHARDS = 64
+
+    def __post_init__(self) -> None:
+        # Поколение узлов в кеше, None - узлы еще не сохранялись
+        self.generation: int | None = None
+        # Координаты, измененные после получения из кеша или последнего сохранения
+        self.changed_coordinates: set[str] = set()
+        # Координаты сохраненных в кеше частей индекса
+        self.index_shards: dict[int, set[str]] = defaultdict(set)
+
+    def node_key(self, coordinate: str, generation: int | None = None) -> str:
+        """Ключ узла зависимостей координаты."""
+        return f'{self.key}.{generation or self.generation}.{coordinate}'
+
+    def shard_key(self, shard: int, generation: int | None = None) -> str:
+        """Ключ части индекса координат."""
+        return f'{self.key}.{generation or self.generation}.index.{shard}'
+
+    @classmethod
+    def get_shard(cls, coordinate: str) -> int:
+        """Получение номера части индекса, в которой хранится координата."""
+        return crc32(coordinate.encode()) % cls.INDEX_SHARDS
+
+    def save(self) -> bool:
+        """Сохранение в кеш только измененных узлов и частей индекса.
+
+        Если узлы в кеше принадлежат другому поколению, структура сохраняется полностью.
+        Заголовок перезаписывается только при смене поколения или полей структуры.
+        """
+        header = cache.get(self.key)
+        structure_fields = self._get_fields()
+        if self.generation is None or not isinstance(header, dict) or header['generation'] != self.generation:
+            self.generation = time_ns()
+            self.index_shards = defaultdict(set)
+            for coordinate in self.dependency:
+                self.index_shards[self.get_shard(coordinate)].add(coordinate)
+            cache.set_many({
+                **{
+                    self.node_key(coordinate): encode_counter(counter)
+                    for coordinate, counter in self.dependency.items()
+                },
+                **{
+                    self.shard_key(shard): encode_coordinates(sorted(self.index_shards[shard]))
+                    for shard in range(self.INDEX_SHARDS)
+                },
+            }, timeout=self.TIMEOUT)
+        else:
+            changed_shards: set[int] = set()
+            for coordinate in self.changed_coordinates:
+                shard = self.get_shard(coordinate)
+                if coordinate in self.dependency and coordinate not in self.index_shards[shard]:
+                    self.index_shards[shard].add(coordinate)
+                    changed_shards.add(shard)
+                elif coordinate not in self.dependency and coordinate in self.index_shards[shard]:
+                    self.index_shards[shard].remove(coordinate)
+                    changed_shards.add(shard)
+            cache.set_many({
+                **{
+                    self.node_key(coordinate): encode_counter(self.dependency[coordinate])
+                    for coordinate in self.changed_coordinates if coordinate in self.dependency
+                },
+                **{
+                    self.shard_key(shard): encode_coordinates(sorted(self.index_shards[shard]))
+                    for shard in changed_shards
+                },
+            }, timeout=self.TIMEOUT)
+            cache.delete_many([
+                self.node_key(coordinate)
+                for coordinate in self.changed_coordinates if coordinate not in self.dependency
+            ])
+            if header['fields'] == structure_fields:
+                self.changed_coordinates.clear()
+                return True
+        self.changed_coordinates.clear()
+        return cache.set(self.key, {
+            'generation': self.generation,
+            'fields': structure_fields,
+            'shards': self.INDEX_SHARDS,
+        }, timeout=self.TIMEOUT)
+
+    @classmethod
+    def get(cls, object_id: int | str) -> Optional['FormulaDependencyCache']:
+        """Получение структуры из кеша.
+
+        Если часть узлов или индекса отсутствует в кеше или закодирована в другой версии формата,
+        структура считается отсутствующей.
+        """
+        header: dict[str, Any] | None = cache.get(cls.KEY_TEMPLATE % object_id)
+        if not isinstance(header, dict) or header.get('shards') != cls.INDEX_SHARDS:
+            return None
+        try:
+            dependency_cache = cls(**header['fields'])
+            generation = header['generation']
+            shard_keys = {dependency_cache.shard_key(shard, generation): shard for shard in range(cls.INDEX_SHARDS)}
+            shards = cache.get_many(shard_keys.keys())
+            if len(shards) != len(shard_keys):
+                return None
+            keys: dict[str, str] = {}
+            for shard_key, shard in shard_keys.items():
+                coordinates = decode_coordinates(shards[shard_key])
+                dependency_cache.index_shards[shard].update(coordinates)
+                keys.update({dependency_cache.node_key(c, generation): c for c in coordinates})
+            nodes = cache.get_many(keys.keys())
+            if len(nodes) != len(keys):
+                return None
+            dependency_cache.generation = generation
+            for key, coordinate in keys.items():
+                counter = decode_counter(nodes[key])
+                dependency_cache.dependency[coordinate] = counter
+                for coord in counter:
+                    dependency_cache.inversion[coord].append(coordinate)
+        except ValueError:
+            return None
+        return dependency_cache
+
+    def _get_fields(self) -> dict[str, Any]:
+        """Получение полей структуры, кроме зависимостей."""
+        return {
+            f.name: getattr(self, f.name) for f in fields(self) if f.name not in ('dependency', 'inversion')
+        }
+
 
 class FormulaContainerCache(ABC):
     """Контейнер для кеша зависимостей формул."""
@@ -43,21 +186,27 @@ class FormulaContainerCache(ABC):
         """Инверсивная зависимость."""
         return self.dependency_cache.inversion
 
-    def add_formula(self, coordinate: str, formula: str) -> 'FormulaContainerCache':
+    def add_formula(
+        self,
+        coordinate: str,
+        formula: str,
+        tokens: list[f_token] | None = None
+    ) -> 'FormulaContainerCache':
         """Добавление информации о формуле.
         :param coordinate: координата ячейки
         :param formula: формула
+        :param tokens: токены уже разобранной формулы, чтобы не разбирать ее повторно
         :return: текущий контейнер для кеша зависимостей формул
         """
-        dependency: list[str] = []
-        for dep in self.dependency_formula(formula):
-            added_dependency = self.transform_dependency(dep)
-            # Мы не должны ссылаться сами на себя.
-            if added_dependency != coordinate:
-                dependency.append(added_dependency)
+        # Ссылка на саму себя сохраняется, чтобы план пересчета определил ее как циклическую
+        dependency: list[str] = [
+            self.transform_dependency(dep)
+            for dep in (self.dependency_formula(formula) if tokens is None else self.dependency_tokens(tokens))
+        ]
         self.dependency_cache.dependency[coordinate] = Counter(dependency)
         for coord in set(dependency):
             self.dependency_cache.inversion[coord].append(coordinate)
+        self.dependency_cache.changed_coordinates.add(coordinate)
         return self
 
     def delete_formula(self, coordinate: str) -> 'FormulaContainerCache':
@@ -65,15 +214,14 @@ class FormulaContainerCache(ABC):
         :param coordinate: координата ячейки
         :return: текущий контейнер для кеша зависимостей формул
         """
-        self.dependency_cache.dependency = {
-            coord: counter for coord, counter in self.dependency_cache.dependency.items() if coord != coordinate
-        }
-        inversion: dict[str, list[str]] = defaultdict(list)
-        for ic, iv in self.dependency_cache.inversion.items():
-            inversion_clean = [value for value in iv if value != coordinate]
-            if inversion_clean:
-                inversion[ic] = inversion_clean
-        self.dependency_cache.inversion = inversion
+        counter = self.dependency_cache.dependency.pop(coordinate, None)
+        for coord in counter or {}:
+            coordinates = self.dependency_cache.inversion.get(coord)
+            if coordinates is not None and coordinate in coordinates:
+                coordinates.remove(coordinate)
+                if not coordinates:
+                    del self.dependency_cache.inversion[coord]
+        self.dependency_cache.changed_coordinates.add(coordinate)
         return self
 
     def change_formula(self, coordinate: str, formula: str) -> 'FormulaContainerCache':
@@ -84,9 +232,13 @@ class FormulaContainerCache(ABC):
         """
         return self.delete_formula(coordinate).add_formula(coordinate, formula)
 
-    @staticmethod
-    def dependency_formula(formula: str) -> list[str]:
+    @classmethod
+    def dependency_formula(cls, formula: str) -> list[str]:
         """Возвращает зависимость токенов."""
-        tokens = FormulaParser().tokenize(formula)
+        return cls.dependency_tokens(FormulaParser().tokenize(formula))
+
+    @staticmethod
+    def dependency_tokens(tokens: list[f_token]) -> list[str]:
+        """Возвращает зависимость разобранных токенов формулы."""
         range_tokens = [token for token in tokens if token.tsubtype == 'range']
         return flatten([flatten(resolve_ranges(token.tvalue, '')[1]) for token in range_tokens])
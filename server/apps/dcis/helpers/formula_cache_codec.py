@@ -0,0 +1,105 @@
+"""Модуль компактного кодирования зависимостей формул для хранения в кеше.
+
+Координата вида `Лист!A1` упаковывается в одно целое число:
+    - младшие 21 бит - номер строки;
+    - следующие 15 бит - номер колонки;
+    - старшие биты - номер названия листа в таблице строк (0 - координата текущего листа).
+Координаты, которые не удалось разобрать, сохраняются в таблице строк целиком, а в числе
+номер колонки равен 0. Числа хранятся в виде байтов массива, а количество ссылок
+хранится только тогда, когда хотя бы одна ссылка повторяется.
+
+Закодированные данные: (FORMAT_VERSION, таблица строк, упакованные координаты, количества ссылок).
+"""
+
+import re
+import sys
+from array import array
+from collections import Counter
+from typing import Sequence
+
+from openpyxl.utils.cell import column_index_from_string, get_column_letter
+
+# Версия формата, при изменении формата старые данные в кеше считаются отсутствующими
+FORMAT_VERSION = 1
+
+ROW_BITS = 21
+COLUMN_BITS = 15
+ROW_MASK = (1 << ROW_BITS) - 1
+COLUMN_MASK = (1 << COLUMN_BITS) - 1
+TABLE_SHIFT = ROW_BITS + COLUMN_BITS
+
+COORDINATE_PATTERN = re.compile(r'^(?:(?P<sheet>.+)!)?(?P<column>[A-Z]{1,3})(?P<row>[1-9]\d*)$')
+
+EncodedCoordinates = tuple[int, tuple[str, ...], bytes, bytes]
+
+
+def encode_coordinates(coordinates: Sequence[str], counts: Sequence[int] | None = None) -> EncodedCoordinates:
+    """Кодирование координат с количеством ссылок на них.
+
+    :param coordinates: координаты в виде ['A1', 'Лист2!B2']
+    :param counts: количества ссылок на координаты
+    :return: закодированные координаты
+    """
+    table: dict[str, int] = {}
+    packed = array('Q')
+    for coordinate in coordinates:
+        match = COORDINATE_PATTERN.match(coordinate)
+        column = column_index_from_string(match['column']) if match else 0
+        row = int(match['row']) if match else 0
+        if not match or column > COLUMN_MASK or row > ROW_MASK:
+            packed.append(table.setdefault(coordinate, len(table) + 1) << TABLE_SHIFT)
+            continue
+        table_index = table.setdefault(match['sheet'], len(table) + 1) if match['sheet'] is not None else 0
+        packed.append(table_index << TABLE_SHIFT | column << ROW_BITS | row)
+    packed_counts = array('I', counts if counts is not None and any(count != 1 for count in counts) else [])
+    return FORMAT_VERSION, tuple(table.keys()), _to_bytes(packed), _to_bytes(packed_counts)
+
+
+def decode_coordinates(encoded: EncodedCoordinates) -> list[str]:
+    """Декодирование координат.
+
+    :param encoded: закодированные координаты
+    :return: координаты в исходном порядке
+    :raises ValueError: если данные закодированы в другой версии формата
+    """
+    version, table, packed_bytes, _ = encoded
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Неподдерживаемая версия формата: {version}')
+    coordinates: list[str] = []
+    for value in _from_bytes('Q', packed_bytes):
+        table_index = value >> TABLE_SHIFT
+        column = value >> ROW_BITS & COLUMN_MASK
+        if column == 0:
+            coordinates.append(table[table_index - 1])
+            continue
+        coordinate = f'{get_column_letter(column)}{value & ROW_MASK}'
+        coordinates.append(f'{table[table_index - 1]}!{coordinate}' if table_index else coordinate)
+    return coordinates
+
+
+def encode_counter(counter: dict[str, int]) -> EncodedCoordinates:
+    """Кодирование частотной зависимости формулы."""
+    return encode_coordinates(list(counter.keys()), list(counter.values()))
+
+
+def decode_counter(encoded: EncodedCoordinates) -> Counter:
+    """Декодирование частотной зависимости формулы."""
+    coordinates = decode_coordinates(encoded)
+    counts = _from_bytes('I', encoded[3])
+    return Counter(dict(zip(coordinates, counts)) if counts else dict.fromkeys(coordinates, 1))
+
+
+def _to_bytes(values: array) -> bytes:
+    """Преобразование массива в байты с порядком little-endian."""
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    """Преобразование байтов с порядком little-endian в массив."""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
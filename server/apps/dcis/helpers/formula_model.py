@@ -0,0 +1,143 @@
+"""Модуль скомпилированных моделей формул листа.
+
+Разбор формул (токенизация и построение AST) занимает основное время при расчете.
+Набор формул листа меняется редко, а значения ячеек меняются постоянно,
+поэтому формулы разбираются один раз и хранятся в кеше процесса.
+Ключом кеша является сам набор формул, поэтому изменение любой формулы
+приводит к построению новой модели, а старая вытесняется из кеша.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from xlsx_evaluate import Model, ModelCompiler
+from xlsx_evaluate.xltypes import XLCell, XLFormula, XLRange
+
+# Максимальное количество скомпилированных моделей, хранимых в процессе
+COMPILED_FORMULA_MODELS_MAXSIZE = 256
+
+
+@dataclass
+class CompiledFormulaModel:
+    """Скомпилированная модель формул листа.
+
+        - sheet_name - название листа, None для модели нескольких листов
+        - formulae - разобранные формулы с построенными AST
+        - ranges - диапазоны, используемые в формулах
+        - range_cells - ячейки, входящие в диапазоны
+        - order - топологический порядок расчета формул
+    """
+    sheet_name: str | None
+    formulae: dict[str, XLFormula]
+    ranges: dict[str, XLRange]
+    range_cells: frozenset[str]
+    order: tuple[str, ...]
+
+    @classmethod
+    def compile(cls, sheet_name: str, formulas: dict[str, str]) -> 'CompiledFormulaModel':
+        """Компиляция модели по формулам листа.
+
+        :param sheet_name: название листа
+        :param formulas: формулы в виде {'Лист1!A1': '=B1 + C1'}
+        :return: скомпилированная модель
+        """
+        model: Model = ModelCompiler().read_and_parse_dict(input_dict=formulas, default_sheet=sheet_name)
+        return cls._from_model(sheet_name, model)
+
+    @classmethod
+    def compile_sheets(cls, sheets_formulas: dict[str, dict[str, str]]) -> 'CompiledFormulaModel':
+        """Компиляция единой модели формул нескольких листов.
+
+        Ссылки без названия листа относятся к листу, на котором находится формула,
+        поэтому межлистовые зависимости рассчитываются в одной модели в общем порядке.
+        :param sheets_formulas: формулы листов в виде {'Лист1': {'Лист1!A1': '=B1 + Лист2!C1'}}
+        :return: скомпилированная модель
+        """
+        compiler = ModelCompiler()
+        for sheet_name, formulas in sheets_formulas.items():
+            for address, formula in formulas.items():
+                cell = XLCell(address, None, formula=XLFormula(formula, sheet_name=sheet_name))
+                compiler.model.cells[address] = cell
+                compiler.model.formulae[address] = cell.formula
+        compiler.build_ranges()
+        compiler.model.build_code()
+        return cls._from_model(None, compiler.model)
+
+    @classmethod
+    def _from_model(cls, sheet_name: str | None, model: Model) -> 'CompiledFormulaModel':
+        """Построение скомпилированной модели по модели с разобранными формулами."""
+        return cls(
+            sheet_name=sheet_name,
+            formulae=model.formulae,
+            ranges=model.ranges,
+            range_cells=frozenset(address for address in model.cells if address not in model.formulae),
+            order=cls._sort_formulae(model.formulae),
+        )
+
+    def build_model(self, values: dict[str, Any]) -> Model:
+        """Построение модели для расчета по значениям ячеек.
+
+        Формулы и диапазоны переиспользуются, создаются только ячейки со значениями.
+        :param values: значения ячеек в виде {'Лист1!B1': 1.0}
+        :return: модель для передачи в `Evaluator`
+        """
+        model = Model()
+        model.ranges = self.ranges
+        model.formulae = dict(self.formulae)
+        for address in self.range_cells:
+            model.cells[address] = XLCell(address, '')
+        for address, value in values.items():
+            if address not in self.formulae:
+                model.cells[address] = XLCell(address, value)
+        for address, formula in self.formulae.items():
+            model.cells[address] = XLCell(address, None, formula=formula)
+        return model
+
+    @staticmethod
+    def _sort_formulae(formulae: dict[str, XLFormula]) -> tuple[str, ...]:
+        """Топологическая сортировка формул.
+
+        Формулы, входящие в циклы, добавляются в конец в исходном порядке,
+        ошибка циклической ссылки определяется при их расчете.
+        """
+        dependencies: dict[str, set[str]] = {
+            address: {cell for cell in formula.associated_cells if cell in formulae and cell != address}
+            for address, formula in formulae.items()
+        }
+        dependents: dict[str, list[str]] = {address: [] for address in formulae}
+        for address, cells in dependencies.items():
+            for cell in cells:
+                dependents[cell].append(address)
+        degrees: dict[str, int] = {address: len(cells) for address, cells in dependencies.items()}
+        order: list[str] = [address for address, degree in degrees.items() if degree == 0]
+        for address in order:
+            for dependent in dependents[address]:
+                degrees[dependent] -= 1
+                if degrees[dependent] == 0:
+                    order.append(dependent)
+        if len(order) != len(formulae):
+            ordered = set(order)
+            order.extend(address for address in formulae if address not in ordered)
+        return tuple(order)
+
+
+@lru_cache(maxsize=COMPILED_FORMULA_MODELS_MAXSIZE)
+def _compile_formula_model(sheet_name: str, formulas: frozenset[tuple[str, str]]) -> CompiledFormulaModel:
+    """Компиляция модели с сохранением в кеш процесса."""
+    return CompiledFormulaModel.compile(sheet_name, dict(sorted(formulas)))
+
+
+def get_compiled_formula_model(sheet_name: str, formulas: dict[str, str]) -> CompiledFormulaModel:
+    """Получение скомпилированной модели формул листа из кеша или ее построение.
+
+    :param sheet_name: название листа
+    :param formulas: формулы в виде {'Лист1!A1': '=B1 + C1'}
+    :return: скомпилированная модель
+    """
+    return _compile_formula_model(sheet_name, frozenset(formulas.items()))
+
+
+def clear_compiled_formula_models() -> None:
+    """Очистка кеша скомпилированных моделей."""
+    _compile_formula_model.cache_clear()
@@ -0,0 +1,89 @@
+"""Модуль хранения хода пересчета значений документов периода.
+
+Пересчет периода разбивается на части по документам, которые выполняются задачами Celery параллельно.
+Ход пересчета хранится в кеше: состояние изменяется при запуске и завершении пересчета,
+а количество обработанных документов увеличивается каждой частью атомарно.
+
+Каждый запуск пересчета получает идентификатор, которым помечаются его части,
+поэтому части предыдущего запуска не изменяют ход нового пересчета того же периода.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.utils.timezone import now
+
+RECALCULATION_STATE_KEY_TEMPLATE = 'cache.period.recalculation.state.%s'
+RECALCULATION_PROCESSED_KEY_TEMPLATE = 'cache.period.recalculation.processed.%s.%s'
+
+# Время жизни хода пересчета в секундах
+RECALCULATION_PROGRESS_TIMEOUT = 60 * 60 * 24
+
+STATUS_RUNNING = 'running'
+STATUS_FINISHED = 'finished'
+STATUS_FAILED = 'failed'
+
+
+@dataclass
+class RecalculationProgress:
+    """Ход пересчета значений документов периода.
+
+        - status - состояние пересчета;
+        - total - количество документов для пересчета;
+        - processed - количество обработанных документов;
+        - started_at - время начала пересчета;
+        - finished_at - время завершения пересчета.
+    """
+    status: str
+    total: int
+    processed: int
+    started_at: datetime
+    finished_at: datetime | None = None
+
+
+def start_recalculation_progress(period_id: int | str, total: int) -> str:
+    """Начало пересчета значений документов периода.
+
+    :return: идентификатор запуска пересчета
+    """
+    run_id = uuid4().hex
+    cache.set_many({
+        RECALCULATION_STATE_KEY_TEMPLATE % period_id: {
+            'run_id': run_id,
+            'status': STATUS_RUNNING,
+            'total': total,
+            'started_at': now(),
+            'finished_at': None,
+        },
+        RECALCULATION_PROCESSED_KEY_TEMPLATE % (period_id, run_id): 0,
+    }, timeout=RECALCULATION_PROGRESS_TIMEOUT)
+    return run_id
+
+
+def add_recalculation_progress(period_id: int | str, run_id: str, processed: int = 1) -> None:
+    """Увеличение количества обработанных документов периода в запуске пересчета."""
+    try:
+        cache.incr(RECALCULATION_PROCESSED_KEY_TEMPLATE % (period_id, run_id), processed)
+    except ValueError:
+        pass
+
+
+def finish_recalculation_progress(period_id: int | str, run_id: str, status: str = STATUS_FINISHED) -> None:
+    """Завершение пересчета значений документов периода, если запуск пересчета не был заменен новым."""
+    key = RECALCULATION_STATE_KEY_TEMPLATE % period_id
+    state = cache.get(key)
+    if state is None or state['run_id'] != run_id:
+        return
+    cache.set(key, {**state, 'status': status, 'finished_at': now()}, timeout=RECALCULATION_PROGRESS_TIMEOUT)
+
+
+def get_recalculation_progress(period_id: int | str) -> RecalculationProgress | None:
+    """Получение хода последнего запуска пересчета значений документов периода."""
+    state = cache.get(RECALCULATION_STATE_KEY_TEMPLATE % period_id)
+    if state is None:
+        return None
+    state = state.copy()
+    processed = cache.get(RECALCULATION_PROCESSED_KEY_TEMPLATE % (period_id, state.pop('run_id')), 0)
+    return RecalculationProgress(processed=processed, **state)
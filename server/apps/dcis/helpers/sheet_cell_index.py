@@ -0,0 +1,74 @@
+"""Модуль индекса ячеек листа по координатам.
+
+Для расчета формул, агрегаций и загрузки данных координаты вида `A1` необходимо
+преобразовывать в ячейки строк верхнего уровня. Индекс листа строится одним запросом
+и хранится в кеше, а ключ кеша включает версию структуры листа, поэтому индекс
+становится недостижимым при изменении строк верхнего уровня и ячеек листа.
+"""
+
+from typing import Iterable, NamedTuple
+
+from django.core.cache import cache
+from openpyxl.utils.cell import get_column_letter
+
+from apps.dcis.helpers.sheet_unload_cache import SHEET_ROWS_TIMEOUT, SHEET_VERSION_KEY_TEMPLATE, get_version
+from apps.dcis.models import Cell
+
+SHEET_CELL_INDEX_KEY_TEMPLATE = 'cache.sheet.cells.%s.%s'
+
+
+class CellIndexEntry(NamedTuple):
+    """Ячейка листа в индексе."""
+    cell_id: int
+    row_id: int
+    column_id: int
+    kind: str
+    default: str | None
+    formula: str | None
+    editable: bool
+
+
+SheetCellIndex = dict[str, CellIndexEntry]
+
+
+def get_sheet_cell_index_key(sheet_id: int | str) -> str:
+    """Получение ключа индекса ячеек листа."""
+    return SHEET_CELL_INDEX_KEY_TEMPLATE % (sheet_id, get_version(SHEET_VERSION_KEY_TEMPLATE % sheet_id))
+
+
+def build_sheet_cell_index(sheet_id: int | str) -> SheetCellIndex:
+    """Построение индекса ячеек листа."""
+    return {
+        f'{get_column_letter(column_index)}{row_index}': CellIndexEntry(*entry)
+        for *entry, column_index, row_index in Cell.objects.filter(
+            row__sheet_id=sheet_id,
+            row__parent__isnull=True,
+        ).values_list(
+            'id', 'row_id', 'column_id', 'kind', 'default', 'formula', 'editable', 'column__index', 'row__index'
+        )
+    }
+
+
+def get_sheet_cell_index(sheet_id: int | str) -> SheetCellIndex:
+    """Получение индекса ячеек листа из кеша или построение нового."""
+    return get_sheets_cell_indices([sheet_id])[sheet_id]
+
+
+def get_sheets_cell_indices(sheet_ids: Iterable[int | str]) -> dict[int | str, SheetCellIndex]:
+    """Получение индексов ячеек листов.
+
+    Индексы, которые есть в кеше, получаются одним обращением к кешу,
+    остальные строятся и сохраняются в кеш.
+    """
+    keys: dict[int | str, str] = {sheet_id: get_sheet_cell_index_key(sheet_id) for sheet_id in sheet_ids}
+    cached: dict[str, SheetCellIndex] = cache.get_many(keys.values())
+    indices: dict[int | str, SheetCellIndex] = {}
+    missing: dict[str, SheetCellIndex] = {}
+    for sheet_id, key in keys.items():
+        if key in cached:
+            indices[sheet_id] = cached[key]
+        else:
+            indices[sheet_id] = missing[key] = build_sheet_cell_index(sheet_id)
+    if missing:
+        cache.set_many(missing, timeout=SHEET_ROWS_TIMEOUT)
+    return indices
@@ -26,11 +26,12 @@
 
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import ClassVar, Optional
+from typing import ClassVar, Iterable, Optional
 
 from openpyxl.utils.cell import get_column_letter
 
 from apps.dcis.helpers.formula_cache import FormulaContainerCache, FormulaDependencyCache
+from apps.dcis.helpers.sheet_cell_index import get_sheet_cell_index
 from apps.dcis.models import Cell, Sheet
 
 
@@ -115,6 +116,21 @@ class SheetFormulaContainerCache(FormulaContainerCache):
         container.delete()
         return cls.build_cache(sheet)
 
+    @classmethod
+    def update_formulas(cls, sheet: Sheet, cells: Iterable[Cell]) -> Optional['SheetFormulaContainerCache']:
+        """Обновление формул ячеек и названия листа в контейнере, если он есть в кеше.
+
+        В отличие от `update` изменяются только переданные ячейки.
+        """
+        container = cls.from_cache(sheet.pk)
+        if container is None:
+            return container
+        container.sheet_name = sheet.name
+        for cell in cells:
+            container.change_formula(f'{get_column_letter(cell.column.index)}{cell.row.index}', cell.formula)
+        container.save()
+        return container
+
     @classmethod
     def from_cache(cls, sheet_id: int) -> Optional['SheetFormulaContainerCache']:
         """Получение контейнера из кеша."""
@@ -128,14 +144,9 @@ class SheetFormulaContainerCache(FormulaContainerCache):
     @classmethod
     def build_cache(cls, sheet: Sheet) -> 'SheetFormulaContainerCache':
         """Построение нового контейнера."""
-        cells = Cell.objects.filter(
-            formula__isnull=False,
-            formula__istartswith='=',
-            row__parent__isnull=True,
-            row__sheet=sheet,
-        ).select_related('row', 'column').all()
         container = cls(sheet.name)
-        for cell in cells:
-            container.add_formula(f'{get_column_letter(cell.column.index)}{cell.row.index}', cell.formula)
+        for coordinate, entry in get_sheet_cell_index(sheet.pk).items():
+            if entry.formula is not None and entry.formula.startswith('='):
+                container.add_formula(coordinate, entry.formula)
         container.save(sheet.pk)
         return container
@@ -0,0 +1,93 @@
+"""Модуль кеша выгруженной структуры листов.
+
+Выгрузка строк, ячеек и объединений листа занимает много времени, а меняется структура редко.
+Выгруженная структура хранится в кеше без значений документа и разрешений пользователя,
+которые применяются при каждом запросе отдельно.
+
+Ключ кеша включает версии листа и документа:
+    - версия листа увеличивается при изменении строк верхнего уровня, ячеек и объединений;
+    - версия документа увеличивается при изменении дочерних строк документа.
+Значения документа в кешированную структуру не входят, поэтому их изменение версию не увеличивает.
+Старые записи не удаляются, а становятся недостижимыми и вытесняются по истечении времени жизни.
+"""
+
+from time import time_ns
+from typing import Iterable
+
+from django.core.cache import cache
+
+from apps.dcis.models import Cell, RowDimension
+
+SHEET_VERSION_KEY_TEMPLATE = 'cache.sheet.version.%s'
+DOCUMENT_VERSION_KEY_TEMPLATE = 'cache.document.version.%s'
+SHEET_ROWS_KEY_TEMPLATE = 'cache.sheet.rows.%s.%s.%s.%s'
+
+# Время жизни выгруженной структуры листа в секундах
+SHEET_ROWS_TIMEOUT = 60 * 60 * 24
+
+
+def get_version(key: str) -> int:
+    """Получение версии по ключу.
+
+    Начальная версия берется из текущего времени, чтобы после вытеснения ключа
+    версия не совпала с версией уже сохраненных записей.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    """Увеличение версии по ключу."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time_ns(), timeout=None)
+
+
+def bump_sheet_version(sheet_id: int | str) -> None:
+    """Увеличение версии структуры листа."""
+    bump_version(SHEET_VERSION_KEY_TEMPLATE % sheet_id)
+
+
+def bump_sheets_versions(sheet_ids: Iterable[int | str]) -> None:
+    """Увеличение версий структуры листов."""
+    for sheet_id in set(sheet_ids):
+        bump_sheet_version(sheet_id)
+
+
+def bump_document_version(document_id: int | str) -> None:
+    """Увеличение версии документа."""
+    bump_version(DOCUMENT_VERSION_KEY_TEMPLATE % document_id)
+
+
+def bump_row_dimension_version(row_dimension: RowDimension) -> None:
+    """Увеличение версии листа или документа, к которому относится строка."""
+    if row_dimension.parent_id is not None and row_dimension.document_id is not None:
+        bump_document_version(row_dimension.document_id)
+    else:
+        bump_sheet_version(row_dimension.sheet_id)
+
+
+def bump_cells_sheets_versions(cell_ids: Iterable[int]) -> None:
+    """Увеличение версий структуры листов, к которым относятся ячейки."""
+    bump_sheets_versions(Cell.objects.filter(pk__in=cell_ids).values_list('row__sheet_id', flat=True).distinct())
+
+
+def get_sheet_rows_key(sheet_id: int | str, document_id: int | str | None = None) -> str:
+    """Получение ключа выгруженной структуры листа для документа."""
+    sheet_version = get_version(SHEET_VERSION_KEY_TEMPLATE % sheet_id)
+    document_version = get_version(DOCUMENT_VERSION_KEY_TEMPLATE % document_id) if document_id is not None else 0
+    return SHEET_ROWS_KEY_TEMPLATE % (sheet_id, document_id, sheet_version, document_version)
+
+
+def get_sheet_rows(key: str) -> list[dict] | None:
+    """Получение выгруженной структуры листа из кеша."""
+    return cache.get(key)
+
+
+def set_sheet_rows(key: str, rows: list[dict]) -> bool:
+    """Сохранение выгруженной структуры листа в кеш."""
+    return cache.set(key, rows, timeout=SHEET_ROWS_TIMEOUT)
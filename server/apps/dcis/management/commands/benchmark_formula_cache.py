@@ -0,0 +1,61 @@
+"""Модуль с командой сравнения форматов хранения зависимостей формул."""
+import pickle
+from collections import Counter, defaultdict
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+from jsonpickle import decode, encode
+from openpyxl.utils.cell import get_column_letter
+
+from apps.dcis.helpers.formula_cache_codec import (
+    decode_coordinates,
+    decode_counter,
+    encode_coordinates,
+    encode_counter,
+)
+
+
+class Command(BaseCommand):
+    """Команда."""
+
+    help = 'Сравнение размера и времени декодирования зависимостей формул в формате jsonpickle и компактном формате.'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--rows', type=int, default=1000, help='Количество строк с формулами')
+        parser.add_argument('--columns', type=int, default=20, help='Количество колонок с формулами')
+        parser.add_argument('--number', type=int, default=5, help='Количество повторов декодирования')
+
+    def handle(self, *args, **options) -> None:
+        dependency = self._build_dependency(options['rows'], options['columns'])
+        inversion: dict[str, list[str]] = defaultdict(list)
+        for coordinate, counter in dependency.items():
+            for coord in counter:
+                inversion[coord].append(coordinate)
+
+        jsonpickle_data = encode({'dependency': dependency, 'inversion': inversion})
+        compact_index = pickle.dumps(encode_coordinates(list(dependency.keys())))
+        compact_nodes = [pickle.dumps(encode_counter(counter)) for counter in dependency.values()]
+
+        def decode_compact() -> None:
+            for _, node in zip(decode_coordinates(pickle.loads(compact_index)), compact_nodes):
+                decode_counter(pickle.loads(node))
+
+        number = options['number']
+        jsonpickle_time = timeit(lambda: decode(jsonpickle_data), number=number) / number
+        compact_time = timeit(decode_compact, number=number) / number
+        compact_size = len(compact_index) + sum(len(node) for node in compact_nodes)
+        self.stdout.write(f'Формул: {len(dependency)}')
+        self.stdout.write(f'jsonpickle: {len(jsonpickle_data.encode())} байт, {jsonpickle_time * 1000:.1f} мс')
+        self.stdout.write(f'Компактный формат: {compact_size} байт, {compact_time * 1000:.1f} мс')
+
+    @staticmethod
+    def _build_dependency(rows: int, columns: int) -> dict[str, Counter]:
+        """Построение зависимостей листа: сумма строки слева и ссылка на другой лист."""
+        dependency: dict[str, Counter] = {}
+        for row in range(1, rows + 1):
+            for column in range(2, columns + 2):
+                dependency[f'{get_column_letter(column)}{row}'] = Counter([
+                    *(f'{get_column_letter(c)}{row}' for c in range(1, column)),
+                    f'Форма2!{get_column_letter(column)}{row}',
+                ])
+        return dependency
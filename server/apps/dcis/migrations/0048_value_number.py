@@ -0,0 +1,47 @@
+# Generated by Django 3.2.18 on 2026-10-18 10:12
+
+from math import isfinite
+
+from django.db import migrations, models
+
+# Количество значений, обновляемых одним запросом
+BATCH_SIZE = 1000
+
+
+def get_value_number(value):
+    """Числовое представление значения ячейки или None, если значение не является конечным числом."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if isfinite(number) else None
+
+
+def fill_value_number(apps, schema_editor):
+    """Заполнение числового представления существующих значений."""
+    Value = apps.get_model('dcis', 'Value')
+    values = []
+    for value in Value.objects.only('id', 'value').iterator(chunk_size=BATCH_SIZE):
+        value.number = get_value_number(value.value)
+        if value.number is not None:
+            values.append(value)
+        if len(values) == BATCH_SIZE:
+            Value.objects.bulk_update(values, ('number',))
+            values = []
+    Value.objects.bulk_update(values, ('number',))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dcis', '0047_delete_formula_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='value',
+            name='number',
+            field=models.FloatField(help_text='Числовое представление значения', null=True),
+        ),
+        migrations.RunPython(fill_value_number, migrations.RunPython.noop),
+    ]
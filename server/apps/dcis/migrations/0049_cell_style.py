@@ -0,0 +1,151 @@
+# Generated by Django 3.2.18 on 2026-10-18 12:40
+
+import json
+from hashlib import sha256
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import apps.dcis.models.sheet
+
+# Количество ячеек, обновляемых одним запросом
+BATCH_SIZE = 1000
+
+# Свойства стиля, которые переносятся из ячеек в общую таблицу стилей
+CELL_STYLE_FIELDS = (
+    'horizontal_align', 'vertical_align', 'size',
+    'strong', 'italic', 'strike',
+    'underline', 'color', 'background',
+    'border_style', 'border_color',
+)
+
+
+def get_cell_style_key(style):
+    """Хеш набора свойств стиля ячейки."""
+    return sha256(json.dumps(
+        {field: style[field] for field in CELL_STYLE_FIELDS},
+        sort_keys=True,
+        ensure_ascii=False,
+    ).encode()).hexdigest()
+
+
+def fill_cell_style(apps, schema_editor):
+    """Перенос стилей существующих ячеек в общую таблицу стилей."""
+    Cell = apps.get_model('dcis', 'Cell')
+    CellStyle = apps.get_model('dcis', 'CellStyle')
+    styles: dict[str, int] = {}
+    cells = []
+    for cell in Cell.objects.only('id', *CELL_STYLE_FIELDS).iterator(chunk_size=BATCH_SIZE):
+        style = {field: getattr(cell, field) for field in CELL_STYLE_FIELDS}
+        key = get_cell_style_key(style)
+        if key not in styles:
+            styles[key] = CellStyle.objects.create(key=key, **style).id
+        cell.style_id = styles[key]
+        cells.append(cell)
+        if len(cells) == BATCH_SIZE:
+            Cell.objects.bulk_update(cells, ('style',))
+            cells = []
+    Cell.objects.bulk_update(cells, ('style',))
+
+
+def restore_cell_style(apps, schema_editor):
+    """Перенос свойств общих стилей обратно в ячейки."""
+    Cell = apps.get_model('dcis', 'Cell')
+    CellStyle = apps.get_model('dcis', 'CellStyle')
+    styles = {style.id: style for style in CellStyle.objects.all()}
+    cells = []
+    for cell in Cell.objects.only('id', 'style_id').iterator(chunk_size=BATCH_SIZE):
+        style = styles[cell.style_id]
+        for field in CELL_STYLE_FIELDS:
+            setattr(cell, field, getattr(style, field))
+        cells.append(cell)
+        if len(cells) == BATCH_SIZE:
+            Cell.objects.bulk_update(cells, CELL_STYLE_FIELDS)
+            cells = []
+    Cell.objects.bulk_update(cells, CELL_STYLE_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dcis', '0048_value_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CellStyle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizontal_align', models.CharField(choices=[('left', 'left'), ('center', 'center'), ('right', 'right')], default=None, help_text='Горизонтальное выравнивание', max_length=10, null=True)),
+                ('vertical_align', models.CharField(choices=[('top', 'top'), ('middle', 'middle'), ('bottom', 'bottom')], default=None, help_text='Вертикальное выравнивание', max_length=10, null=True)),
+                ('size', models.PositiveIntegerField(default=12, help_text='Размер шрифта')),
+                ('strong', models.BooleanField(default=False, help_text='Жирный шрифт')),
+                ('italic', models.BooleanField(default=False, help_text='Курсив')),
+                ('strike', models.BooleanField(default=False, help_text='Зачеркнутый')),
+                ('underline', models.CharField(choices=[('single', 'single'), ('double', 'double'), ('single_accounting', 'single_accounting'), ('double_accounting', 'double_accounting')], default=None, help_text='Тип подчеркивания', max_length=20, null=True)),
+                ('color', models.CharField(default='#000000', help_text='Цвет текста', max_length=16)),
+                ('background', models.CharField(default='#FFFFFF', help_text='Цвет фона', max_length=16)),
+                ('border_style', models.JSONField(default=apps.dcis.models.sheet.get_default_border, help_text='Стили границ')),
+                ('border_color', models.JSONField(default=apps.dcis.models.sheet.get_default_border, help_text='Цвет границ')),
+                ('key', models.CharField(help_text='Хеш свойств стиля', max_length=64, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='cell',
+            name='style',
+            field=models.ForeignKey(help_text='Стиль', null=True, on_delete=django.db.models.deletion.PROTECT, to='dcis.cellstyle'),
+        ),
+        migrations.RunPython(fill_cell_style, restore_cell_style),
+        migrations.AlterField(
+            model_name='cell',
+            name='style',
+            field=models.ForeignKey(help_text='Стиль', on_delete=django.db.models.deletion.PROTECT, to='dcis.cellstyle'),
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='background',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='border_color',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='border_style',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='color',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='horizontal_align',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='italic',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='size',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='strike',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='strong',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='underline',
+        ),
+        migrations.RemoveField(
+            model_name='cell',
+            name='vertical_align',
+        ),
+    ]
@@ -4,4 +4,4 @@ from .messages import DocumentMessage
 from .methodical_support import PeriodMethodicalSupport
 from .privilege import PeriodGroup, PeriodPrivilege, Privilege
 from .project import Division, Period, Project
-from .sheet import Cell, ColumnDimension, MergedCell, RelationshipCells, RowDimension, Value
+from .sheet import Cell, CellStyle, ColumnDimension, MergedCell, RelationshipCells, RowDimension, Value
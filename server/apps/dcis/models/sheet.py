@@ -1,3 +1,8 @@
+import json
+from hashlib import sha256
+from math import isfinite
+from typing import Any
+
 from django.db import models
 from model_clone import CloneMixin
 from openpyxl.utils.cell import get_column_letter
@@ -17,6 +22,15 @@ def get_default_border():
     }
 
 
+def get_value_number(value: str | None) -> float | None:
+    """Числовое представление значения ячейки или None, если значение не является конечным числом."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if isfinite(number) else None
+
+
 class Style(models.Model):
     """Абстрактная модель применяемых стилей для страниц сборов."""
 
@@ -86,6 +100,86 @@ class Style(models.Model):
         abstract = True
 
 
+# Свойства стиля, которые ячейки хранят в общей таблице стилей
+CELL_STYLE_FIELDS = (
+    'horizontal_align', 'vertical_align', 'size',
+    'strong', 'italic', 'strike',
+    'underline', 'color', 'background',
+    'border_style', 'border_color',
+)
+
+
+def get_cell_style_key(style: dict[str, Any]) -> str:
+    """Хеш набора свойств стиля ячейки."""
+    return sha256(json.dumps(
+        {field: style[field] for field in CELL_STYLE_FIELDS},
+        sort_keys=True,
+        ensure_ascii=False,
+    ).encode()).hexdigest()
+
+
+class CellStyle(Style):
+    """Модель общего стиля ячеек.
+
+    Одинаковые наборы свойств хранятся в одной записи, которую находят по хешу свойств.
+    """
+
+    key = models.CharField(max_length=64, unique=True, help_text='Хеш свойств стиля')
+
+    @classmethod
+    def get_default_style(cls) -> dict[str, Any]:
+        """Свойства стиля по умолчанию."""
+        return {field: cls._meta.get_field(field).get_default() for field in CELL_STYLE_FIELDS}
+
+    @classmethod
+    def get_or_create_style(
+        cls,
+        style: dict[str, Any],
+        styles: dict[str, 'CellStyle'] | None = None
+    ) -> 'CellStyle':
+        """Получение или создание общего стиля по набору свойств.
+
+        - style - свойства стиля, недостающие свойства берутся по умолчанию
+        - styles - кеш найденных стилей по хешу для повторных вызовов
+        """
+        style = {
+            field: cls._meta.get_field(field).to_python(value)
+            for field, value in {**cls.get_default_style(), **style}.items()
+            if field in CELL_STYLE_FIELDS
+        }
+        key = get_cell_style_key(style)
+        if styles is not None and key in styles:
+            return styles[key]
+        cell_style, _ = cls.objects.get_or_create(key=key, defaults=style)
+        if styles is not None:
+            styles[key] = cell_style
+        return cell_style
+
+    def to_dict(self) -> dict[str, Any]:
+        """Свойства стиля в виде словаря."""
+        return {field: getattr(self, field) for field in CELL_STYLE_FIELDS}
+
+
+def cell_style_property(field: str) -> property:
+    """Свойство ячейки, читающее и изменяющее поле ее общего стиля.
+
+    Изменения накапливаются в ячейке и превращаются в ссылку на общий стиль при сохранении.
+    """
+
+    def getter(cell: 'Cell') -> Any:
+        style_changes = cell.__dict__.get('_style_changes', {})
+        if field in style_changes:
+            return style_changes[field]
+        if cell.style_id is None:
+            return CellStyle._meta.get_field(field).get_default()
+        return getattr(cell.style, field)
+
+    def setter(cell: 'Cell', value: Any) -> None:
+        cell.__dict__.setdefault('_style_changes', {})[field] = value
+
+    return property(getter, setter, doc=CellStyle._meta.get_field(field).help_text)
+
+
 class KindCell(models.Model):
     """Классификация ячеек."""
 
@@ -230,8 +324,12 @@ class RowDimension(models.Model, CloneMixin):
         ordering = ('index', 'id',)
 
 
-class Cell(Style, KindCell, models.Model, CloneMixin):
-    """Модель ячейки."""
+class Cell(KindCell, models.Model, CloneMixin):
+    """Модель ячейки.
+
+    Стиль ячейки хранится в общей таблице `CellStyle`,
+    а его свойства доступны как атрибуты ячейки.
+    """
 
     AGGREGATION_SUM = 'sum'
     AGGREGATION_AVG = 'avg'
@@ -266,6 +364,19 @@ class Cell(Style, KindCell, models.Model, CloneMixin):
 
     column = models.ForeignKey(ColumnDimension, on_delete=models.CASCADE, help_text='Колонка')
     row = models.ForeignKey(RowDimension, on_delete=models.CASCADE, help_text='Строка')
+    style = models.ForeignKey(CellStyle, on_delete=models.PROTECT, help_text='Стиль')
+
+    horizontal_align = cell_style_property('horizontal_align')
+    vertical_align = cell_style_property('vertical_align')
+    size = cell_style_property('size')
+    strong = cell_style_property('strong')
+    italic = cell_style_property('italic')
+    strike = cell_style_property('strike')
+    underline = cell_style_property('underline')
+    color = cell_style_property('color')
+    background = cell_style_property('background')
+    border_style = cell_style_property('border_style')
+    border_color = cell_style_property('border_color')
 
     cells = models.ManyToManyField(
         'self',
@@ -285,6 +396,30 @@ class Cell(Style, KindCell, models.Model, CloneMixin):
         """Является ли ячейка агрегационной."""
         return self.aggregation is not None
 
+    def get_style(self) -> dict[str, Any]:
+        """Текущие свойства стиля ячейки с учетом несохраненных изменений."""
+        style = self.style.to_dict() if self.style_id is not None else CellStyle.get_default_style()
+        return {**style, **self.__dict__.get('_style_changes', {})}
+
+    def set_style(self, style: dict[str, Any], styles: dict[str, CellStyle] | None = None) -> None:
+        """Изменение свойств стиля ячейки с переходом на соответствующий общий стиль."""
+        self.style = CellStyle.get_or_create_style({**self.get_style(), **style}, styles)
+        self.__dict__.pop('_style_changes', None)
+
+    def save(self, *args, **kwargs) -> None:
+        """Сохранение ячейки вместе со ссылкой на общий стиль."""
+        if self.__dict__.get('_style_changes') or self.style_id is None:
+            self.set_style({})
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields).isdisjoint(CELL_STYLE_FIELDS):
+            kwargs['update_fields'] = {*(field for field in update_fields if field not in CELL_STYLE_FIELDS), 'style'}
+        super().save(*args, **kwargs)
+
+    def refresh_from_db(self, *args, **kwargs) -> None:
+        """Обновление ячейки из базы данных со сбросом несохраненных изменений стиля."""
+        self.__dict__.pop('_style_changes', None)
+        super().refresh_from_db(*args, **kwargs)
+
 
 class RelationshipCells(models.Model):
     """Модель много ко многим для ячеек."""
@@ -339,9 +474,11 @@ class Value(models.Model, CloneMixin):
     Привязка значения осуществляется к дивизиону через документ,
     но в документе может быть несколько листов.
     В связи с этим добавлено поле sheet, которое точно определяет к какому листу имеет отношение таблицы.
+    Поле number хранит числовое представление значения, чтобы расчеты и агрегация не разбирали строки.
     """
 
     value = models.TextField(help_text='Значение')
+    number = models.FloatField(null=True, help_text='Числовое представление значения')
     payload = models.JSONField(null=True, help_text='Дополнительные данные')
     error = models.CharField(max_length=255, null=True, help_text='Текст ошибки')
 
@@ -356,3 +493,11 @@ class Value(models.Model, CloneMixin):
             models.Index(fields=['document', 'sheet']),
             models.Index(fields=['document', 'column'])
         ]
+
+    def save(self, *args, **kwargs) -> None:
+        """Сохранение значения вместе с его числовым представлением."""
+        self.number = get_value_number(self.value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'number'}
+        super().save(*args, **kwargs)
@@ -113,7 +113,7 @@ class ChangeCellsOptionMutation(BaseMutation):
             case CheckCellOptions.Error(field, error):
                 return ChangeCellsOptionMutation(success=False, errors=[ErrorFieldType(field, [error])])
             case CheckCellOptions.Success(value):
-                cells = Cell.objects.filter(pk__in=map(gid2int, cell_ids))
+                cells = Cell.objects.filter(pk__in=map(gid2int, cell_ids)).select_related('style')
                 check_cells_permissions(user=info.context.user, cells=cells)
                 return ChangeCellsOptionMutation(changed_options=change_cells_option(cells, field, value))
 
@@ -136,7 +136,7 @@ class PasteIntoCellsMutation(BaseMutation):
     @staticmethod
     @permission_classes((IsAuthenticated,))
     def mutate_and_get_payload(root: Any, info: ResolveInfo, options: list[CellPasteOptionsInputType]):
-        cells = Cell.objects.filter(pk__in=(gid2int(option.cell_id) for option in options))
+        cells = Cell.objects.filter(pk__in=(gid2int(option.cell_id) for option in options)).select_related('style')
         check_cells_permissions(user=info.context.user, cells=cells)
         past_options: list[CellPasteOptions] = []
         for option in options:
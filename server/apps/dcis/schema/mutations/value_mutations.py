@@ -58,12 +58,10 @@ class ChangeValuesMutation(BaseMutation):
                 errors.append(ErrorFieldType('value', [str(e)]))
         if len(errors):
             return ChangeValuesMutation(success=False, errors=errors)
-        values_input: list[ValueInput] = []
-        for value in values:
-            values_input.append(ValueInput(
-                cell=next(cell for cell in cells if gid2int(value.cell_id) == cell.id),
-                value=value.value,
-            ))
+        cells_map: dict[int, Cell] = {cell.id: cell for cell in cells}
+        values_input: list[ValueInput] = [
+            ValueInput(cell=cells_map[gid2int(value.cell_id)], value=value.value) for value in values
+        ]
         result = update_or_create_values(
             user=info.context.user,
             document=document,
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Iterable
 
 import graphene
@@ -35,13 +36,14 @@ from apps.dcis.schema.types import (
     DocumentStatusType,
     DocumentType,
     SheetType,
+    SheetValueType,
     StatusType,
 )
 from apps.dcis.services.document_services import get_user_documents
 from apps.dcis.services.sheet_services import get_aggregation_cells
 from apps.dcis.services.sheet_unload_services import DocumentSheetUnloader
 from apps.dcis.services.status_services import get_initial_statuses, get_new_statuses
-from apps.dcis.services.value_services import get_file_value_files
+from apps.dcis.services.value_services import get_document_sheet_values, get_file_value_files
 
 
 class DocumentQueries(graphene.ObjectType):
@@ -93,9 +95,19 @@ class DocumentQueries(graphene.ObjectType):
         SheetType,
         document_id=graphene.ID(required=True, description='Идентификатор документа'),
         sheet_id=graphene.ID(required=True, description='Идентификатор листа'),
+        first_global_index=graphene.Int(description='Начальный индекс строк в плоской структуре'),
+        last_global_index=graphene.Int(description='Конечный индекс строк в плоской структуре'),
         required=True,
         description='Выгрузка листа с несколькими документами',
     )
+    document_sheet_values = graphene.List(
+        graphene.NonNull(SheetValueType),
+        document_id=graphene.ID(required=True, description='Идентификатор документа'),
+        sheet_id=graphene.ID(required=True, description='Идентификатор листа'),
+        updated_since=graphene.DateTime(description='Время, начиная с которого выбираются измененные значения'),
+        required=True,
+        description='Значения листа документа без структуры листа',
+    )
 
     value_files = DjangoListField(
         FileType,
@@ -178,7 +190,9 @@ class DocumentQueries(graphene.ObjectType):
         root: Any,
         info: ResolveInfo,
         document_id: str,
-        sheet_id: str
+        sheet_id: str,
+        first_global_index: int | None = None,
+        last_global_index: int | None = None,
     ) -> list[dict] | dict:
         document = get_object_or_404(Document, pk=gid2int(document_id))
         can_view_document(info.context.user, document)
@@ -187,8 +201,23 @@ class DocumentQueries(graphene.ObjectType):
             sheet=get_object_or_404(Sheet, pk=sheet_id),
             document_id=document.id,
             fields=[snakecase(k) for k in get_fields(info).keys() if k != '__typename'],
+            first_global_index=first_global_index,
+            last_global_index=last_global_index,
         ).unload()
 
+    @staticmethod
+    @permission_classes((IsAuthenticated,))
+    def resolve_document_sheet_values(
+        root: Any,
+        info: ResolveInfo,
+        document_id: str,
+        sheet_id: str,
+        updated_since: datetime | None = None,
+    ) -> list[dict]:
+        document = get_object_or_404(Document, pk=gid2int(document_id))
+        can_view_document(info.context.user, document)
+        return get_document_sheet_values(document, gid2int(sheet_id), updated_since)
+
     @staticmethod
     @permission_classes((IsAuthenticated,))
     def resolve_value_files(
@@ -19,6 +19,7 @@ from apps.core.models import User
 from apps.core.schema import UserType
 from apps.core.services.user_services import get_user_from_id_or_context
 from apps.dcis.helpers.info_fields import get_fields
+from apps.dcis.helpers.recalculation_progress import RecalculationProgress, get_recalculation_progress
 from apps.dcis.models import Attribute, Document, Limitation, Period, PeriodMethodicalSupport, Privilege, Sheet
 from apps.dcis.permissions import can_change_period_sheet, can_view_period, can_view_period_result
 from apps.dcis.schema.types import (
@@ -27,6 +28,7 @@ from apps.dcis.schema.types import (
     DivisionModelTypeConnection,
     LimitationType,
     PeriodMethodicalSupportType,
+    PeriodRecalculationType,
     PeriodType,
     PrivilegeType,
     ReportDocumentInputType,
@@ -152,6 +154,12 @@ class PeriodQueries(graphene.ObjectType):
         description='Агрегированные ячейки документов периода'
     )
 
+    period_recalculation = graphene.Field(
+        PeriodRecalculationType,
+        period_id=graphene.ID(required=True, description='Идентификатор периода'),
+        description='Ход пересчета значений документов периода'
+    )
+
     attributes = graphene.List(
         AttributeType,
         period_id=graphene.ID(required=True, description='Идентификатор периода'),
@@ -310,6 +318,13 @@ class PeriodQueries(graphene.ObjectType):
         period = get_object_or_404(Period, pk=gid2int(period_id))
         return get_cells_aggregation(info.context.user, period)
 
+    @staticmethod
+    @permission_classes((IsAuthenticated,))
+    def resolve_period_recalculation(root, info: ResolveInfo, period_id: str | int) -> RecalculationProgress | None:
+        period = get_object_or_404(Period, pk=gid2int(period_id))
+        can_view_period(info.context.user, period)
+        return get_recalculation_progress(period.id)
+
     @staticmethod
     @permission_classes((IsAuthenticated,))
     def resolve_attributes(
@@ -596,7 +596,7 @@ class CellType(graphene.ObjectType):
     row_id = graphene.ID(description='Идентификатор строки')
     aggregation = graphene.String(description='Метод агрегации')
 
-    # apps.dcis.models.Style
+    # apps.dcis.models.CellStyle
     horizontal_align = graphene.String(description='Горизонтальное выравнивание')
     vertical_align = graphene.String(description='Вертикальное выравнивание')
     size = graphene.Int(required=True, description='Размер шрифта')
@@ -625,6 +625,16 @@ class CellType(graphene.ObjectType):
     error = graphene.String(description='Текст ошибки')
 
 
+class PeriodRecalculationType(graphene.ObjectType):
+    """Тип хода пересчета значений документов периода."""
+
+    status = graphene.String(required=True, description='Состояние пересчета: running, finished или failed')
+    total = graphene.Int(required=True, description='Количество документов для пересчета')
+    processed = graphene.Int(required=True, description='Количество обработанных документов')
+    started_at = graphene.DateTime(required=True, description='Время начала пересчета')
+    finished_at = graphene.DateTime(description='Время завершения пересчета')
+
+
 class CellAggregationType(graphene.ObjectType):
     """Тип ячейки агрегации."""
 
@@ -660,6 +670,16 @@ class ValueType(DjangoObjectType):
         return json.dumps(value.payload) if value.payload is not None else None
 
 
+class SheetValueType(graphene.ObjectType):
+    """Тип значения листа без структуры."""
+
+    row_id = graphene.ID(required=True, description='Идентификатор строки')
+    column_id = graphene.ID(required=True, description='Идентификатор колонки')
+    value = graphene.String(description='Значение')
+    error = graphene.String(description='Текст ошибки')
+    pending = graphene.Boolean(required=True, description='Ожидает ли значение отложенного пересчета агрегации')
+
+
 class BaseSheetType(graphene.ObjectType):
     """Тип листа без структуры."""
 
@@ -680,6 +700,7 @@ class SheetType(BaseSheetType):
 
     columns = graphene.List(graphene.NonNull(lambda: ColumnDimensionType), description='Колонки')
     rows = graphene.List(graphene.NonNull(lambda: RowDimensionType), description='Строки')
+    rows_count = graphene.Int(description='Количество строк в плоской структуре')
     can_change = graphene.Boolean(required=True, description='Может ли пользователь изменять лист')
     can_change_value = graphene.Boolean(required=True, description='Может ли пользователь изменять значение ячейки')
     can_add_child_row_dimension = graphene.Boolean(
@@ -751,9 +772,16 @@ class ChangedCellOptionType(graphene.ObjectType):
 class CellPasteOptionsType(DjangoObjectType):
     """Результат вставки в ячейку."""
 
+    # apps.dcis.models.CellStyle
+    strong = graphene.Boolean(required=True, description='Жирный шрифт')
+    italic = graphene.Boolean(required=True, description='Курсив')
     underline = graphene.String(description='Тип подчеркивания')
+    strike = graphene.Boolean(required=True, description='Зачеркнутый')
     horizontal_align = graphene.String(description='Горизонтальное выравнивание')
     vertical_align = graphene.String(description='Вертикальное выравнивание')
+    size = graphene.Int(required=True, description='Размер шрифта')
+    color = graphene.String(required=True, description='Цвет текста')
+    background = graphene.String(required=True, description='Цвет фона')
 
     class Meta:
         model = Cell
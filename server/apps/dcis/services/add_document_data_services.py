@@ -9,13 +9,15 @@ from typing import Iterable, Union
 from devind_helpers.orm_utils import get_object_or_404
 from devind_helpers.schema.types import ErrorFieldType
 from devind_helpers.utils import gid2int
-from django.db.models import Max, Q
+from django.db.models import Max
 from openpyxl import Workbook, load_workbook
 from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
 from openpyxl.worksheet.worksheet import Worksheet
 
 from apps.core.models import User
-from apps.dcis.models import Cell, Document, Period, Sheet, Status, Value
+from apps.dcis.helpers.sheet_cell_index import CellIndexEntry, get_sheet_cell_index
+from apps.dcis.models import Document, Period, Sheet, Status, Value
+from apps.dcis.models.sheet import get_value_number
 from apps.dcis.permissions import can_add_document
 
 
@@ -156,32 +158,30 @@ def get_documents_data(
     """
     document_data: dict[int, dict[str, list[CellData]]] = defaultdict(dict)
     for sheet_name in reader.sheet_names:  # По листам
-        cells_filter: Q = Q()  # Q(column__sheet=sheets[sheet_name])
+        sheet_id: int = sheets[sheet_name].id
+        index = get_sheet_cell_index(sheet_id)
+        cells: dict[str, tuple[int, int, CellIndexEntry]] = {}
         for header in reader.get_headers(sheet_name):
             if header == division_name:
                 continue
             column_index, row_index = get_coordinate(header)
-            cells_filter |= Q(column__index=column_index, row__index=row_index)
-        cells: dict[str, dict[str, ...]] = {
-            get_position(cell['column__index'], cell['row__index']): cell
-            for cell in Cell.objects.filter(Q(column__sheet_id=sheets[sheet_name].id) & cells_filter).values(
-                'id', 'column__index', 'row__index', 'editable', 'default', 'column_id', 'row_id', 'column__sheet_id'
-            )
-        }
+            position = get_position(column_index, row_index)
+            if position in index:
+                cells[header] = (column_index, row_index, index[position])
         for value in reader.items(sheet_name):
             division_id: int | None = value.pop(division_name)
             document_data[division_id][sheet_name] = [
                 CellData(
                     position=cell_position,
                     value=cell_value,
-                    column_index=cells[cell_position]['column__index'],
-                    row_index=cells[cell_position]['row__index'],
-                    default_value=cells[cell_position]['default'],
-                    sheet_id=cells[cell_position]['column__sheet_id'],
-                    column_id=cells[cell_position]['column_id'],
-                    row_id=cells[cell_position]['row_id'],
-                    cell_id=cells[cell_position]['id'],
-                    editable=cells[cell_position]['editable']
+                    column_index=cells[cell_position][0],
+                    row_index=cells[cell_position][1],
+                    default_value=cells[cell_position][2].default,
+                    sheet_id=sheet_id,
+                    column_id=cells[cell_position][2].column_id,
+                    row_id=cells[cell_position][2].row_id,
+                    cell_id=cells[cell_position][2].cell_id,
+                    editable=cells[cell_position][2].editable
                 ) for cell_position, cell_value in value.items()
             ]
     return document_data
@@ -223,6 +223,7 @@ def add_documents(
             [
                 Value(
                     value=cell_data.value,
+                    number=get_value_number(cell_data.value),
                     document=document,
                     sheet=sheets[sheet_name],
                     column_id=cell_data.column_id,
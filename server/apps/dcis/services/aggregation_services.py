@@ -1,11 +1,12 @@
 """Модуль, отвечающий за работу с агрегациями."""
 
-import contextlib
 import json
 from datetime import datetime
 from os.path import join
 from posixpath import relpath
+from typing import Any, Sequence
 
+import numpy as np
 from devind_helpers.orm_utils import get_object_or_404
 from devind_helpers.schema.types import ErrorFieldType
 from devind_helpers.utils import gid2int
@@ -14,11 +15,13 @@ from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import File
 from django.db import transaction
 from django.db.models import QuerySet
-from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string, get_column_letter
 from pydantic import BaseModel, ValidationError, parse_obj_as
 
 from apps.core.models import User
 from apps.dcis.helpers.pydantic_translate import translate
+from apps.dcis.helpers.sheet_cell_index import get_sheet_cell_index
+from apps.dcis.helpers.sheet_unload_cache import bump_cells_sheets_versions
 from apps.dcis.models import Cell, Period, RelationshipCells, Sheet
 from apps.dcis.permissions import can_change_period_sheet
 from apps.dcis.permissions.period_permissions import can_view_period
@@ -64,20 +67,51 @@ def delete_cell_aggregation(user: User, cell_id: CellIDType, target_cell_id: Cel
 
 def calculate_aggregation_cell(cell: Cell, *raw_values) -> float:
     """Расчет агрегации для ячейки."""
-    values: list[float] = []
-    for raw_value in raw_values:
-        with contextlib.suppress(ValueError):
-            values.append(float(raw_value))
-
-    match cell.aggregation:
-        case Cell.AGGREGATION_AVG:
-            return sum(values) / len(values)
-        case Cell.AGGREGATION_MIN:
-            return min(values)
-        case Cell.AGGREGATION_MAX:
-            return max(values)
-        case _:
-            return sum(values)
+    return calculate_aggregations([cell.aggregation], [0] * len(raw_values), raw_values)[0]
+
+
+def calculate_aggregations(
+    aggregations: Sequence[str | None],
+    groups: Sequence[int],
+    raw_values: Sequence[Any],
+) -> list[float]:
+    """Групповой расчет агрегаций.
+
+    Значения, которые не удалось преобразовать в число, не учитываются.
+    Для групп без числовых значений результат равен 0.
+    :param aggregations: методы агрегации групп
+    :param groups: номера групп значений
+    :param raw_values: значения
+    :return: результаты агрегации в порядке групп
+    """
+    size = len(aggregations)
+    group_indices = np.asarray(groups, dtype=np.intp)
+    values = np.fromiter((_to_float(raw_value) for raw_value in raw_values), dtype=float, count=len(raw_values))
+    numeric = ~np.isnan(values)
+    sums = np.bincount(group_indices, weights=np.where(numeric, values, 0.0), minlength=size)
+    counts = np.bincount(group_indices, weights=numeric, minlength=size)
+    minimums = np.full(size, np.nan)
+    maximums = np.full(size, np.nan)
+    np.fmin.at(minimums, group_indices, values)
+    np.fmax.at(maximums, group_indices, values)
+    methods = np.array(aggregations, dtype=object)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        results = np.select(
+            [methods == Cell.AGGREGATION_AVG, methods == Cell.AGGREGATION_MIN, methods == Cell.AGGREGATION_MAX],
+            [sums / counts, minimums, maximums],
+            sums,
+        )
+    return np.where(np.isnan(results), 0.0, results).tolist()
+
+
+def _to_float(raw_value: Any) -> float:
+    """Преобразование значения в число или `nan`."""
+    if isinstance(raw_value, float):
+        return raw_value
+    try:
+        return float(raw_value)
+    except (TypeError, ValueError):
+        return np.nan
 
 
 class CellsAggregation(BaseModel):
@@ -181,20 +215,14 @@ def unload_aggregations_in_file(user: User, period: Period) -> str:
 
 def get_cell_aggregation_id(data_cell: str, period_id: str | int) -> str | int:
     """Получение идентификатора ячейки."""
-    try:
-        data = data_cell.split('!')
-        sheet_name = data[0].replace('\'', '')
-        column, row = coordinate_from_string(data[1])
-        column = column_index_from_string(column)
-        cell = Cell.objects.select_related('column__sheet').get(
-            column__sheet__name=sheet_name,
-            column__sheet__period__id=period_id,
-            column__index=column,
-            row__index=row
-        )
-        return cell.id
-    except (Sheet.DoesNotExist, Cell.DoesNotExist):
-        raise ValueError(f'Ячейка с идентификатором {cell.id} не найдена.')
+    data = data_cell.split('!')
+    sheet_name = data[0].replace('\'', '')
+    column, row = coordinate_from_string(data[1])
+    sheet_id = Sheet.objects.filter(name=sheet_name, period_id=period_id).values_list('id', flat=True).first()
+    entry = get_sheet_cell_index(sheet_id).get(f'{column}{row}') if sheet_id is not None else None
+    if entry is None:
+        raise ValueError(f'Ячейка {data_cell} не найдена.')
+    return entry.cell_id
 
 
 def delete_cells_aggregation(user: User, cell_id: str | int) -> None:
@@ -203,6 +231,7 @@ def delete_cells_aggregation(user: User, cell_id: str | int) -> None:
     RelationshipCells.objects.filter(to_cell=cell_id).delete()
     cell.aggregation = None
     cell.save(update_fields=('aggregation',))
+    bump_cells_sheets_versions([cell.id])
 
 
 @transaction.atomic
@@ -223,6 +252,7 @@ def add_aggregation_cell(
         cell = Cell.objects.get(id=to_cell_id)
         cell.aggregation = aggregation_method
         cell.save(update_fields=('aggregation',))
+        bump_cells_sheets_versions([cell.id])
     except Cell.DoesNotExist:
         raise ValueError(f'Ячейка с идентификатором {to_cell_id} не найдена.')
     except Exception as e:
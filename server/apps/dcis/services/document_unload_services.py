@@ -3,17 +3,21 @@
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Iterable
+from itertools import islice
+from typing import Iterable, Sequence
 
 from django.conf import settings
 from django.db.models import Q, QuerySet
 from openpyxl import Workbook
-from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.cell import Cell as OpenpyxlCell, WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.styles.borders import DEFAULT_BORDER
 from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 
 from apps.core.models import User
-from apps.dcis.models import Cell, ColumnDimension, Document, MergedCell, Period, RowDimension, Sheet, Value
+from apps.dcis.models import Cell, CellStyle, ColumnDimension, Document, MergedCell, Period, RowDimension, Sheet, Value
 from apps.dcis.permissions import can_view_document
 from apps.dcis.services.document_services import get_document_sheets
 
@@ -32,16 +36,17 @@ class BuildRow:
 @dataclass
 class BuildCell:
     """Дата класс содержащий собираемую информацию о ячейки."""
-    cell: Cell
-    value: str
-    alignment: Alignment
-    font: Font
-    border: Border
-    pattern_fill: PatternFill
+    value: str | None
+    style: NamedStyle
 
 
 class DocumentUnload:
-    """Выгрузка документа в формате Excel."""
+    """Выгрузка документа в формате Excel.
+
+    Книга записывается в потоковом режиме openpyxl: строки листа формируются по порядку
+    и сразу сбрасываются на диск, а стили ячеек регистрируются в книге один раз
+    как именованные стили для каждого общего стиля ячеек.
+    """
 
     ALLOW_ADDITIONAL: list[str] = ['row_add_date', 'row_update_date', 'division_name', 'division_head', 'user']
     DIVISION_INFO_CACHE: dict[int, tuple[str, str]] = {}
@@ -60,110 +65,165 @@ class DocumentUnload:
         ).all()
         self.additional = [field for field in additional if field in self.ALLOW_ADDITIONAL]
         self.path = settings.DOCUMENTS_DIR / f'document_{datetime.now().strftime("%d-%m-%Y_%H-%M-%S")}.xlsx'
+        # Именованные стили книги по идентификатору общего стиля ячеек
+        self._named_styles: dict[int, NamedStyle] = {}
 
     def unload(self) -> str:
         """Выгрузка."""
-        wb = Workbook()
-        wb.remove(wb.active)
+        wb = Workbook(write_only=True)
         for sheet in self.sheets:
-            ws: Worksheet = wb.create_sheet(sheet.name)
+            ws: WriteOnlyWorksheet = wb.create_sheet(sheet.name)
             columns = sheet.columndimension_set.all()
             rows = sheet.rowdimension_set.filter(
                 Q(parent__isnull=True) | Q(document=self.document, parent_id__isnull=False)
-            )
+            ).select_related('user')
             rows_id = [row.id for row in rows]
-            cells = Cell.objects.filter(row_id__in=rows_id)
+            cells = Cell.objects.filter(row_id__in=rows_id).select_related('style')
             values = Value.objects.filter(document=self.document, row_id__in=rows_id)
             build_rows = self._build_rows(rows)
-            build_cells = self._build_cells(cells, values)
+            build_cells = self._build_cells(wb, cells, values)
             build_merged_cells = self._build_merged_cells(sheet.mergedcell_set.all())
-            self._save_rows(ws, columns, build_rows, build_cells, build_merged_cells)
+            merged_ranges = self._build_merged_ranges(build_rows, build_merged_cells)
+            # В потоковом режиме размеры колонок задаются до записи первой строки
             for column in columns:
                 if column.width:
                     ws.column_dimensions[get_column_letter(column.index)].width = column.width // 7
             for ci in range(len(columns) + 1, len(columns) + len(self.additional) + 1):
                 ws.column_dimensions[get_column_letter(ci)].width = 20
-
+            self._save_rows(ws, columns, build_rows, build_cells, merged_ranges)
         wb.save(self.path)
         return f'/{self.path.relative_to(settings.BASE_DIR)}'
 
     def _save_rows(
         self,
-        ws: Worksheet,
-        columns: Iterable[ColumnDimension],
+        ws: WriteOnlyWorksheet,
+        columns: Sequence[ColumnDimension],
         build_rows: list[BuildRow],
-        build_cells: dict[str, BuildCell],
-        build_merged_cells: dict[int, list[MergedCell]],
-    ):
-        """Сохранение строк в xlsx файл."""
-        offset_row: int = 0
+        build_cells: dict[tuple[int, int], BuildCell],
+        merged_ranges: list[CellRange],
+    ) -> None:
+        """Сохранение строк в xlsx файл по порядку."""
+        for merged_range in merged_ranges:
+            ws.merged_cells.add(merged_range)
+        merged_coordinates, merged_borders = self._build_merged_borders(
+            columns, build_rows, build_cells, merged_ranges
+        )
         for row_index, build_row in enumerate(build_rows, 1):
-            self._save_cells(ws, columns, build_cells, build_row, row_index)
-
-            # Пропускаем объединение, если строка дочерняя
-            if build_row.row.parent_id is not None:
-                offset_row += 1
-
-            # Высота строки, если она задана
+            # Высота строки, если она задана, записывается вместе со строкой
             if build_row.row.height:
                 ws.row_dimensions[row_index].height = build_row.row.height
-
-            # Объединяем ячейки
-            if row_index - offset_row in build_merged_cells:
-                for merge_cell in build_merged_cells[row_index - offset_row]:
-                    ws.merge_cells(
-                        start_column=merge_cell.min_col,
-                        start_row=merge_cell.min_row + offset_row,
-                        end_column=merge_cell.max_col,
-                        end_row=merge_cell.max_row + offset_row,
-                    )
+            ws.append(self._save_cells(
+                ws, columns, build_cells, build_row, row_index, merged_coordinates, merged_borders
+            ))
 
     def _save_cells(
         self,
-        ws: Worksheet,
-        columns: Iterable[ColumnDimension],
-        build_cells: dict[str, BuildCell],
+        ws: WriteOnlyWorksheet,
+        columns: Sequence[ColumnDimension],
+        build_cells: dict[tuple[int, int], BuildCell],
         build_row: BuildRow,
         row_index: int,
-    ) -> None:
-        """Сохранение ячеек в xlsx файл."""
+        merged_coordinates: set[tuple[int, int]],
+        merged_borders: dict[tuple[int, int], Border],
+    ) -> list[OpenpyxlCell | str | None]:
+        """Формирование ячеек строки xlsx файла.
+
+        Ячейки, закрытые объединением, записываются без значения,
+        а границы ячеек объединений берутся из заранее рассчитанных.
+        """
+        row: list[OpenpyxlCell | str | None] = []
         # Основные колонки
-        column_index = 1
-        for column in columns:
-            cell: BuildCell | None = build_cells.get(f'{column.pk}:{build_row.row.pk}')
-            if cell:
-                ws.cell(row_index, column_index, cell.value)
-                ws.cell(row_index, column_index).alignment = cell.alignment
-                ws.cell(row_index, column_index).font = cell.font
-                ws.cell(row_index, column_index).border = cell.border
-                ws.cell(row_index, column_index).fill = cell.pattern_fill
-            column_index += 1
+        for column_index, column in enumerate(columns, 1):
+            coordinate = row_index, column_index
+            build_cell: BuildCell | None = build_cells.get((build_row.row.pk, column.pk))
+            if coordinate in merged_coordinates or (build_cell is None and coordinate in merged_borders):
+                cell = WriteOnlyCell(ws)
+                cell.border = merged_borders[coordinate]
+            elif build_cell is not None:
+                cell = WriteOnlyCell(ws, build_cell.value)
+                cell.style = build_cell.style
+                if coordinate in merged_borders and merged_borders[coordinate] != build_cell.style.border:
+                    cell.border = merged_borders[coordinate]
+            else:
+                cell = None
+            row.append(cell)
 
         # Дополнительные колонки
         if self.project.division_name == 'organization':
             if row_index == 1:
-                ws.cell(row_index, column_index, self.document.updated_at.strftime('%d.%m.%Y-%H:%M:%S'))
+                row.append(self.document.updated_at.strftime('%d.%m.%Y-%H:%M:%S'))
         else:
-            for ac in self.additional:
-                ws.cell(row_index, column_index, getattr(build_row, ac))
-                column_index += 1
+            row.extend(getattr(build_row, ac) for ac in self.additional)
+        return row
 
-    def _build_rows(self, rows: Iterable[RowDimension], parent_id: int | None = None) -> list[BuildRow]:
-        """Функция собирает все строки, включая дочерние в плоский массив."""
+    @staticmethod
+    def _build_merged_borders(
+        columns: Sequence[ColumnDimension],
+        build_rows: list[BuildRow],
+        build_cells: dict[tuple[int, int], BuildCell],
+        merged_ranges: list[CellRange],
+    ) -> tuple[set[tuple[int, int]], dict[tuple[int, int], Border]]:
+        """Расчет ячеек, закрытых объединениями, и границ ячеек объединений.
+
+        Повторяет `MergedCellRange` и `Worksheet.merge_cells` из openpyxl для диапазонов в порядке объединения:
+        начальная ячейка получает правую и нижнюю границы конечной ячейки,
+        закрытые ячейки теряют стиль, а ячейки на краю диапазона получают границы начальной ячейки.
+        """
+        merged_coordinates: set[tuple[int, int]] = set()
+        borders: dict[tuple[int, int], Border] = {}
+
+        def get_border(coordinate: tuple[int, int]) -> Border | None:
+            if coordinate not in borders:
+                row_index, column_index = coordinate
+                if row_index > len(build_rows) or column_index > len(columns):
+                    return None
+                build_cell = build_cells.get((build_rows[row_index - 1].row.pk, columns[column_index - 1].pk))
+                if build_cell is None:
+                    return None
+                borders[coordinate] = build_cell.style.border
+            return borders[coordinate]
+
+        for merged_range in merged_ranges:
+            start = merged_range.min_row, merged_range.min_col
+            borders[start] = get_border(start) or DEFAULT_BORDER
+            end_border = get_border((merged_range.max_row, merged_range.max_col))
+            if end_border is not None:
+                borders[start] += Border(right=end_border.right, bottom=end_border.bottom)
+            for coordinate in islice(merged_range.cells, 1, None):
+                merged_coordinates.add(coordinate)
+                borders[coordinate] = DEFAULT_BORDER
+            for position in ('top', 'left', 'right', 'bottom'):
+                side = getattr(borders[start], position)
+                if side and side.style is None:
+                    continue
+                border = Border(**{position: side})
+                for coordinate in getattr(merged_range, position):
+                    borders[coordinate] = (get_border(coordinate) or DEFAULT_BORDER) + border
+        return merged_coordinates, borders
+
+    def _build_rows(self, rows: Iterable[RowDimension]) -> list[BuildRow]:
+        """Функция собирает все строки, включая дочерние в плоский массив.
+
+        Дочерние строки следуют сразу за родительской в порядке исходного набора.
+        """
         date_format: str = '%H:%M %d.%m.%Y'
+        children: dict[int | None, list[RowDimension]] = defaultdict(list)
+        for row in rows:
+            children[row.parent_id].append(row)
         build_rows: list[BuildRow] = []
-        current_rows = [row for row in rows if row.parent_id == parent_id]
-        for current_row in current_rows:
+        stack: list[RowDimension] = children[None][::-1]
+        while stack:
+            current_row = stack.pop()
             division_name, division_head = self._division_info(current_row.user)
-            build_row = BuildRow(
+            build_rows.append(BuildRow(
                 current_row,
                 current_row.created_at.strftime(date_format),
                 current_row.updated_at.strftime(date_format),
                 division_name,
                 division_head,
                 current_row.user.get_full_name if current_row.user is not None else '',
-            )
-            build_rows = [*build_rows, build_row, *self._build_rows(rows, current_row.pk)]
+            ))
+            stack.extend(children[current_row.pk][::-1])
         return build_rows
 
     @staticmethod
@@ -174,6 +234,27 @@ class DocumentUnload:
             build_mc[merge_cell.max_row].append(merge_cell)
         return build_mc
 
+    @staticmethod
+    def _build_merged_ranges(
+        build_rows: list[BuildRow],
+        build_merged_cells: dict[int, list[MergedCell]],
+    ) -> list[CellRange]:
+        """Расчет диапазонов объединенных ячеек с учетом смещения дочерними строками."""
+        merged_ranges: list[CellRange] = []
+        offset_row: int = 0
+        for row_index, build_row in enumerate(build_rows, 1):
+            # Пропускаем объединение, если строка дочерняя
+            if build_row.row.parent_id is not None:
+                offset_row += 1
+            for merge_cell in build_merged_cells.get(row_index - offset_row, ()):
+                merged_ranges.append(CellRange(
+                    min_col=merge_cell.min_col,
+                    min_row=merge_cell.min_row + offset_row,
+                    max_col=merge_cell.max_col,
+                    max_row=merge_cell.max_row + offset_row,
+                ))
+        return merged_ranges
+
     def _division_info(self, user: User | None) -> tuple[str, str]:
         """Функция возвращает название дивизиона и начальника этого дивизиона.
 
@@ -197,69 +278,87 @@ class DocumentUnload:
         self.DIVISION_INFO_CACHE[user.id] = division_name, division_head,
         return division_name, division_head
 
-    def _build_cells(self, cells: Iterable[Cell], values: Iterable[Value]) -> dict[str, BuildCell]:
-        """Собираем ячейки в словарь для индексации."""
-        build_values: dict[str, Value] = {f'{value.column_id}:{value.row_id}': value.value for value in values}
+    def _build_cells(
+        self,
+        wb: Workbook,
+        cells: QuerySet[Cell],
+        values: QuerySet[Value],
+    ) -> dict[tuple[int, int], BuildCell]:
+        """Собираем ячейки в словарь по строке и колонке для индексации."""
+        build_values: dict[tuple[int, int], str] = {
+            (row_id, column_id): value
+            for row_id, column_id, value in values.values_list('row_id', 'column_id', 'value').iterator()
+        }
         return {
-            f'{cell.column_id}:{cell.row_id}': BuildCell(
-                cell,
-                build_values.get(f'{cell.column_id}:{cell.row_id}', cell.default),
-                self._cell_alignment(cell),
-                self._cell_font(cell),
-                self._cell_border(cell),
-                self._cell_pattern_fill(cell),
+            (cell.row_id, cell.column_id): BuildCell(
+                build_values.get((cell.row_id, cell.column_id), cell.default),
+                self._get_named_style(wb, cell.style),
             )
-            for cell in cells
+            for cell in cells.iterator()
         }
 
+    def _get_named_style(self, wb: Workbook, style: CellStyle) -> NamedStyle:
+        """Получение именованного стиля книги для общего стиля ячеек с регистрацией при первом обращении."""
+        if style.id not in self._named_styles:
+            named_style = NamedStyle(
+                name=f'dcis_{style.id}',
+                font=self._cell_font(style),
+                fill=self._cell_pattern_fill(style),
+                border=self._cell_border(style),
+                alignment=self._cell_alignment(style),
+            )
+            wb.add_named_style(named_style)
+            self._named_styles[style.id] = named_style
+        return self._named_styles[style.id]
+
     @staticmethod
-    def _cell_alignment(cell: Cell) -> Alignment:
+    def _cell_alignment(style: CellStyle) -> Alignment:
         """Получение выравнивания ячейки."""
         return Alignment(
-            vertical=cell.vertical_align if cell.vertical_align != 'middle' else 'center',
-            horizontal=cell.horizontal_align,
+            vertical=style.vertical_align if style.vertical_align != 'middle' else 'center',
+            horizontal=style.horizontal_align,
             wrap_text=True,
         )
 
     @staticmethod
-    def _cell_font(cell: Cell) -> Font:
+    def _cell_font(style: CellStyle) -> Font:
         """Получение шрифта ячейки."""
         return Font(
-            size=cell.size,
-            bold=cell.strong,
-            italic=cell.italic,
-            strike=cell.strike,
-            underline=cell.underline,
-            color=f'{cell.color[1:]}',
+            size=style.size,
+            bold=style.strong,
+            italic=style.italic,
+            strike=style.strike,
+            underline=style.underline,
+            color=f'{style.color[1:]}',
         )
 
-    def _cell_border(self, cell: Cell) -> Border:
+    def _cell_border(self, style: CellStyle) -> Border:
         """Получение границы ячейки."""
         border_styles = {
-            position: self._cell_border_side(cell, position)
+            position: self._cell_border_side(style, position)
             for position in ['top', 'bottom', 'left', 'right', 'diagonal']
         }
         return Border(
-            diagonalDown=cell.border_style.get('diagonalDown'),
-            diagonalUp=cell.border_style.get('diagonalUp'),
+            diagonalDown=style.border_style.get('diagonalDown'),
+            diagonalUp=style.border_style.get('diagonalUp'),
             **border_styles
         )
 
     @staticmethod
-    def _cell_pattern_fill(cell: Cell) -> PatternFill:
+    def _cell_pattern_fill(style: CellStyle) -> PatternFill:
         """Получение паттерна заливки ячейки."""
         return PatternFill(
             fill_type='solid',
-            start_color=f'{cell.background[1:]}',
-            end_color=f'{cell.background[1:]}'
+            start_color=f'{style.background[1:]}',
+            end_color=f'{style.background[1:]}'
         )
 
     @staticmethod
-    def _cell_border_side(cell: Cell, position: str) -> Side:
+    def _cell_border_side(style: CellStyle, position: str) -> Side:
         """Получение настроек границы ячейки."""
         return Side(
-            border_style=cell.border_style.get(position),
-            color=f'{cell.border_color[position][1:]}' if cell.border_color[position] else None
+            border_style=style.border_style.get(position),
+            color=f'{style.border_color[position][1:]}' if style.border_color[position] else None
         )
 
 
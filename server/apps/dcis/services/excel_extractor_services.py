@@ -13,13 +13,18 @@ from openpyxl.worksheet.dimensions import (
     RowDimension as OpenpyxlRowDimension,
 )
 from openpyxl.worksheet.merge import MergeCell as OpenpyxlMergedCell
-from xlsx_evaluate import Evaluator, ModelCompiler
+from xlsx_evaluate import Evaluator
 
 from apps.dcis.helpers.cell import evaluate_formula
+from apps.dcis.helpers.formula_model import CompiledFormulaModel
 from apps.dcis.helpers.sheet_formula_cache import SheetFormulaContainerCache
 from apps.dcis.helpers.theme_to_rgb import theme_and_tint_to_rgb
-from apps.dcis.models import Cell, ColumnDimension, MergedCell, Period, RowDimension, Sheet
+from apps.dcis.models import Cell, CellStyle, ColumnDimension, MergedCell, Period, RowDimension, Sheet
 from apps.dcis.models.sheet import KindCell
+from apps.dcis.signals import pre_save_cell
+
+# Количество объектов, создаваемых одним запросом при сохранении
+SAVE_BATCH_SIZE = 1000
 
 
 @dataclass
@@ -53,19 +58,30 @@ class BuildRowDimension:
 
 
 @dataclass
-class BuildCell(BuildStyle):
+class BuildCellStyle(BuildStyle):
+    """Построение стиля ячейки.
+
+    Один объект используется всеми ячейками с одинаковым стилем Excel,
+    style_id - индекс стиля в книге.
+    """
+    editable: bool = True
+    border_color: dict[str, str] = None
+    style_id: int | None = None
+
+
+@dataclass
+class BuildCell:
     """Построение ячеек."""
     column_id: int
     row_id: int
     kind: str
-    editable: bool
+    style: BuildCellStyle
     coordinate: str | None = None
     formula: str | None = None
     number_format: str | None = None
     comment: str | None = None
     default: str | None = None
     default_error: str | None = None
-    border_color: dict[str, str] = None
 
 
 @dataclass
@@ -86,6 +102,9 @@ class BuildSheet:
     fixed_row: int | None
     cells: list[BuildCell]
     merged_cells: list[BuildMergedCell]
+    # Формулы листа и результаты их предварительного расчета по координатам вида A1
+    formulas: dict[str, str] = field(default_factory=dict)
+    evaluated: dict[str, tuple[str | None, str | None]] = field(default_factory=dict)
 
     cache_container: SheetFormulaContainerCache = field(init=False)
 
@@ -105,63 +124,107 @@ class ExcelExtractor:
         self.path = filename
         self.work_book = load_workbook(filename)
         self.readonly_fill_color = readonly_fill_color
+        # Разобранные стили ячеек по индексу стиля в книге
+        self._cell_styles: dict[int, BuildCellStyle] = {}
 
     def save(self, period: Period):
-        """Сохранение обработанного файла в базу данных."""
-        extract_sheets: list[BuildSheet] = self.extract()
-        for position, extract_sheet in enumerate(extract_sheets):
+        """Сохранение обработанного файла в базу данных.
+
+        Формулы всех листов рассчитываются заранее, после чего ячейки каждого листа разбираются по одной
+        и передаются на запись частями по `SAVE_BATCH_SIZE` вместе с еще не созданными колонками и строками,
+        поэтому разобранные ячейки книги целиком в памяти не хранятся.
+        """
+        extract_sheets: list[BuildSheet] = self._extract_sheets()
+        # Общие стили и признак редактирования по индексу стиля ячейки в книге
+        cell_styles: dict[int, tuple[bool, CellStyle]] = {}
+        for position, (extract_sheet, worksheet) in enumerate(zip(extract_sheets, self.work_book.worksheets)):
             sheet = Sheet.objects.create(
                 name=extract_sheet.name,
                 position=position,
                 period=period
             )
             extract_sheet.cache_container.save(sheet.pk)
-            # Соотношение позиции и созданных идентификаторов
-            columns_mapper: dict[int, int] = {}
-            rows_mapper: dict[int, int] = {}
-            columns_styles: dict[int, dict] = {}
-            rows_styles: dict[int, dict] = {}
-            for cell in extract_sheet.cells:
+            # Соотношение позиции и создаваемых колонок и строк
+            columns: dict[int, ColumnDimension] = {}
+            rows: dict[int, RowDimension] = {}
+            batch: list[BuildCell] = []
+            for cell in self._parse_cells(self.work_book, worksheet.rows, extract_sheet.evaluated):
                 column_id: int = cell.column_id
                 row_id: int = cell.row_id
-                columns_styles[column_id] = {}
-                rows_styles[row_id] = {}
 
-                if column_id not in columns_mapper:
+                if column_id not in columns:
                     column_parameters = {
                         'index': column_id,
                         'fixed': extract_sheet.fixed_column is not None and column_id < extract_sheet.fixed_column
                     }
                     if column_id in extract_sheet.columns_dimension:
                         cd: dict = asdict(extract_sheet.columns_dimension[column_id])
-                        columns_styles[column_id] = cd.pop('style')
+                        cd.pop('style')
                         column_parameters = {**column_parameters, **cd}
-                    column: ColumnDimension = ColumnDimension.objects.create(sheet=sheet, **column_parameters)
-                    columns_mapper[column_id] = column.id
+                    columns[column_id] = ColumnDimension(sheet=sheet, **column_parameters)
 
-                if row_id not in rows_mapper:
+                if row_id not in rows:
                     row_parameters = {
                         'index': row_id,
                         'fixed': extract_sheet.fixed_row is not None and row_id < extract_sheet.fixed_row
                     }
                     if row_id in extract_sheet.rows_dimension:
                         rd = asdict(extract_sheet.rows_dimension[row_id])
-                        rows_styles[row_id] = rd.pop('style')
+                        rd.pop('style')
                         row_parameters = {**row_parameters, **rd}
-                    row: RowDimension = RowDimension.objects.create(sheet=sheet, **row_parameters)
-                    rows_mapper[row_id] = row.id
+                    rows[row_id] = RowDimension(sheet=sheet, **row_parameters)
+
+                batch.append(cell)
+                if len(batch) == SAVE_BATCH_SIZE:
+                    self._save_cells(batch, columns, rows, cell_styles)
+                    batch = []
+            self._save_cells(batch, columns, rows, cell_styles)
 
-                cell.column_id = columns_mapper[column_id]
-                cell.row_id = rows_mapper[row_id]
-                # Объединяем стили cell <- row <- col
-                Cell.objects.create(**{
-                    **columns_styles[column_id],
-                    **rows_styles[row_id],
-                    **{k: v for k, v in asdict(cell).items() if k != 'coordinate'}
-                })
+            MergedCell.objects.bulk_create([
+                MergedCell(sheet=sheet, **asdict(merged_cell)) for merged_cell in extract_sheet.merged_cells
+            ], batch_size=SAVE_BATCH_SIZE)
 
-            for merged_cell in extract_sheet.merged_cells:
-                MergedCell.objects.create(sheet=sheet, **asdict(merged_cell))
+    @staticmethod
+    def _save_cells(
+        cells: list[BuildCell],
+        columns: dict[int, ColumnDimension],
+        rows: dict[int, RowDimension],
+        cell_styles: dict[int, tuple[bool, CellStyle]],
+    ) -> None:
+        """Создание части ячеек листа вместе с еще не созданными колонками и строками.
+
+        Стиль ячейки полностью перекрывает стили колонки и строки,
+        поэтому общий стиль находится один раз на каждый индекс стиля ячейки в книге.
+        """
+        ColumnDimension.objects.bulk_create([
+            columns[column_id] for column_id in dict.fromkeys(cell.column_id for cell in cells)
+            if columns[column_id].pk is None
+        ], batch_size=SAVE_BATCH_SIZE)
+        RowDimension.objects.bulk_create([
+            rows[row_id] for row_id in dict.fromkeys(cell.row_id for cell in cells) if rows[row_id].pk is None
+        ], batch_size=SAVE_BATCH_SIZE)
+        db_cells: list[Cell] = []
+        for cell in cells:
+            if cell.style.style_id not in cell_styles:
+                style = asdict(cell.style)
+                cell_styles[cell.style.style_id] = style.pop('editable'), CellStyle.get_or_create_style(style)
+            editable, cell_style = cell_styles[cell.style.style_id]
+            db_cell = Cell(
+                column_id=columns[cell.column_id].id,
+                row_id=rows[cell.row_id].id,
+                style=cell_style,
+                editable=editable,
+                kind=cell.kind,
+                formula=cell.formula,
+                number_format=cell.number_format,
+                comment=cell.comment,
+                default=cell.default,
+                default_error=cell.default_error,
+            )
+            # Массовое создание не отправляет сигналы, поэтому обработчик вызывается явно
+            pre_save_cell(Cell, db_cell)
+            db_cells.append(db_cell)
+        Cell.objects.bulk_create(db_cells, batch_size=SAVE_BATCH_SIZE)
 
     def extract(self) -> list[BuildSheet]:
         """Парсинг файла Excel.
@@ -170,26 +233,44 @@ class ExcelExtractor:
         После выделения необходимых данных можно осуществлять транзакционную запись в базу данных.
         Структура данных может использоваться для предварительной демонстрации планируемого отчета.
         """
+        sheets: list[BuildSheet] = self._extract_sheets()
+        for sheet, worksheet in zip(sheets, self.work_book.worksheets):
+            sheet.cells = list(self._parse_cells(self.work_book, worksheet.rows, sheet.evaluated))
+        return sheets
+
+    def _extract_sheets(self) -> list[BuildSheet]:
+        """Парсинг листов без ячеек с предварительным расчетом формул.
+
+        Для расчета формул забираются только значения ячеек, стили ячеек разбираются позже.
+        """
         sheets: list[BuildSheet] = []
+        cells_values: dict[str, str | int] = {}
         for sheet in self.work_book.worksheets:
             name: str = sheet.title
             columns_dimension: dict[int, BuildColumnDimension] = self._parse_columns_dimension(sheet.column_dimensions)
             rows_dimension: dict[int, BuildRowDimension] = self._parse_rows_dimension(sheet.row_dimensions)
-            cells: list[BuildCell] = self._parse_cells(self.work_book, sheet.rows)
             merged_cells: list[BuildMergedCell] = self._parse_merged_cells(sheet.merged_cells.ranges)
             [fixed_column_name, fixed_row_index] = coordinate_from_string(
                 sheet.freeze_panes
             ) if sheet.freeze_panes is not None else (None, None)
-            sheets.append(BuildSheet(
+            build_sheet = BuildSheet(
                 name=name,
                 columns_dimension=columns_dimension,
                 fixed_column=column_index_from_string(fixed_column_name) if fixed_column_name else None,
                 rows_dimension=rows_dimension,
                 fixed_row=fixed_row_index,
-                cells=cells,
+                cells=[],
                 merged_cells=merged_cells
-            ))
-        return self.evaluate_cells(sheets)
+            )
+            for row_index, row in enumerate(sheet.iter_rows(values_only=True), 1):
+                for column_index, value in enumerate(row, 1):
+                    coordinate = f'{get_column_letter(column_index)}{row_index}'
+                    default = str(value) if value is not None else None
+                    cells_values[self.coordinate(name, column_index, row_index)] = default or 0
+                    if isinstance(value, str) and value and value[0] == '=':
+                        build_sheet.formulas[coordinate] = value
+            sheets.append(build_sheet)
+        return self.evaluate_cells(sheets, cells_values)
 
     def _parse_columns_dimension(self, holder: DimensionHolder) -> dict[int, BuildColumnDimension]:
         """Парсинг имеющихся колонок."""
@@ -243,70 +324,93 @@ class ExcelExtractor:
         except TypeError:
             return None
 
-    def _parse_cells(self, wb: Workbook, rows: Iterator[tuple[OpenpyxlCell | OpenpyxlMergedCell]]) -> list[BuildCell]:
+    def _parse_cells(
+        self,
+        wb: Workbook,
+        rows: Iterator[tuple[OpenpyxlCell | OpenpyxlMergedCell]],
+        evaluated: dict[str, tuple[str | None, str | None]],
+    ) -> Iterator[BuildCell]:
         """Парсинг ячеек.
 
         Переданный параметр rows представляет собой матрицу.
         Каждая строка включает в себя массив ячеек, который соотноситься с колонками.
+        Ячейки разбираются по одной, значения формул берутся из результатов предварительного расчета.
         """
-        cells: list[BuildCell] = []
         for row in rows:
             for cell in row:
-                fill_color = self.__color_transform(wb, cell.fill.fgColor)
-                font_color = self.__color_transform(wb, cell.font.color)
-
-                # Временная заглушка
-                if (font_color and font_color.index == 1 and cell.fill.patternType is None) or \
-                        (font_color and font_color.index == 1 and fill_color.value == WHITE):
-                    font_color.type = 'rgb'
-                    font_color.value = '00000000'
                 kind, number_format = self._get_cell_kind_and_number_format(cell)
-                cells.append(BuildCell(
+                formula = self._get_cell_formula(cell)
+                if formula:
+                    default, default_error = evaluated[cell.coordinate]
+                else:
+                    default, default_error = self._get_cell_default(cell), None
+                yield BuildCell(
                     column_id=cell.column,
                     row_id=cell.row,
                     kind=kind,
-                    editable=not self.readonly_fill_color or fill_color.value == '00000000',
+                    style=self._get_cell_style(wb, cell),
                     coordinate=cell.coordinate,
-                    formula=self._get_cell_formula(cell),
+                    formula=formula,
                     number_format=number_format,
                     comment=cell.comment,
-                    default=self._get_cell_default(cell),
-                    border_color=self._get_cell_border_color(wb, cell),
-                    **asdict(self.__border_style(cell))
-                ))
-        return cells
+                    default=default,
+                    default_error=default_error,
+                )
+
+    def _get_cell_style(self, wb: Workbook, cell: OpenpyxlCell | OpenpyxlMergedCell) -> BuildCellStyle:
+        """Получение стиля ячейки.
+
+        Ячейки с одинаковым стилем ссылаются на один индекс стиля книги,
+        поэтому шрифт, заливка и границы каждого стиля разбираются один раз.
+        """
+        style_id: int = cell.style_id
+        if style_id not in self._cell_styles:
+            fill_color = self.__color_transform(wb, cell.fill.fgColor)
+            font_color = self.__color_transform(wb, cell.font.color)
+
+            # Временная заглушка
+            if (font_color and font_color.index == 1 and cell.fill.patternType is None) or \
+                    (font_color and font_color.index == 1 and fill_color.value == WHITE):
+                font_color.type = 'rgb'
+                font_color.value = '00000000'
+            self._cell_styles[style_id] = BuildCellStyle(
+                editable=not self.readonly_fill_color or fill_color.value == '00000000',
+                border_color=self._get_cell_border_color(wb, cell),
+                style_id=style_id,
+                **asdict(self.__border_style(cell))
+            )
+        return self._cell_styles[style_id]
 
     @staticmethod
     def _parse_merged_cells(ranges: list[OpenpyxlMergedCell]) -> list[BuildMergedCell]:
         """Парсинг объединенных ячеек."""
         return [BuildMergedCell(rng.min_col, rng.min_row, rng.max_col, rng.max_row) for rng in ranges]
 
-    def evaluate_cells(self, sheets: list[BuildSheet]) -> list[BuildSheet]:
+    def evaluate_cells(self, sheets: list[BuildSheet], cells_values: dict[str, str | int]) -> list[BuildSheet]:
         """Предварительно рассчитываем значения ячеек.
 
         Excel не хранит кешированные значения, вместо этого он хранит формулы.
         Нам необходимо рассчитать формулы, однако значения могут быть перекрестными.
-        Поэтому нам необходимо собирать единую структуру и каждый раз формировать модель.
+        Поэтому формулы всех листов компилируются один раз в единую модель и рассчитываются
+        в порядке зависимостей, а разобранные формулы используются и для кеша зависимостей листов.
+        :param sheets: листы с формулами
+        :param cells_values: значения ячеек всех листов по координатам вида Лист!A1
         """
-
-        cells_values: dict[str, str] = {}
-        for sheet in sheets:
-            cells_values.update({
-                self.coordinate(sheet.name, cell.column_id, cell.row_id): cell.default or 0 for cell in sheet.cells
-            })
+        compiled_model = CompiledFormulaModel.compile_sheets({
+            sheet.name: {
+                f'{sheet.name}!{cell_coordinate}': formula for cell_coordinate, formula in sheet.formulas.items()
+            } for sheet in sheets
+        })
+        evaluator = Evaluator(compiled_model.build_model(cells_values))
+        evaluated: dict[str, tuple[str | None, str | None]] = {}
+        for coordinate in compiled_model.order:
+            success, value = evaluate_formula(evaluator, coordinate)
+            evaluated[coordinate] = (value, None) if success else (None, value)
         for sheet in sheets:
-            evaluate_model = ModelCompiler().read_and_parse_dict(cells_values, default_sheet=sheet.name)
-            evaluator = Evaluator(evaluate_model)
-            for cell in sheet.cells:
-                if cell.formula:
-                    coordinate = self.coordinate(sheet.name, cell.column_id, cell.row_id)
-                    success, value = evaluate_formula(evaluator, coordinate)
-                    cell.default = value if success else None
-                    cell.default_error = value if not success else None
-                    # cells_values - для локального пересчета, если все ок - изменяем, если нет, ничего не делаем
-                    if success:
-                        cells_values[coordinate] = cell.default
-                    sheet.cache_container.add_formula(cell.coordinate, cell.formula)
+            for cell_coordinate, formula in sheet.formulas.items():
+                coordinate = f'{sheet.name}!{cell_coordinate}'
+                sheet.evaluated[cell_coordinate] = evaluated[coordinate]
+                sheet.cache_container.add_formula(cell_coordinate, formula, compiled_model.formulae[coordinate].tokens)
         return sheets
 
     @staticmethod
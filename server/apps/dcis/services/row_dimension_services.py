@@ -5,8 +5,13 @@ from django.db import transaction
 from django.db.models import F, Max, Min
 
 from apps.core.models import User
+from apps.dcis.helpers.sheet_unload_cache import (
+    bump_document_version,
+    bump_row_dimension_version,
+    bump_sheet_version,
+)
 from apps.dcis.models import Document, RowDimension, Sheet
-from apps.dcis.models.sheet import Cell, MergedCell
+from apps.dcis.models.sheet import Cell, CellStyle, MergedCell
 from apps.dcis.permissions import (
     can_add_child_row_dimension,
     can_change_child_row_dimension_height,
@@ -36,11 +41,13 @@ def add_row_dimension(
         index=index,
         user=user
     )
+    style = CellStyle.get_or_create_style({})
     cells = [
-        Cell.objects.create(row=row_dimension, column=column, kind=column.kind)
+        Cell.objects.create(row=row_dimension, column=column, kind=column.kind, style=style)
         for column in sheet.columndimension_set.all()
     ]
     move_merged_cells(sheet, index, 1)
+    bump_sheet_version(sheet.id)
     return SheetPartialRowsUploader(
         columns_unloader=SheetColumnsUnloader(sheet.columndimension_set.all()),
         rows=[row_dimension],
@@ -81,12 +88,14 @@ def add_child_row_dimension(
         dynamic=True,
         user=context.user
     )
+    style = CellStyle.get_or_create_style({})
     cells = [
-        Cell.objects.create(row=row_dimension, column=column, kind=column.kind)
+        Cell.objects.create(row=row_dimension, column=column, kind=column.kind, style=style)
         for column in sheet.columndimension_set.all()
     ]
     document.updated_by = user
     document.save(update_fields=('updated_by', 'updated_at'))
+    bump_document_version(document.id)
     return SheetPartialRowsUploader(
         columns_unloader=SheetColumnsUnloader(sheet.columndimension_set.all()),
         rows=[row_dimension],
@@ -110,6 +119,7 @@ def change_row_dimension(
     row_dimension.hidden = hidden
     row_dimension.dynamic = dynamic
     row_dimension.save(update_fields=('height', 'hidden', 'dynamic', 'updated_at'))
+    bump_row_dimension_version(row_dimension)
     return row_dimension
 
 
@@ -124,6 +134,8 @@ def change_row_dimensions_fixed(row_dimensions: list[RowDimension], fixed: bool)
     for row_dimension in change_rows:
         row_dimension.fixed = fixed
     RowDimension.objects.bulk_update(change_rows, ('fixed',))
+    for row_dimension in change_rows:
+        bump_row_dimension_version(row_dimension)
     return list(change_rows)
 
 
@@ -132,6 +144,7 @@ def change_row_dimension_height(user: User, row_dimension: RowDimension, height:
     can_change_child_row_dimension_height(user, row_dimension)
     row_dimension.height = height
     row_dimension.save(update_fields=('height', 'updated_at'))
+    bump_row_dimension_version(row_dimension)
     return row_dimension
 
 
@@ -165,6 +178,7 @@ def delete_row_dimension_base(row_dimension: RowDimension) -> int:
     ).update(index=F('index') - 1)
     if not row_dimension.parent_id:
         move_merged_cells(row_dimension.sheet, row_dimension.index, -1, True)
+    bump_row_dimension_version(row_dimension)
     return row_dimension_id
 
 
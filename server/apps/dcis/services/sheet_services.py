@@ -2,7 +2,8 @@
 
 import re
 from argparse import ArgumentTypeError
-from dataclasses import dataclass
+from collections import defaultdict
+from dataclasses import asdict, dataclass
 from typing import NamedTuple, Sequence
 
 from devind_dictionaries.models import BudgetClassification
@@ -16,8 +17,9 @@ from xlsx_evaluate.tokenizer import ExcelParser, f_token
 
 from apps.core.models import User
 from apps.dcis.helpers.sheet_formula_cache import SheetFormulaContainerCache
+from apps.dcis.helpers.sheet_unload_cache import bump_cells_sheets_versions, bump_sheet_version
 from apps.dcis.models import Period, Sheet, Value
-from apps.dcis.models.sheet import Cell
+from apps.dcis.models.sheet import CELL_STYLE_FIELDS, Cell, CellStyle
 from apps.dcis.permissions import (
     can_add_budget_classification,
     can_change_period_sheet,
@@ -45,7 +47,7 @@ def rename_sheet(user: User, sheet: Sheet, name: str) -> tuple[Sheet, list[Cell]
         formula__istartswith='=',
         row__parent__isnull=True,
         row__sheet__in=[sheet, *period_sheets]
-    ).all()
+    ).select_related('row', 'column').all()
     for cell in cells:
         tokens: list[f_token] = [
             token for token in ExcelParser().parse(cell.formula).items
@@ -60,8 +62,12 @@ def rename_sheet(user: User, sheet: Sheet, name: str) -> tuple[Sheet, list[Cell]
             changed_cell.append(cell)
     sheet.name = name
     sheet.save(update_fields=('name',))
+    sheets_changed_cells: dict[int, list[Cell]] = defaultdict(list)
+    for cell in changed_cell:
+        sheets_changed_cells[cell.row.sheet_id].append(cell)
     for s in Sheet.objects.filter(period=sheet.period):
-        SheetFormulaContainerCache.update(s)
+        SheetFormulaContainerCache.update_formulas(s, sheets_changed_cells[s.id])
+        bump_sheet_version(s.id)
     return sheet, changed_cell
 
 
@@ -150,6 +156,7 @@ def change_cell_default(user: User, cell: Cell, default: str) -> Cell:
     can_change_period_sheet(user, cell.row.sheet.period)
     cell.default = default
     cell.save(update_fields=('default', 'is_template',))
+    bump_sheet_version(cell.row.sheet_id)
     return cell
 
 
@@ -159,6 +166,7 @@ def change_cell_formula(user: User, cell: Cell, formula: str, recalculate: bool)
     old_formula = cell.formula
     cell.formula = translate_formula_ru2en(formula) if formula else None
     cell.save(update_fields=('formula',))
+    bump_sheet_version(cell.row.sheet_id)
     cache_container = SheetFormulaContainerCache.get(cell.row.sheet)
     coordinate = f'{get_column_letter(cell.column.index)}{cell.row.index}'
     if old_formula and cell.formula:
@@ -185,6 +193,7 @@ def check_cells_permissions(user: User, cells: QuerySet[Cell]) -> QuerySet[Cell]
 def change_cells_option(cells: Sequence[Cell], field: str, value: str | int | bool | None) -> list[dict]:
     """Изменение свойств ячеек."""
     result: list[dict] = []
+    styles: dict[str, CellStyle] = {}
     for cell in cells:
         update_fields = [field]
         if field == 'kind' and value == 'fl':
@@ -194,11 +203,17 @@ def change_cells_option(cells: Sequence[Cell], field: str, value: str | int | bo
             for val in values:
                 val.payload = None
                 val.value = 'Нет'
-            Value.objects.bulk_update(values, ('payload', 'value',))
+                val.number = None
+            Value.objects.bulk_update(values, ('payload', 'value', 'number',))
             result.append({'cell_id': cell.id, 'field': 'value', 'value': cell.default})
-        setattr(cell, field, value)
+        if field in CELL_STYLE_FIELDS:
+            cell.set_style({field: value}, styles)
+            update_fields = ['style']
+        else:
+            setattr(cell, field, value)
         cell.save(update_fields=update_fields)
         result.append({'cell_id': cell.id, 'field': camelcase(field), 'value': value})
+    bump_cells_sheets_versions([cell.id for cell in cells])
     return result
 
 
@@ -229,28 +244,17 @@ class CellPasteOptions:
 def paste_into_cells(paste_options: list[CellPasteOptions]) -> list[Cell]:
     """Вставка в ячейки."""
     cells: list[Cell] = []
+    styles: dict[str, CellStyle] = {}
     for paste_option in paste_options:
         cell = paste_option.cell
         cell.default = paste_option.default
         update_fields = ['default']
         if paste_option.style:
-            style = paste_option.style
-            cell.strong = style.strong
-            cell.italic = style.italic
-            cell.underline = style.underline
-            cell.strike = style.strike
-            cell.horizontal_align = style.horizontal_align
-            cell.vertical_align = style.vertical_align
-            cell.size = style.size
-            cell.color = style.color
-            cell.background = style.background
-            update_fields.extend([
-                'strong', 'italic', 'underline',
-                'strike', 'horizontal_align', 'vertical_align',
-                'size', 'color', 'background',
-            ])
+            cell.set_style(asdict(paste_option.style), styles)
+            update_fields.append('style')
         cell.save(update_fields=update_fields)
         cells.append(cell)
+    bump_cells_sheets_versions([cell.id for cell in cells])
     return cells
 
 
@@ -2,6 +2,8 @@
 
 import operator
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
 from dataclasses import dataclass
 from enum import Enum, auto
 from functools import reduce
@@ -9,10 +11,21 @@ from statistics import mean
 from typing import Any, Iterable, Sequence
 
 from django.db.models import Model, Q, QuerySet
-from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils import get_column_letter
 
+from apps.dcis.helpers.sheet_unload_cache import get_sheet_rows, get_sheet_rows_key, set_sheet_rows
 from apps.dcis.models import Document
-from apps.dcis.models.sheet import Cell, ColumnDimension, KindCell, MergedCell, RowDimension, Sheet, Value
+from apps.dcis.models.sheet import (
+    CELL_STYLE_FIELDS,
+    Cell,
+    CellStyle,
+    ColumnDimension,
+    KindCell,
+    MergedCell,
+    RowDimension,
+    Sheet,
+    Value,
+)
 from apps.dcis.permissions import (
     AddChildRowDimensionBase,
     ChangeChildRowDimensionHeightBase,
@@ -118,10 +131,7 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         'formula', 'number_format', 'comment',
         'default', 'default_error', 'mask',
         'tooltip', 'column_id', 'row_id',
-        'horizontal_align', 'vertical_align', 'size',
-        'strong', 'italic', 'strike',
-        'underline', 'color', 'background',
-        'border_style', 'border_color', 'aggregation',
+        'style_id', 'aggregation',
     )
     _values_fields = (
         'document_id', 'column_id', 'row_id', 'value', 'error',
@@ -139,12 +149,23 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
 
     def _unload_raw_cells(self) -> list[dict]:
         """Выгрузка необработанных ячеек листа."""
-        cells = self.unload_raw_data(self.cells, self._cells_fields)
+        cells = self._add_cells_styles(self.unload_raw_data(self.cells, self._cells_fields))
         for cell in cells:
             if cell['formula']:
                 cell['formula'] = translate_formula_en2ru(cell['formula'])
         return cells
 
+    @staticmethod
+    def _add_cells_styles(cells: list[dict]) -> list[dict]:
+        """Добавление свойств общих стилей к ячейкам, каждый стиль загружается один раз."""
+        styles: dict[int, dict] = {}
+        cells_styles = CellStyle.objects.filter(pk__in={cell['style_id'] for cell in cells})
+        for style in cells_styles.values('id', *CELL_STYLE_FIELDS):
+            styles[style.pop('id')] = style
+        for cell in cells:
+            cell.update(styles[cell.pop('style_id')])
+        return cells
+
     def _unload_raw_values(self) -> list[dict]:
         """Выгрузка необработанных значений листа."""
         return self.unload_raw_data(self.values, self._values_fields)
@@ -154,24 +175,36 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         return self.unload_raw_data(self.merged_cells, self._merged_cells_fields, self._merged_cells_properties)
 
     @staticmethod
-    def _create_columns_map(columns: list[dict]) -> dict[dict]:
+    def _create_columns_map(columns: list[dict]) -> dict[int, dict]:
         """Создание структуры для быстрого поиска колонок по id."""
-        return reduce(lambda a, c: {**a, c['id']: c}, columns, {})
+        return {column['id']: column for column in columns}
 
     @staticmethod
-    def _create_merged_cells_map(merged_cells: list[dict]) -> dict[dict]:
+    def _create_rows_cells_map(cells: list[dict]) -> dict[int, list[dict]]:
+        """Создание структуры для быстрого поиска ячеек по идентификатору строки."""
+        rows_cells_map: dict[int, list[dict]] = defaultdict(list)
+        for cell in cells:
+            rows_cells_map[cell['row_id']].append(cell)
+        return rows_cells_map
+
+    @staticmethod
+    def _create_merged_cells_map(merged_cells: list[dict]) -> dict[str, dict]:
         """Создание структуры для быстрого поиска объединенных ячеек по позиции основной ячейки."""
-        return reduce(lambda a, c: {**a, c['target']: c}, merged_cells, {})
+        return {merged_cell['target']: merged_cell for merged_cell in merged_cells}
 
     @staticmethod
-    def _create_merged_cell_positions(merged_cells: list[dict]) -> list[str]:
-        """Создание списка позиций объединенных ячеек."""
-        return reduce(lambda a, c: [*a, *c['cells']], merged_cells, [])
+    def _create_merged_cell_positions(merged_cells: list[dict]) -> dict[str, dict]:
+        """Создание индекса позиций, покрываемых объединенными ячейками."""
+        return {position: merged_cell for merged_cell in merged_cells for position in merged_cell['cells']}
 
     @staticmethod
-    def _create_merged_cell_row_positions(merged_cells: list[dict]) -> list[str]:
-        """Создание списка позиций объединенных ячеек для первой строки."""
-        return reduce(lambda a, c: [*a, *c['cells'][:c['max_col'] - c['min_col'] + 1]], merged_cells, [])
+    def _create_merged_cell_row_positions(merged_cells: list[dict]) -> dict[str, dict]:
+        """Создание индекса позиций, покрываемых первой строкой объединенных ячеек."""
+        return {
+            position: merged_cell
+            for merged_cell in merged_cells
+            for position in merged_cell['cells'][:merged_cell['max_col'] - merged_cell['min_col'] + 1]
+        }
 
     def _prepare_data(self, rows: list[dict], cells: list[dict]) -> None:
         """Подготовка строк и ячеек к выгрузке после сортировки строк."""
@@ -183,29 +216,28 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         merged_cell_positions = self._create_merged_cell_positions(merged_cells)
         merged_cell_row_positions = self._create_merged_cell_row_positions(merged_cells)
         self._add_cells(rows, columns_map, cells)
+        self._add_cells_maps(rows)
         self._add_cell_values(rows, values)
         self._add_cell_properties(rows, columns_map, merged_cells_map)
         self._filter_rows_cells(rows, merged_cells_map, merged_cell_positions, merged_cell_row_positions)
 
-    @classmethod
-    def _connect_rows(cls, rows: list[dict]) -> list[dict]:
+    @staticmethod
+    def _connect_rows(rows: list[dict]) -> list[dict]:
         """Создание деревьев строк."""
+        rows_map: dict[int, dict] = {}
         for row in rows:
             row['parent'] = None
             row['children'] = []
-        trees = [row for row in rows if row['parent_id'] is None]
-        for root in trees:
-            cls._add_children(rows, root)
+            rows_map[row['id']] = row
+        trees: list[dict] = []
+        for row in rows:
+            if row['parent_id'] is None:
+                trees.append(row)
+            elif row['parent_id'] in rows_map:
+                row['parent'] = rows_map[row['parent_id']]
+                row['parent']['children'].append(row)
         return trees
 
-    @classmethod
-    def _add_children(cls, rows: list[dict], row: dict) -> None:
-        """Добавление дочерних строк к строке."""
-        row['children'] = [r for r in rows if r['parent_id'] == row['id']]
-        for child in row['children']:
-            child['parent'] = row
-            cls._add_children(rows, child)
-
     def _flatten_rows(self, rows_tree: list[dict], sort: bool = True) -> list[dict]:
         """Превращение строк в плоскую структуру."""
         result: list[dict] = []
@@ -223,7 +255,7 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
 
     @staticmethod
     @abstractmethod
-    def _add_cells(rows: list[dict], columns_map: dict[dict], cells: list[dict]) -> None:
+    def _add_cells(rows: list[dict], columns_map: dict[int, dict], cells: list[dict]) -> None:
         """Добавление ячеек к строкам."""
         ...
 
@@ -233,8 +265,19 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         """Добавление значений к ячейкам."""
         ...
 
+    @staticmethod
+    def _add_cells_maps(rows: list[dict]) -> None:
+        """Добавление к строкам структуры для быстрого поиска ячеек по идентификатору колонки."""
+        for row in rows:
+            row['cells_map'] = {cell['column_id']: cell for cell in row['cells']}
+
     @classmethod
-    def _add_cell_properties(cls, rows: list[dict], columns_map: dict[dict], merged_cells_map: dict[dict]) -> None:
+    def _add_cell_properties(
+        cls,
+        rows: list[dict],
+        columns_map: dict[int, dict],
+        merged_cells_map: dict[str, dict]
+    ) -> None:
         """Добавление свойств к ячейкам."""
         for row in rows:
             for cell in row['cells']:
@@ -250,7 +293,7 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         cell['global_position'] = f'{column["name"]}{row["global_index"]}'
 
     @classmethod
-    def _add_cell_spans(cls, row: dict, cell: dict, merged_cells_map: dict) -> None:
+    def _add_cell_spans(cls, row: dict, cell: dict, merged_cells_map: dict[str, dict]) -> None:
         """Добавление объединений по колонкам и строкам для ячейки."""
         root_cell = cls._find_root_cell(row, cell)
         merged_cell = merged_cells_map.get(root_cell['position'], None)
@@ -263,7 +306,7 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         cell['related_global_positions'] = []
         for row_offset in range(cell['rowspan']):
             for column_offset in range(cell['colspan']):
-                column_name = get_column_letter(column_index_from_string(column['name']) + column_offset)
+                column_name = get_column_letter(column['index'] + column_offset)
                 row_index = row['global_index'] + row_offset
                 cell['related_global_positions'].append(f'{column_name}{row_index}')
 
@@ -274,21 +317,15 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
         """
         if row['parent'] is None:
             return cell
-        return cls._find_root_cell(
-            row['parent'],
-            next(
-                parent_cell for parent_cell in row['parent']['cells']
-                if parent_cell['column_id'] == cell['column_id']
-            )
-        )
+        return cls._find_root_cell(row['parent'], row['parent']['cells_map'][cell['column_id']])
 
     @classmethod
     def _filter_rows_cells(
         cls,
         rows: list[dict],
-        merged_cells_map: dict,
-        merged_cell_positions: list[str],
-        merged_cell_row_positions: list[str]
+        merged_cells_map: dict[str, dict],
+        merged_cell_positions: dict[str, dict],
+        merged_cell_row_positions: dict[str, dict]
     ) -> None:
         """Удаление лишних ячеек из строк."""
         for row in rows:
@@ -299,7 +336,8 @@ class SheetRowsUnloaderBase(DataUnloader, ABC):
                 if root_cell['position'] in merged_cells_map or root_cell['position'] not in positions:
                     row['output_cells'].append(cell)
         for row in rows:
-            row['cells'] = row['output_cells']
+            row['cells'] = row.pop('output_cells')
+            del row['cells_map']
 
 
 class SheetRowsUnloader(SheetRowsUnloaderBase):
@@ -330,31 +368,45 @@ class SheetRowsUnloader(SheetRowsUnloaderBase):
         """Сортировка строк."""
         return sorted(rows, key=lambda r: r['index'])
 
-    @staticmethod
-    def _add_cells(rows: list[dict], columns_map: dict[dict], cells: list[dict]) -> None:
+    @classmethod
+    def _add_cells(cls, rows: list[dict], columns_map: dict[int, dict], cells: list[dict]) -> None:
         """Добавление ячеек к строкам."""
+        rows_cells_map = cls._create_rows_cells_map(cells)
         for row in rows:
-            row['cells'] = [cell for cell in cells if cell['row_id'] == row['id']]
-            row['cells'].sort(key=lambda cell: columns_map[cell['column_id']]['index'])
+            row['cells'] = sorted(
+                rows_cells_map.get(row['id'], []),
+                key=lambda cell: columns_map[cell['column_id']]['index']
+            )
 
     @staticmethod
     def _add_cell_values(rows: list[dict], values: list[dict]) -> None:
         """Добавление значений к ячейкам."""
+        values_map: dict[tuple[int, int], dict] = {(v['row_id'], v['column_id']): v for v in values}
         for row in rows:
             for cell in row['cells']:
                 val = cell['default']
                 del cell['default']
                 err = cell['default_error']
                 del cell['default_error']
-                value = next(
-                    (v for v in values if v['row_id'] == cell['row_id'] and v['column_id'] == cell['column_id']),
-                    None
-                )
+                value = values_map.get((cell['row_id'], cell['column_id']))
                 if value is not None:
                     val = value['value']
                     err = value['error']
                 cell.update({'value': val, 'error': err})
 
+    @classmethod
+    def apply_values(cls, rows: list[dict], values: QuerySet[Value] | Sequence[Value]) -> list[dict]:
+        """Применение значений к уже выгруженным строкам."""
+        values_map: dict[tuple[int, int], dict] = {
+            (v['row_id'], v['column_id']): v for v in cls.unload_raw_data(values, cls._values_fields)
+        }
+        for row in rows:
+            for cell in row['cells']:
+                value = values_map.get((cell['row_id'], cell['column_id']))
+                if value is not None:
+                    cell.update({'value': value['value'], 'error': value['error']})
+        return rows
+
     @classmethod
     def _add_row_names(cls, rows_tree: list[dict]) -> None:
         """Добавление имен к строкам."""
@@ -388,7 +440,7 @@ class SheetPartialRowsUploader(SheetRowsUnloader):
         cells: QuerySet[Cell] | Sequence[Cell],
         merged_cells: QuerySet[MergedCell] | Sequence[MergedCell],
         values: QuerySet[Value] | Sequence[Value],
-        rows_global_indices_map: dict[dict]
+        rows_global_indices_map: dict[int, int]
     ) -> None:
         super().__init__(
             columns_unloader=columns_unloader,
@@ -414,23 +466,30 @@ class SheetPartialRowsUploader(SheetRowsUnloader):
 
     @classmethod
     def _find_row_parents(cls, rows: list[dict]) -> list[dict]:
-        """Поиск родительских строк."""
-        parent_rows = cls.unload_raw_data(
-            RowDimension.objects.filter(pk__in=[row['parent_id'] for row in rows if row['parent_id'] is not None]),
-            cls._rows_fields
+        """Поиск всех родительских строк одним рекурсивным запросом."""
+        parent_ids = list({row['parent_id'] for row in rows if row['parent_id'] is not None})
+        if not parent_ids:
+            return []
+        table = RowDimension._meta.db_table
+        parent_rows = RowDimension.objects.raw(
+            f'''
+            WITH RECURSIVE row_parents AS (
+                SELECT * FROM {table} WHERE id = ANY(%s)
+                UNION
+                SELECT {table}.* FROM {table} INNER JOIN row_parents ON {table}.id = row_parents.parent_id
+            )
+            SELECT * FROM row_parents WHERE NOT id = ANY(%s)
+            ''',
+            [parent_ids, [row['id'] for row in rows]]
         )
-        unique_parent_rows = [
-            parent_row for parent_row in parent_rows if
-            next((row for row in rows if row['id'] == parent_row['id']), None) is None
-        ]
-        if len(unique_parent_rows):
-            return [*unique_parent_rows, *cls._find_row_parents(unique_parent_rows)]
-        return unique_parent_rows
+        return cls.unload_raw_data(list(parent_rows), cls._rows_fields)
 
     @classmethod
     def _find_rows_cells(cls, rows: list[dict]) -> list[dict]:
         """Поиск ячеек для строк."""
-        return cls.unload_raw_data(Cell.objects.filter(row__id__in=[row['id'] for row in rows]), cls._cells_fields)
+        return cls._add_cells_styles(
+            cls.unload_raw_data(Cell.objects.filter(row__id__in=[row['id'] for row in rows]), cls._cells_fields)
+        )
 
     def _add_global_indices(self, rows: list[dict]) -> None:
         """Добавление индексов в плоской структуре для строк."""
@@ -543,35 +602,31 @@ class SheetReportRowsUnloader(SheetRowsUnloaderBase):
 
     def _sort_rows(self, rows: list[dict]) -> list[dict]:
         """Сортировка строк по документу, а затем по индексу."""
-        return sorted(
-            rows,
-            key=lambda r: (
-                next(
-                    (rd[0] for rd in enumerate(self.report_documents, 1) if r['document_id'] == rd[1].document.id), 0
-                ),
-                r['index']
-            )
-        )
+        documents_order: dict[int, int] = {rd.document.id: i for i, rd in enumerate(self.report_documents, 1)}
+        return sorted(rows, key=lambda r: (documents_order.get(r['document_id'], 0), r['index']))
 
-    @staticmethod
-    def _add_cells(rows: list[dict], columns_map: dict[dict], cells: list[dict]) -> None:
+    @classmethod
+    def _add_cells(cls, rows: list[dict], columns_map: dict[int, dict], cells: list[dict]) -> None:
         """Добавление ячеек к строкам."""
+        rows_cells_map = cls._create_rows_cells_map(cells)
         for row in rows:
-            row['cells'] = [{**cell} for cell in cells if cell['row_id'] == row['id']]
-            row['cells'].sort(key=lambda cell: columns_map[cell['column_id']]['index'])
+            row['cells'] = sorted(
+                ({**cell} for cell in rows_cells_map.get(row['id'], [])),
+                key=lambda cell: columns_map[cell['column_id']]['index']
+            )
 
     def _add_cell_values(self, rows: list[dict], values: list[dict]) -> None:
         """Добавление значений к ячейкам."""
+        values_map: dict[tuple[int, int], list[dict]] = defaultdict(list)
+        for value in values:
+            values_map[(value['row_id'], value['column_id'])].append(value)
         for row in rows:
             for cell in row['cells']:
                 val = cell['default']
                 del cell['default']
                 err = cell['default_error']
                 del cell['default_error']
-                cell_values = [
-                    v for v in values if
-                    v['row_id'] == cell['row_id'] and v['column_id'] == cell['column_id']
-                ]
+                cell_values = values_map.get((cell['row_id'], cell['column_id']), [])
                 if row['parent_id'] is None:
                     if row['document_id'] is not None:
                         value = next((v for v in cell_values if v['document_id'] == row['document_id']), None)
@@ -597,12 +652,15 @@ class SheetReportRowsUnloader(SheetRowsUnloaderBase):
         Расширение заключается в дублировании групп строк с общими ячейками для каждого документа.
         Подстроки разных документов становятся подстроками соответствующей новой строки.
         Необходимость дублировать ту или иную строку определяет словарь `expanded_row_groups`."""
+        rows_map: dict[int, dict] = {}
+        for row in rows:
+            rows_map.setdefault(row['index'], row)
         expended_rows: list[dict] = []
         for i, group in enumerate(self.indices_groups):
             if self.expanded_row_groups[i]:
                 for document_id in (rd.document.id for rd in self.report_documents):
                     for index in group:
-                        row = next(r for r in rows if r['index'] == index)
+                        row = rows_map[index]
                         cloned_row = {
                             **row,
                             'children': [child for child in row['children'] if child['document_id'] == document_id],
@@ -614,7 +672,7 @@ class SheetReportRowsUnloader(SheetRowsUnloaderBase):
                         expended_rows.append(cloned_row)
             else:
                 for index in group:
-                    expended_rows.append(next(r for r in rows if r['index'] == index))
+                    expended_rows.append(rows_map[index])
         return expended_rows
 
     def _add_rows_additional_data(self, rows: list[dict]) -> None:
@@ -687,15 +745,20 @@ class PeriodSheetUnloader(SheetUnloader):
     """Выгрузчик листа для периода."""
 
     def unload_rows(self) -> list[dict] | dict:
-        """Выгрузка строк."""
-        rows = self.sheet.rowdimension_set.filter(parent__isnull=True)
-        return SheetRowsUnloader(
-            columns_unloader=self.columns_unloader,
-            rows=rows,
-            cells=Cell.objects.filter(row__in=[row.id for row in rows]),
-            merged_cells=self.sheet.mergedcell_set.all(),
-            values=Value.objects.none(),
-        ).unload()
+        """Выгрузка строк с учетом кеша структуры листа."""
+        key = get_sheet_rows_key(self.sheet.id)
+        rows = get_sheet_rows(key)
+        if rows is None:
+            rows = self.sheet.rowdimension_set.filter(parent__isnull=True)
+            rows = SheetRowsUnloader(
+                columns_unloader=self.columns_unloader,
+                rows=rows,
+                cells=Cell.objects.filter(row__in=[row.id for row in rows]),
+                merged_cells=self.sheet.mergedcell_set.all(),
+                values=Value.objects.none(),
+            ).unload()
+            set_sheet_rows(key, rows)
+        return rows
 
     def get_permissions(self) -> dict[str, bool]:
         return {
@@ -708,30 +771,155 @@ class PeriodSheetUnloader(SheetUnloader):
 
 
 class DocumentSheetUnloader(SheetUnloader):
-    """Выгрузчик листа с документом."""
+    """Выгрузчик листа с документом.
+
+    Если указан диапазон индексов в плоской структуре, выгружаются только строки из диапазона,
+    их родительские строки и строки, содержащие начало объединений, пересекающих диапазон.
+    """
 
-    def __init__(self, context: Any, sheet: Sheet, document_id: int | str, fields: Sequence[str]) -> None:
+    def __init__(
+        self,
+        context: Any,
+        sheet: Sheet,
+        document_id: int | str,
+        fields: Sequence[str],
+        first_global_index: int | None = None,
+        last_global_index: int | None = None,
+    ) -> None:
         super().__init__(sheet, fields)
         self.document = Document.objects.get(pk=document_id)
+        self.first_global_index = first_global_index
+        self.last_global_index = last_global_index
         self.change_document_sheet = ChangeDocumentSheetBase(context.user, self.document)
         self.change_value = ChangeValueBase(context.user, self.document)
         self.add_child_row_dimension = AddChildRowDimensionBase(context.user, self.document)
         self.change_child_row_dimension_height = ChangeChildRowDimensionHeightBase(context.user, self.document)
         self.delete_child_row_dimension = DeleteChildRowDimensionBase(context.user, self.document)
-
-    def unload_rows(self) -> list[dict] | dict:
-        """Выгрузка строк."""
-        rows = self.sheet.rowdimension_set.filter(
+        self._rows_data: list[dict] | None = None
+        self._rows_global_indices_map: dict[int, int] | None = None
+
+    @property
+    def is_windowed(self) -> bool:
+        """Выгружается ли только диапазон строк."""
+        return self.first_global_index is not None or self.last_global_index is not None
+
+    @property
+    def rows(self) -> QuerySet[RowDimension]:
+        """Строки листа с дочерними строками документа."""
+        return self.sheet.rowdimension_set.filter(
             Q(parent__isnull=True) | Q(parent__isnull=False, document_id=self.document.id)
         )
-        return SheetRowsUnloader(
+
+    @property
+    def rows_data(self) -> list[dict]:
+        """Минимальные данные строк для построения плоской структуры."""
+        if self._rows_data is None:
+            self._rows_data = list(self.rows.values('id', 'parent_id', 'index'))
+        return self._rows_data
+
+    @property
+    def rows_global_indices_map(self) -> dict[int, int]:
+        """Индексы строк в плоской структуре."""
+        if self._rows_global_indices_map is None:
+            self._rows_global_indices_map = self._create_rows_global_indices_map(self.rows_data)
+        return self._rows_global_indices_map
+
+    def unload_data(self) -> list[dict] | dict:
+        """Выгрузка листа с количеством строк в плоской структуре."""
+        sheet = super().unload_data()
+        if 'rows_count' in self.fields:
+            sheet['rows_count'] = len(self.rows_global_indices_map)
+        return sheet
+
+    def unload_rows(self) -> list[dict] | dict:
+        """Выгрузка строк с учетом кеша структуры листа.
+
+        Структура листа берется из кеша, а значения документа применяются при каждом запросе.
+        """
+        key = get_sheet_rows_key(self.sheet.id, self.document.id)
+        rows = get_sheet_rows(key)
+        if self.is_windowed:
+            return self._unload_window_rows(rows)
+        if rows is None:
+            rows = self.rows
+            rows = SheetRowsUnloader(
+                columns_unloader=self.columns_unloader,
+                rows=rows,
+                cells=Cell.objects.filter(row__in=[row.id for row in rows]),
+                merged_cells=self.sheet.mergedcell_set.all(),
+                values=Value.objects.none()
+            ).unload()
+            set_sheet_rows(key, rows)
+        return SheetRowsUnloader.apply_values(rows, self.sheet.value_set.filter(document_id=self.document.id))
+
+    def _unload_window_rows(self, cached_rows: list[dict] | None) -> list[dict]:
+        """Выгрузка строк из диапазона индексов в плоской структуре.
+
+        Если структура листа есть в кеше, строки выбираются из нее, иначе выгружаются только нужные строки.
+        """
+        row_ids = self._find_window_row_ids()
+        values = self.sheet.value_set.filter(document_id=self.document.id, row_id__in=row_ids)
+        if cached_rows is not None:
+            return SheetRowsUnloader.apply_values([row for row in cached_rows if row['id'] in row_ids], values)
+        return SheetPartialRowsUploader(
             columns_unloader=self.columns_unloader,
-            rows=rows,
-            cells=Cell.objects.filter(row__in=[row.id for row in rows]),
+            rows=self.sheet.rowdimension_set.filter(pk__in=row_ids),
+            cells=Cell.objects.filter(row_id__in=row_ids),
             merged_cells=self.sheet.mergedcell_set.all(),
-            values=self.sheet.value_set.filter(document_id=self.document.id)
+            values=values,
+            rows_global_indices_map=self.rows_global_indices_map,
         ).unload()
 
+    def _find_window_row_ids(self) -> set[int]:
+        """Поиск идентификаторов строк, необходимых для отображения диапазона."""
+        first_global_index = self.first_global_index or 1
+        last_global_index = self.last_global_index or len(self.rows_global_indices_map)
+        rows_map: dict[int, dict] = {row['id']: row for row in self.rows_data}
+        row_ids: set[int] = {
+            row_id for row_id, global_index in self.rows_global_indices_map.items()
+            if first_global_index <= global_index <= last_global_index
+        }
+        for row_id in list(row_ids):
+            parent_id = rows_map[row_id]['parent_id']
+            while parent_id is not None and parent_id not in row_ids:
+                row_ids.add(parent_id)
+                parent_id = rows_map[parent_id]['parent_id']
+        root_indices: list[int] = sorted({
+            rows_map[row_id]['index'] for row_id in row_ids if rows_map[row_id]['parent_id'] is None
+        })
+        merged_cells_min_rows: set[int] = {
+            min_row for min_row, max_row in self.sheet.mergedcell_set.values_list('min_row', 'max_row')
+            if self._has_index_in_range(root_indices, min_row, max_row)
+        }
+        row_ids.update(
+            row['id'] for row in rows_map.values()
+            if row['parent_id'] is None and row['index'] in merged_cells_min_rows
+        )
+        return row_ids
+
+    @staticmethod
+    def _has_index_in_range(indices: list[int], min_index: int, max_index: int) -> bool:
+        """Есть ли в отсортированном списке индексов индекс из диапазона."""
+        position = bisect_left(indices, min_index)
+        return position < len(indices) and indices[position] <= max_index
+
+    @staticmethod
+    def _create_rows_global_indices_map(rows: list[dict]) -> dict[int, int]:
+        """Создание индексов строк в плоской структуре.
+
+        Порядок совпадает с порядком строк, выгружаемых `SheetRowsUnloader`.
+        """
+        children_map: dict[int | None, list[dict]] = defaultdict(list)
+        for row in rows:
+            children_map[row['parent_id']].append(row)
+        rows_global_indices_map: dict[int, int] = {}
+        stack: list[dict] = [*reversed(sorted(children_map[None], key=lambda r: r['index']))]
+        while stack:
+            row = stack.pop()
+            rows_global_indices_map[row['id']] = len(rows_global_indices_map) + 1
+            stack.extend(reversed(sorted(children_map[row['id']], key=lambda r: r['index'])))
+        return rows_global_indices_map
+
     def get_permissions(self) -> dict[str, bool]:
         return {
             'can_change': self.change_document_sheet.has_permission,
@@ -1,32 +1,46 @@
 """Файл, содержащий сервисы для изменения значений ячеек."""
 
+from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
 from itertools import groupby, product
 from os import path
 from pathlib import Path
-from typing import Any, Generator, Iterable, cast
+from typing import Any, Callable, Generator, Iterable, cast
 from zipfile import ZipFile
 
 from devind_core.models import File
-from devind_dictionaries.models import Organization
 from django.conf import settings
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, QuerySet
 from django.utils.timezone import now
 
 from apps.core.models import User
+from apps.dcis.helpers.aggregation_queue import (
+    clear_aggregations_pending,
+    get_pending_aggregations,
+    mark_aggregations_pending,
+)
 from apps.dcis.helpers.cell import (
+    CYCLE_ERROR,
+    RecalculationPlan,
     ValueState,
     evaluate_state,
     get_coordinate, get_dependency_cells,
-    resolve_cells,
+    resolve_coordinates,
     resolve_evaluate_state,
+    resolve_values,
 )
 from apps.dcis.helpers.sheet_formula_cache import SheetFormulaContainerCache
-from apps.dcis.models import Cell, Document, Period, RowDimension, Sheet, Value
+from apps.dcis.models import Cell, Document, Period, RelationshipCells, RowDimension, Sheet, Value
+from apps.dcis.models.sheet import get_value_number
 from apps.dcis.permissions import can_view_document
-from apps.dcis.services.aggregation_services import calculate_aggregation_cell
+from apps.dcis.services.aggregation_services import calculate_aggregations
+from apps.dcis.tasks import recalculate_aggregations_task
+
+# Количество ячеек, значения которых забираются одним запросом при массовом изменении
+VALUES_BATCH_SIZE = 1000
 
 
 @dataclass
@@ -43,6 +57,15 @@ class ValueInput:
     value: str
 
 
+@dataclass
+class ValueData:
+    """Значение ячейки для массового создания или обновления."""
+    cell: Cell
+    sheet_id: int | str
+    value: str
+    error: str | None = None
+
+
 @dataclass
 class RecalculationData:
     """Данные для пересчета."""
@@ -73,15 +96,16 @@ def update_or_create_values(
     value_inputs: list[ValueInput],
 ) -> UpdateOrCrateValuesResult:
     """Создание или обновление значений."""
-    recalculations: list[RecalculationData] = []
-    for value_input in value_inputs:
-        value = update_or_create_value(
-            document=document,
-            sheet_id=sheet_id,
-            cell=value_input.cell,
-            value=value_input.value
-        )
-        recalculations.append(RecalculationData(cell=value_input.cell, value=value))
+    values = bulk_update_or_create_values(
+        document=document,
+        values_data=[
+            ValueData(cell=value_input.cell, sheet_id=sheet_id, value=value_input.value)
+            for value_input in value_inputs
+        ],
+    )
+    recalculations: list[RecalculationData] = [
+        RecalculationData(cell=value_input.cell, value=value) for value_input, value in zip(value_inputs, values)
+    ]
     updated_at = now()
     values = recalculate_dependency_cells(
         user=user,
@@ -164,198 +188,573 @@ def update_or_create_value(
     return value
 
 
+def get_document_sheet_values(
+    document: Document,
+    sheet_id: int | str,
+    updated_since: datetime | None = None,
+) -> list[dict]:
+    """Получение значений листа документа без структуры листа.
+
+    Время изменения значения хранится в строке, поэтому при указании `updated_since`
+    возвращаются все значения строк, измененных не раньше этого времени.
+    Значения агрегирующих ячеек, ожидающих отложенного пересчета, отмечаются признаком `pending`.
+    :param document: документ
+    :param sheet_id: идентификатор листа
+    :param updated_since: время, начиная с которого выбираются измененные значения
+    :return: значения в виде [{'row_id': 1, 'column_id': 1, 'value': '1', 'error': None, 'pending': False}]
+    """
+    values = Value.objects.filter(document=document, sheet_id=sheet_id)
+    if updated_since is not None:
+        values = values.filter(row__updated_at__gte=updated_since)
+    aggregation_cells: dict[int, tuple[int, int]] = {
+        cell_id: (row_id, column_id) for cell_id, row_id, column_id in Cell.objects.filter(
+            column__sheet_id=sheet_id,
+            aggregation__isnull=False,
+        ).values_list('id', 'row_id', 'column_id')
+    }
+    pending: set[tuple[int, int]] = {
+        aggregation_cells[cell_id] for cell_id in get_pending_aggregations(document.id, aggregation_cells.keys())
+    }
+    return [
+        {**value, 'pending': (value['row_id'], value['column_id']) in pending}
+        for value in values.values('row_id', 'column_id', 'value', 'error')
+    ]
+
+
+def bulk_update_or_create_values(document: Document, values_data: list[ValueData]) -> list[Value]:
+    """Массовое создание или обновление значений.
+
+    Существующие значения забираются по точным парам строк и колонок частями по `VALUES_BATCH_SIZE` ячеек,
+    после чего изменяются с помощью `bulk_update`, а отсутствующие создаются с помощью `bulk_create`.
+    Возвращаются значения в порядке `values_data`.
+    """
+    if not values_data:
+        return []
+    cells: list[Cell] = list({
+        (value_data.cell.row_id, value_data.cell.column_id): value_data.cell for value_data in values_data
+    }.values())
+    exist_values: dict[tuple[int, int], Value] = {
+        (value.row_id, value.column_id): value
+        for i in range(0, len(cells), VALUES_BATCH_SIZE)
+        for value in resolve_values(document, cells[i:i + VALUES_BATCH_SIZE]).select_related(None)
+    }
+    values: dict[tuple[int, int], Value] = {}
+    for value_data in values_data:
+        key = (value_data.cell.row_id, value_data.cell.column_id)
+        value = values.get(key) or exist_values.get(key)
+        if value is None:
+            value = Value(
+                document=document,
+                sheet_id=value_data.sheet_id,
+                column_id=value_data.cell.column_id,
+                row_id=value_data.cell.row_id,
+            )
+        value.value = value_data.value
+        value.number = get_value_number(value_data.value)
+        value.error = value_data.error
+        values[key] = value
+    updated_values = [value for value in values.values() if value.pk is not None]
+    created_values = [value for value in values.values() if value.pk is None]
+    Value.objects.bulk_update(updated_values, fields=('value', 'number', 'error'))
+    Value.objects.bulk_create(created_values)
+    return [values[(value_data.cell.row_id, value_data.cell.column_id)] for value_data in values_data]
+
+
 def recalculate_dependency_cells(
     user: User,
     document: Document,
     recalculations: list[RecalculationData],
     updated_at: datetime,
+    period_plan: 'PeriodRecalculationPlan | None' = None,
 ) -> list[Value]:
     """Перерасчет зависимых ячеек для документа."""
-    recalculations = [*recalculations]
-    old_recalculations: list[RecalculationData] = []
-    while len(recalculations) != len(old_recalculations):
-        old_recalculations = recalculations
-        recalculations_copy = recalculations
-        recalculations = []
-        for doc, recs in group_by_documents(recalculations_copy, document):
-            recalculations.extend(recalculate_aggregations(doc, recs))
-        recalculations_copy = recalculations
-        recalculations = []
-        for doc, recs in group_by_documents(recalculations_copy, document):
-            recalculations.extend(recalculate_values(doc, recs))
-    values = [recalculation.value for recalculation in recalculations if recalculation.value is not None]
-    RowDimension.objects.filter(pk__in=[val.row_id for val in values]).update(updated_at=updated_at)
+    values = recalculate_dependencies(document, recalculations, updated_at, period_plan)
     Document.objects.filter(pk=document.pk).update(updated_at=updated_at, updated_by=user)
     return values
 
 
+def recalculate_dependencies(
+    document: Document,
+    recalculations: list[RecalculationData],
+    updated_at: datetime,
+    period_plan: 'PeriodRecalculationPlan | None' = None,
+) -> list[Value]:
+    """Перерасчет агрегаций и формул, зависящих от ячеек документа, без изменения самого документа.
+
+    Пересчет повторяется, пока появляются новые изменившиеся ячейки. На каждом шаге обрабатываются
+    только ячейки, появившиеся на предыдущем шаге, а уже пересчитанные ячейки хранятся по документам
+    в словарях с ключом (row_id, column_id) и повторно не пересчитываются.
+    """
+    period_plan = period_plan or PeriodRecalculationPlan(document.period)
+    settled: dict[int, dict[tuple[int, int], RecalculationData]] = defaultdict(dict)
+    pending: list[RecalculationData] = [*recalculations]
+    while pending:
+        aggregated: list[RecalculationData] = []
+        for doc, recs in group_by_documents(pending, document):
+            aggregated.extend(recalculate_aggregations(doc, recs, period_plan))
+        pending = []
+        for doc, recs in group_by_documents(aggregated, document):
+            document_settled = settled[doc.pk]
+            calculated = recalculate_values(doc, recs, period_plan, document_settled)
+            for recalculation in recs:
+                document_settled[(recalculation.cell.row_id, recalculation.cell.column_id)] = recalculation
+            pending.extend(
+                recalculation for recalculation in calculated
+                if (recalculation.cell.row_id, recalculation.cell.column_id) not in document_settled
+            )
+    values = [
+        recalculation.value
+        for document_settled in settled.values()
+        for recalculation in document_settled.values()
+        if recalculation.value is not None
+    ]
+    RowDimension.objects.filter(pk__in=[val.row_id for val in values]).update(updated_at=updated_at)
+    return values
+
+
+def recalculate_pending_aggregations(document: Document, cell_ids: list[int]) -> list[Value]:
+    """Отложенный пересчет агрегирующих ячеек документа и зависящих от них ячеек.
+
+    Пометки ожидания снимаются до пересчета, поэтому изменения дочерних документов
+    во время пересчета ставят в очередь новый пересчет.
+    """
+    clear_aggregations_pending(document.id, cell_ids)
+    cells = Cell.objects.filter(pk__in=cell_ids).select_related('row', 'column', 'column__sheet')
+    return recalculate_dependencies(document, [RecalculationData(cell=cell, value=None) for cell in cells], now())
+
+
 def recalculate_cells(user: User, period: Period, cells: Iterable[Cell]) -> None:
     """Пересчет значений в документах для ячеек периода."""
-    sheets = period.sheet_set.all()
-    sheet_containers = [SheetFormulaContainerCache.get(sheet) for sheet in sheets]
+    recalculate_documents_cells(user, period, period.document_set.all(), get_recalculation_cells(period, cells))
+
+
+def get_recalculation_cells(period: Period, cells: Iterable[Cell]) -> list[str]:
+    """Получение ячеек периода, с которых начинается пересчет значений документов.
+
+    Ячейки вычисляются один раз для периода и используются при пересчете каждого документа.
+    """
+    sheet_containers = [SheetFormulaContainerCache.get(sheet) for sheet in period.sheet_set.all()]
     formula_dependency_cells = get_dependency_cells(sheet_containers, cells)[0]
     aggregation_cells = [get_coordinate(c.column.sheet, c) for c in cells if c.aggregation]
-    dependency_cells = {*formula_dependency_cells, *aggregation_cells}
-    for document in period.document_set.all():
-        recalculations: list[RecalculationData] = []
-        resolved_cells, resolved_values = resolve_cells(sheets, document, dependency_cells)
-        for cell in resolved_cells:
-            value = next((v for v in resolved_values if cell.column == v.column and cell.row == v.row), None)
-            recalculations.append(RecalculationData(cell=cell, value=value))
-        recalculate_dependency_cells(user, document, recalculations, now())
+    return list(dict.fromkeys([*formula_dependency_cells, *aggregation_cells]))
 
 
-def recalculate_all_cells(user: User, period: Period) -> None:
-    """Пересчет значений в документах для всех ячеек периода."""
-    cells = Cell.objects.filter(
+def recalculate_documents_cells(
+    user: User,
+    period: Period,
+    documents: Iterable[Document],
+    dependency_cells: Iterable[str],
+    on_document: Callable[[Document], None] | None = None,
+) -> None:
+    """Пересчет значений документов периода, начиная с ячеек `dependency_cells`.
+
+    План пересчета строится один раз для всех документов, а для каждого документа
+    загружаются только его значения.
+
+    :param on_document: функция, вызываемая после пересчета каждого документа
+    """
+    period_plan = PeriodRecalculationPlan(period)
+    cells = period_plan.resolve_coordinates(dependency_cells)
+    for document in documents:
+        values: dict[tuple[int, int], Value] = {
+            (value.row_id, value.column_id): value for value in resolve_values(document, cells)
+        }
+        recalculations: list[RecalculationData] = [
+            RecalculationData(cell=cell, value=values.get((cell.row_id, cell.column_id))) for cell in cells
+        ]
+        recalculate_dependency_cells(user, document, recalculations, now(), period_plan)
+        if on_document is not None:
+            on_document(document)
+
+
+def get_all_recalculation_cells(period: Period) -> QuerySet[Cell]:
+    """Получение всех ячеек периода с формулами или агрегацией."""
+    return Cell.objects.filter(
         column__sheet__period=period
     ).filter(Q(formula__isnull=False) | Q(aggregation__isnull=False))
+
+
+def recalculate_all_cells(user: User, period: Period) -> None:
+    """Пересчет значений в документах для всех ячеек периода."""
+    cells = get_all_recalculation_cells(period)
     if cells.count():
         recalculate_cells(user, period, cells)
 
 
-def recalculate_aggregations(document: Document, recalculations: list[RecalculationData]) -> list[RecalculationData]:
+def recalculate_aggregations(
+    document: Document,
+    recalculations: list[RecalculationData],
+    period_plan: 'PeriodRecalculationPlan | None' = None,
+) -> list[RecalculationData]:
     """Перерасчет агрегации для ячеек."""
-    period = Period.objects.select_related('project').get(pk=document.period_id)
+    period_plan = period_plan or PeriodRecalculationPlan(document.period)
     # Проверяем, могут ли быть ли дочерние дивизионы, если дивизион не может содержать дочерние, то и агрегации нет
-    if not hasattr(period.project.division, 'parent_id'):
+    if not hasattr(period_plan.period.project.division, 'parent_id'):
         return recalculations
     recalculated = [r for r in recalculations if r.is_aggregation_recalculated]
     to_recalculate = [r for r in recalculations if not r.is_aggregation_recalculated]
-    for recalculation in to_recalculate:
-        recalculated.append(recalculate_aggregation(document, recalculation))
-    recalculated.extend(recalculate_dependency_aggregation(document, to_recalculate))
+    if to_recalculate:
+        propagate = settings.AGGREGATION_PROPAGATION_DELAY is None
+        tree = period_plan.get_aggregation_tree(document.version)
+        recalculated.extend(tree.recalculate(document, to_recalculate, propagate))
     return recalculated
 
 
-def recalculate_aggregation(document: Document, recalculation: RecalculationData) -> RecalculationData:
-    """Расчет агрегации для текущей ячейки."""
-    recalculation.is_aggregation_recalculated = True
-    # Если ячейка не агрегирующая, оставляем `recalculation` как есть.
-    if not recalculation.cell.is_aggregation:
-        return recalculation
-    division_ids = document.period.project.division.objects.filter(
-        parent_id=document.object_id
-    ).values_list('pk', flat=True)
-    if division_ids:
-        # 1. Дочерние дивизионы найдены, значит мы головная организация и необходимо пересчитать агрегацию
-        source_cells = [relation_cell.from_cell for relation_cell in recalculation.cell.to_cells.all()]
-        if source_cells:
-            cells_filter = Q()
-            # 2. Собираем фильтр для значений
-            for source_cell in source_cells:
-                cells_filter |= Q(column_id=source_cell.column_id, row_id=source_cell.row_id)
-            # 3. Собираем фильтр по дивизионам и версии документа
-            children_documents = Document.objects.filter(
-                period=document.period, version=document.version, object_id__in=division_ids
-            ).values_list('pk', flat=True)
-            values_filter = Q()
-            for child_document in children_documents:
-                values_filter |= Q(document=child_document) & cells_filter
-            vals = Value.objects.filter(values_filter)
-            # 4. Добавляем отсутствующие значения
-            values: list[str] = []
-            for child_document, cell in product(children_documents, source_cells):
-                val = next(
-                    (v for v in vals if
-                     v.column_id == cell.column_id and v.row_id == cell.row_id and v.document_id == child_document),
-                    None
-                )
-                if val is not None:
-                    values.append(val.value)
-                else:
-                    values.append(cell.default or '0.0')
-            value = str(calculate_aggregation_cell(recalculation.cell, *values))
-            recalculation.value = update_or_create_value(
-                document=document,
-                sheet_id=cast(int, recalculation.cell.column.sheet_id),
-                cell=recalculation.cell,
-                value=value,
+@dataclass
+class AggregationLevel:
+    """Уровень пересчета агрегации.
+
+        - document_id - документ, в котором пересчитываются агрегирующие ячейки;
+        - children_ids - документы дочерних дивизионов;
+        - cells - агрегирующие ячейки для пересчета.
+    """
+    document_id: int
+    children_ids: list[int]
+    cells: list[Cell]
+
+
+class AggregationTree:
+    """Пересчет агрегации по дереву дивизионов периода.
+
+    Изменение значений документа пересчитывает агрегирующие ячейки самого документа
+    и цепочки его родительских документов. Связи ячеек загружаются только для ячеек уровней пересчета,
+    а дивизионы и документы - только для цепочки родительских дивизионов документа и их дочерних дивизионов.
+    Загруженные данные сохраняются и используются при пересчете следующих документов версии.
+    Значения дочерних документов всех уровней получаются одним запросом, после чего уровни рассчитываются
+    снизу вверх, а результаты каждого уровня используются на следующем без повторного обращения к базе данных.
+
+    При отложенном пересчете рассчитывается только текущий документ, а агрегирующие ячейки
+    родительского документа помечаются как ожидающие и пересчитываются задачей Celery.
+    В этом случае загружаются только дивизион документа и его родительский дивизион.
+    """
+
+    def __init__(self, period: Period, version: int) -> None:
+        self.period = period
+        self.version = version
+        self.sources: dict[int, list[Cell]] = defaultdict(list)
+        self.targets: dict[int, list[Cell]] = defaultdict(list)
+        self.documents: dict[int, int] = {}
+        self.document_objects: dict[int, Document] = {}
+        self.parents: dict[int, int | None] = {}
+        self.children: dict[int, list[int]] = defaultdict(list)
+        # Ячейки, для которых загружены исходные и зависимые агрегирующие ячейки
+        self._loaded_sources: set[int] = set()
+        self._loaded_targets: set[int] = set()
+
+    def recalculate(
+        self,
+        document: Document,
+        recalculations: list[RecalculationData],
+        propagate: bool = True,
+    ) -> list[RecalculationData]:
+        """Пересчет агрегации для изменившихся ячеек документа и родительских документов.
+
+        :param document: документ, в котором изменились ячейки
+        :param recalculations: изменившиеся ячейки документа
+        :param propagate: пересчитывать ли родительские документы сразу, иначе пересчет откладывается
+        """
+        for recalculation in recalculations:
+            recalculation.is_aggregation_recalculated = True
+        levels = self._get_levels(document, [r.cell for r in recalculations], propagate)
+        if not propagate:
+            parent_level = next((level for level in levels if level.document_id != document.pk), None)
+            if parent_level is not None:
+                self._defer_level(parent_level)
+            levels = [level for level in levels if level.document_id == document.pk]
+        values = self._get_values(levels)
+        results: dict[tuple[int, int, int], Value] = {}
+        for level in levels:
+            level_document = document if level.document_id == document.pk else self.document_objects[level.document_id]
+            for value in self._recalculate_level(level_document, level, values):
+                values[(value.document_id, value.row_id, value.column_id)] = value.number
+                results[(value.document_id, value.row_id, value.column_id)] = value
+        for recalculation in recalculations:
+            recalculation.value = results.get(
+                (document.pk, recalculation.cell.row_id, recalculation.cell.column_id),
+                recalculation.value,
             )
-    return recalculation
-
-
-def recalculate_dependency_aggregation(
+        parents_recalculations: list[RecalculationData] = [
+            RecalculationData(
+                cell=cell,
+                value=results[(level.document_id, cell.row_id, cell.column_id)],
+                is_aggregation_recalculated=True,
+            )
+            for level in levels if level.document_id != document.pk for cell in level.cells
+        ]
+        return [*recalculations, *parents_recalculations]
+
+    def _get_levels(self, document: Document, cells: list[Cell], propagate: bool = True) -> list[AggregationLevel]:
+        """Получение уровней пересчета от документа до корня дерева дивизионов.
+
+        :param propagate: получать ли все родительские уровни, иначе только уровень родительского документа
+        """
+        division_id = document.object_id
+        self._load_divisions(document, None if propagate else 2)
+        self._load_sources([cell for cell in cells if cell.is_aggregation])
+        levels = [AggregationLevel(
+            document_id=document.pk,
+            children_ids=self.children.get(division_id, []),
+            cells=[cell for cell in cells if cell.is_aggregation and self.sources.get(cell.id)],
+        )]
+        while (parent_id := self.parents.get(division_id)) in self.documents:
+            self._load_targets(cells)
+            cells = list({target.id: target for cell in cells for target in self.targets.get(cell.id, [])}.values())
+            if not cells:
+                break
+            self._load_sources(cells)
+            levels.append(AggregationLevel(
+                document_id=self.documents[parent_id],
+                children_ids=self.children[parent_id],
+                cells=cells,
+            ))
+            if not propagate:
+                break
+            division_id = parent_id
+        return [level for level in levels if level.children_ids and level.cells]
+
+    def _load_divisions(self, document: Document, depth: int | None = None) -> None:
+        """Загрузка цепочки родительских дивизионов документа, их документов и документов дочерних дивизионов.
+
+        :param depth: количество дивизионов цепочки, начиная с дивизиона документа, None - до корня дерева
+        """
+        division_model = self.period.project.division
+        self.documents[document.object_id] = document.pk
+        self.document_objects[document.pk] = document
+        chain: list[int] = []
+        division_id: int | None = document.object_id
+        walked = 0
+        while division_id is not None and (depth is None or walked < depth):
+            if division_id not in self.parents:
+                self.parents[division_id] = division_model.objects.filter(
+                    pk=division_id
+                ).values_list('parent_id', flat=True).first()
+                chain.append(division_id)
+            division_id = self.parents[division_id]
+            walked += 1
+        if not chain:
+            return
+        documents = Document.objects.filter(period=self.period, version=self.version)
+        for chain_document in documents.filter(object_id__in=chain).exclude(pk=document.pk):
+            self.documents[chain_document.object_id] = chain_document.pk
+            self.document_objects[chain_document.pk] = chain_document
+        children: list[tuple[int, int]] = list(
+            division_model.objects.filter(parent_id__in=chain).values_list('pk', 'parent_id')
+        )
+        children_documents: dict[int, int] = dict(
+            documents.filter(object_id__in=[pk for pk, _ in children]).values_list('object_id', 'pk')
+        )
+        for child_id, parent_id in children:
+            if child_id in children_documents:
+                self.children[parent_id].append(children_documents[child_id])
+
+    def _load_sources(self, cells: Iterable[Cell]) -> None:
+        """Загрузка исходных ячеек для агрегирующих ячеек."""
+        cell_ids = {cell.id for cell in cells} - self._loaded_sources
+        if not cell_ids:
+            return
+        for relation in RelationshipCells.objects.filter(to_cell_id__in=cell_ids).select_related('from_cell'):
+            self.sources[relation.to_cell_id].append(relation.from_cell)
+        self._loaded_sources.update(cell_ids)
+
+    def _load_targets(self, cells: Iterable[Cell]) -> None:
+        """Загрузка агрегирующих ячеек, зависящих от ячеек."""
+        cell_ids = {cell.id for cell in cells} - self._loaded_targets
+        if not cell_ids:
+            return
+        for relation in RelationshipCells.objects.filter(from_cell_id__in=cell_ids).select_related(
+            'to_cell__row', 'to_cell__column__sheet'
+        ):
+            self.targets[relation.from_cell_id].append(relation.to_cell)
+        self._loaded_targets.update(cell_ids)
+
+    @staticmethod
+    def _defer_level(level: AggregationLevel) -> None:
+        """Отложенный пересчет уровня после фиксации транзакции.
+
+        Задача ставится в очередь только для ячеек, которые еще не ожидают пересчета.
+        Если задачу не удалось поставить в очередь, пометки ожидания снимаются,
+        чтобы следующие изменения снова поставили задачу.
+        """
+        document_id = level.document_id
+        cell_ids = [cell.id for cell in level.cells]
+
+        def defer() -> None:
+            pending_cell_ids = mark_aggregations_pending(document_id, cell_ids)
+            if not pending_cell_ids:
+                return
+            try:
+                recalculate_aggregations_task.apply_async(
+                    (document_id, pending_cell_ids),
+                    countdown=settings.AGGREGATION_PROPAGATION_DELAY,
+                )
+            except Exception:
+                clear_aggregations_pending(document_id, pending_cell_ids)
+                raise
+
+        transaction.on_commit(defer)
+
+    def _get_values(self, levels: list[AggregationLevel]) -> dict[tuple[int, int, int], float | None]:
+        """Получение числовых значений исходных ячеек дочерних документов всех уровней одним запросом."""
+        sources = [source for level in levels for cell in level.cells for source in self.sources[cell.id]]
+        values = Value.objects.filter(
+            document_id__in={document_id for level in levels for document_id in level.children_ids},
+            row_id__in={source.row_id for source in sources},
+            column_id__in={source.column_id for source in sources},
+        ).values_list('document_id', 'row_id', 'column_id', 'number')
+        return {(document_id, row_id, column_id): number for document_id, row_id, column_id, number in values}
+
+    def _recalculate_level(
+        self,
+        document: Document,
+        level: AggregationLevel,
+        values: dict[tuple[int, int, int], float | None],
+    ) -> list[Value]:
+        """Расчет агрегирующих ячеек уровня по значениям дочерних документов.
+
+        Отсутствующие значения заменяются значением по умолчанию исходной ячейки.
+        """
+        groups: list[int] = []
+        raw_values: list[float | str | None] = []
+        for group, cell in enumerate(level.cells):
+            for child_id, source in product(level.children_ids, self.sources[cell.id]):
+                groups.append(group)
+                raw_values.append(values.get((child_id, source.row_id, source.column_id), source.default or '0.0'))
+        results = calculate_aggregations([cell.aggregation for cell in level.cells], groups, raw_values)
+        return bulk_update_or_create_values(document, [
+            ValueData(cell=cell, sheet_id=cell.column.sheet_id, value=str(result))
+            for cell, result in zip(level.cells, results)
+        ])
+
+
+class PeriodRecalculationPlan:
+    """План пересчета значений документов периода.
+
+    Все, что не зависит от документа, строится один раз и используется для каждого документа:
+    контейнеры зависимостей формул листов, планы пересчета формул вместе с разрешенными ячейками
+    и данные дерева дивизионов для агрегации. Скомпилированные формулы листов берутся из кеша
+    моделей `get_compiled_formula_model`. Для каждого документа загружаются только его значения.
+    """
+
+    def __init__(self, period: Period) -> None:
+        self.period = period
+        self.sheets: list[Sheet] = list(period.sheet_set.all())
+        self._document_sheets: dict[int, list[Sheet]] = {}
+        self._sheet_containers: dict[int, SheetFormulaContainerCache] = {}
+        self._formula_plans: dict[tuple[tuple[int, ...], frozenset[str]], tuple[RecalculationPlan, list[Cell]]] = {}
+        self._aggregation_trees: dict[int, AggregationTree] = {}
+
+    def resolve_coordinates(self, cells: Iterable[str]) -> list[Cell]:
+        """Получение ячеек периода по координатам."""
+        return list(resolve_coordinates(self.sheets, cells))
+
+    def get_document_sheets(self, document: Document) -> list[Sheet]:
+        """Получение листов документа."""
+        if document.pk not in self._document_sheets:
+            self._document_sheets[document.pk] = list(document.sheets.all())
+        return self._document_sheets[document.pk]
+
+    def get_sheet_containers(self, sheets: list[Sheet]) -> list[SheetFormulaContainerCache]:
+        """Получение контейнеров зависимостей формул листов."""
+        for sheet in sheets:
+            if sheet.pk not in self._sheet_containers:
+                self._sheet_containers[sheet.pk] = SheetFormulaContainerCache.get(sheet)
+        return [self._sheet_containers[sheet.pk] for sheet in sheets]
+
+    def get_formula_plan(self, sheets: list[Sheet], cells: Iterable[Cell]) -> tuple[RecalculationPlan, list[Cell]]:
+        """Получение плана пересчета формул для изменившихся ячеек и ячеек, нужных для расчета."""
+        coordinates = frozenset(get_coordinate(cell.column.sheet, cell) for cell in cells)
+        key = (tuple(sheet.pk for sheet in sheets), coordinates)
+        if key not in self._formula_plans:
+            plan = RecalculationPlan.build(self.get_sheet_containers(sheets), sorted(coordinates))
+            resolved_cells = list(resolve_coordinates(
+                sheets,
+                {*plan.dependency_cells, *plan.inversion_cells}
+            )) if plan.inversion_cells else []
+            self._formula_plans[key] = (plan, resolved_cells)
+        return self._formula_plans[key]
+
+    def get_aggregation_tree(self, version: int) -> AggregationTree:
+        """Получение дерева агрегации для версии документов."""
+        if version not in self._aggregation_trees:
+            self._aggregation_trees[version] = AggregationTree(self.period, version)
+        return self._aggregation_trees[version]
+
+
+def recalculate_values(
     document: Document,
     recalculations: list[RecalculationData],
+    period_plan: PeriodRecalculationPlan | None = None,
+    settled: dict[tuple[int, int], RecalculationData] | None = None,
 ) -> list[RecalculationData]:
-    """Расчет агрегации для ячеек, которые зависят от текущих."""
-    division: Organization = document.period.project.division.objects.get(pk=document.object_id)
-    parent_document: Document | None = Document.objects.filter(
-        period=document.period,
-        version=document.version,
-        object_id=division.parent_id
-    ).first()
-    if parent_document is None:
-        return []
-    target_cells = set()
-    for recalculation in recalculations:
-        target_cells.update(relation_cell.to_cell for relation_cell in recalculation.cell.from_cells.all())
-    to_recalculate_data: list[RecalculationData] = []
-    for target_cell in target_cells:
-        target_value: Value | None = Value.objects.filter(
-            document=parent_document,
-            column_id=target_cell.column_id,
-            row_id=target_cell.row_id
-        ).first()
-        if target_value is None:
-            target_value = update_or_create_value(
-                document=parent_document,
-                sheet_id=target_cell.column.sheet_id,
-                cell=target_cell,
-                value='0.0',
-            )
-        to_recalculate_data.append(RecalculationData(cell=target_cell, value=target_value))
-    return recalculate_aggregations(parent_document, to_recalculate_data)
+    """Пересчитываем значения ячеек в зависимости от новых.
 
-
-def recalculate_values(document: Document, recalculations: list[RecalculationData]) -> list[RecalculationData]:
-    """Пересчитываем значения ячеек в зависимости от новых."""
-    sheets: list[Sheet] = document.sheets.all()
-    sheet_containers: list[SheetFormulaContainerCache] = [SheetFormulaContainerCache.get(sheet) for sheet in sheets]
+    :param settled: уже пересчитанные ячейки документа с ключом (row_id, column_id), которые не изменяются
+    """
+    period_plan = period_plan or PeriodRecalculationPlan(document.period)
+    sheets: list[Sheet] = period_plan.get_document_sheets(document)
     # 1. Собираем зависимости и последовательность операций
-    dependency_cells, inversion_cells, sequence_evaluate = get_dependency_cells(
-        sheet_containers,
+    plan, resolved_cells = period_plan.get_formula_plan(
+        sheets,
         [r.cell for r in recalculations if r.cell.formula is None]
     )
+    inversion_cells: set[str] = set(plan.inversion_cells)
     # 1.1 Если у нас нет ячеек необходимых для пересчета, возвращаем изначальные значения
     if not inversion_cells:
         return recalculations
-    # 2. Получаем связанные ячейки и значения из базы данных
-    resolved_cells, resolved_values = resolve_cells(sheets, document, {*dependency_cells, *inversion_cells})
+    # 2. Получаем значения документа для связанных ячеек из базы данных
+    resolved_values = resolve_values(document, resolved_cells)
     # 3. Строим изначальное состояние всех значений
-    state: dict[str, ValueState] = resolve_evaluate_state(resolved_cells, resolved_values, inversion_cells)
-    # 4. Рассчитываем значения
-    evaluate_result: dict[str, ValueState] = evaluate_state(state, sequence_evaluate)
-    # 5. Сохраняем значения
-    result_recalculations: list[RecalculationData] = []
+    state: dict[str, ValueState] = resolve_evaluate_state(resolved_cells, resolved_values, plan.inversion_cells)
+    # 4. Рассчитываем значения, ячейки циклических ссылок получают ошибку
+    evaluate_result: dict[str, ValueState] = evaluate_state(state, plan.sequence_evaluate)
+    for cycle in plan.cycles:
+        for cell_name in cycle:
+            if cell_name in evaluate_result:
+                evaluate_result[cell_name].update({'value': '', 'error': CYCLE_ERROR})
+    # 5. Сохраняем только изменившиеся значения, неизменившиеся не записываются и не возвращаются
+    stored_values: dict[tuple[int, int], Value] = {(value.row_id, value.column_id): value for value in resolved_values}
+    exist_recalculations_map: dict[tuple[int, int], RecalculationData] = {}
+    for recalculation in recalculations:
+        exist_recalculations_map.setdefault((recalculation.cell.row_id, recalculation.cell.column_id), recalculation)
+    exist_recalculations_map = {**(settled or {}), **exist_recalculations_map}
+    values_data: list[ValueData] = []
+    exist_recalculations: list[RecalculationData | None] = []
     for cell_name, result_value in evaluate_result.items():
         cell = result_value['cell']
-        exist_recalculation = next((
-            recalculation for recalculation in recalculations if
-            cell.column_id == recalculation.cell.column_id and
-            cell.row_id == recalculation.cell.row_id
-        ), None)
+        exist_recalculation = exist_recalculations_map.get((cell.row_id, cell.column_id))
         if (
             result_value['value'] is None or
             cell_name not in inversion_cells or
-            (exist_recalculation is not None and exist_recalculation.value is not None)
+            (exist_recalculation is not None and exist_recalculation.value is not None) or
+            is_value_unchanged(stored_values.get((cell.row_id, cell.column_id)), result_value)
         ):
             continue
-        value = update_or_create_value(
-            document=document,
-            sheet_id=cast(int, cell.column.sheet_id),
+        values_data.append(ValueData(
             cell=cell,
+            sheet_id=cast(int, cell.column.sheet_id),
             value=result_value['value'],
             error=result_value['error'],
-        )
+        ))
+        exist_recalculations.append(exist_recalculation)
+    values = bulk_update_or_create_values(document=document, values_data=values_data)
+    result_recalculations: list[RecalculationData] = []
+    for value_data, exist_recalculation, value in zip(values_data, exist_recalculations, values):
         if exist_recalculation is None:
-            result_recalculations.append(RecalculationData(cell=cell, value=value))
+            result_recalculations.append(RecalculationData(cell=value_data.cell, value=value))
         else:
             exist_recalculation.value = value
     return [*recalculations, *result_recalculations]
 
 
+def is_value_unchanged(value: Value | None, value_state: ValueState) -> bool:
+    """Совпадает ли рассчитанное значение с сохраненным."""
+    return (
+        value is not None and
+        value.value == str(value_state['value']) and
+        value.error == value_state['error']
+    )
+
+
 def group_by_documents(
     recalculations: list[RecalculationData],
     document: Document
@@ -1,25 +1,122 @@
 """Задачи Celery."""
 
+from celery import chord
+from django.core.exceptions import ObjectDoesNotExist
+
 from apps.core.models import User
-from apps.dcis.models import Cell, Period
+from apps.dcis.helpers.aggregation_queue import clear_aggregations_pending, refresh_aggregations_pending
+from apps.dcis.helpers.recalculation_progress import (
+    STATUS_FAILED,
+    add_recalculation_progress,
+    finish_recalculation_progress,
+    start_recalculation_progress,
+)
+from apps.dcis.models import Cell, Document, Period
 from devind.celery import app
 
+# Количество документов, пересчитываемых одной задачей
+RECALCULATION_CHUNK_SIZE = 50
+# Количество повторов задачи отложенного пересчета агрегации при ошибке
+AGGREGATION_TASK_MAX_RETRIES = 3
+# Задержка первого повтора задачи отложенного пересчета агрегации в секундах, удваивается при каждом повторе
+AGGREGATION_TASK_RETRY_DELAY = 5
+
 
 @app.task
 def recalculate_cell_task(user_id: int, cell_id: int) -> None:
     """Задача пересчета значений в документах для ячейки."""
-    from apps.dcis.services.value_services import recalculate_cells
+    from apps.dcis.services.value_services import get_recalculation_cells
 
-    user = User.objects.get(id=user_id)
     cell = Cell.objects.get(id=cell_id)
-    recalculate_cells(user, cell.column.sheet.period, (cell,))
+    period = cell.column.sheet.period
+    recalculate_period_documents(user_id, period, get_recalculation_cells(period, (cell,)))
 
 
 @app.task
 def recalculate_all_cells_task(user_id: int, period_id: int) -> None:
     """Задача пересчета значений в документах для всех ячеек периода."""
-    from apps.dcis.services.value_services import recalculate_all_cells
+    from apps.dcis.services.value_services import get_all_recalculation_cells, get_recalculation_cells
+
+    period = Period.objects.get(id=period_id)
+    cells = get_all_recalculation_cells(period)
+    recalculate_period_documents(user_id, period, get_recalculation_cells(period, cells) if cells.count() else [])
+
+
+def recalculate_period_documents(user_id: int, period: Period, dependency_cells: list[str]) -> None:
+    """Параллельный пересчет значений документов периода.
+
+    Ячейки, с которых начинается пересчет, вычисляются один раз и передаются каждой части,
+    а части по `RECALCULATION_CHUNK_SIZE` документов выполняются группой задач.
+    """
+    document_ids = list(period.document_set.values_list('id', flat=True)) if dependency_cells else []
+    run_id = start_recalculation_progress(period.id, len(document_ids))
+    if not document_ids:
+        finish_recalculation_progress(period.id, run_id)
+        return
+    chord(
+        recalculate_documents_task.si(
+            user_id,
+            period.id,
+            run_id,
+            document_ids[i:i + RECALCULATION_CHUNK_SIZE],
+            dependency_cells,
+        ) for i in range(0, len(document_ids), RECALCULATION_CHUNK_SIZE)
+    )(finish_recalculation_task.si(period.id, run_id))
+
+
+@app.task
+def recalculate_documents_task(
+    user_id: int,
+    period_id: int,
+    run_id: str,
+    document_ids: list[int],
+    dependency_cells: list[str],
+) -> None:
+    """Задача пересчета значений части документов периода.
+
+    План пересчета строится один раз для всей части, а ход пересчета увеличивается после каждого документа.
+    """
+    from apps.dcis.services.value_services import recalculate_documents_cells
 
     user = User.objects.get(id=user_id)
     period = Period.objects.get(id=period_id)
-    recalculate_all_cells(user, period)
+    try:
+        recalculate_documents_cells(
+            user,
+            period,
+            Document.objects.filter(pk__in=document_ids),
+            dependency_cells,
+            lambda document: add_recalculation_progress(period_id, run_id),
+        )
+    except Exception:
+        finish_recalculation_progress(period_id, run_id, STATUS_FAILED)
+        raise
+
+
+@app.task
+def finish_recalculation_task(period_id: int, run_id: str) -> None:
+    """Задача завершения пересчета значений документов периода."""
+    finish_recalculation_progress(period_id, run_id)
+
+
+@app.task(bind=True, acks_late=True, max_retries=AGGREGATION_TASK_MAX_RETRIES)
+def recalculate_aggregations_task(self, document_id: int, cell_ids: list[int]) -> None:
+    """Задача отложенного пересчета агрегирующих ячеек документа.
+
+    Задача подтверждается после выполнения, поэтому при остановке исполнителя она выполняется повторно,
+    а при ошибке повторяется с увеличивающейся задержкой, восстанавливая пометки ожидания пересчета.
+    Удаленные документы и ячейки не пересчитываются повторно.
+    """
+    from apps.dcis.services.value_services import recalculate_pending_aggregations
+
+    try:
+        recalculate_pending_aggregations(Document.objects.get(id=document_id), cell_ids)
+    except ObjectDoesNotExist:
+        clear_aggregations_pending(document_id, cell_ids)
+        raise
+    except Exception as error:
+        if self.request.retries >= self.max_retries:
+            raise
+        countdown = AGGREGATION_TASK_RETRY_DELAY * 2 ** self.request.retries
+        refresh_aggregations_pending(document_id, cell_ids, countdown)
+        raise self.retry(exc=error, countdown=countdown)
@@ -1,11 +1,20 @@
 from .helpers import (
     CellHelpersTestCase,
+    CompiledFormulaModelTestCase,
+    FormulaCacheCodecTestCase,
     OrderedDjangoFilterConnectionFieldTestCase,
+    PeriodRecalculationQueryTestCase,
+    RecalculationProgressTestCase,
+    SheetCellIndexTestCase,
+    SheetFormulaContainerCacheTestCase,
+    SheetUnloadCacheTestCase,
 )
 from .models import (
+    CellStyleModelTestCase,
     DocumentModelTestCase,
     DocumentStatusModelTestCase,
     ProjectModelTestCase,
+    ValueModelTestCase,
 )
 from .ordering import DocumentOrderedDjangoFilterConnectionFieldTestCase
 from .permissions import (
@@ -24,6 +33,7 @@ from .services import (
     CuratorGroupTestCase,
     DivisionTestCase,
     DocumentMessageTestCase,
+    DocumentSheetUnloaderTestCase,
     DocumentTestCase,
     GetUserDocumentsTestCase,
     GetUserPeriodsTestCase,
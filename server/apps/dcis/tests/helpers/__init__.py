@@ -1,2 +1,8 @@
 from .cell import CellHelpersTestCase
+from .formula_cache_codec import FormulaCacheCodecTestCase
+from .formula_model import CompiledFormulaModelTestCase
 from .ordering import OrderedDjangoFilterConnectionFieldTestCase
+from .recalculation_progress import PeriodRecalculationQueryTestCase, RecalculationProgressTestCase
+from .sheet_cell_index import SheetCellIndexTestCase
+from .sheet_formula_cache import SheetFormulaContainerCacheTestCase
+from .sheet_unload_cache import SheetUnloadCacheTestCase
@@ -3,7 +3,8 @@
 from django.test import TestCase
 from xlsx_evaluate import Evaluator, ModelCompiler
 
-from apps.dcis.helpers.cell import evaluate_formula
+from apps.dcis.helpers.cell import RecalculationPlan, evaluate_formula
+from apps.dcis.helpers.sheet_formula_cache import SheetFormulaContainerCache
 
 
 class CellHelpersTestCase(TestCase):
@@ -22,3 +23,36 @@ class CellHelpersTestCase(TestCase):
         self.assertEqual((False, 'Деление на 0'), evaluate_formula(evaluator, 'sheet1!A2'))
         self.assertEqual((False, 'Циклическая ссылка'), evaluate_formula(evaluator, 'sheet1!A3'))
         self.assertEqual((True, '4'), evaluate_formula(evaluator, 'sheet1!A4'))
+
+    def test_recalculation_plan(self) -> None:
+        """Тестирование построения плана пересчета."""
+        form1 = SheetFormulaContainerCache('Форма1')
+        form1.add_formula('B1', '=A1 * 2')
+        form1.add_formula('C1', '=B1 + Форма2!A1')
+        form2 = SheetFormulaContainerCache('Форма2')
+        form2.add_formula('A1', '=Форма1!B1')
+        form2.add_formula('B1', '=Форма1!C1')
+        plan = RecalculationPlan.build([form1, form2], ['Форма1!A1'])
+        self.assertEqual(['Форма1!B1', 'Форма2!A1', 'Форма1!C1', 'Форма2!B1'], plan.inversion_cells)
+        self.assertEqual(['Форма1', 'Форма2', 'Форма1', 'Форма2'], plan.sequence_evaluate)
+        self.assertEqual({'Форма1!A1', 'Форма1!B1', 'Форма2!A1', 'Форма1!C1'}, set(plan.dependency_cells))
+        self.assertEqual([], plan.cycles)
+
+    def test_recalculation_plan_cycle(self) -> None:
+        """Тестирование построения плана пересчета с циклической ссылкой между листами."""
+        form1 = SheetFormulaContainerCache('Форма1')
+        form1.add_formula('B1', '=A1 + Форма2!B1')
+        form2 = SheetFormulaContainerCache('Форма2')
+        form2.add_formula('B1', '=Форма1!B1')
+        plan = RecalculationPlan.build([form1, form2], ['Форма1!A1'])
+        self.assertEqual({'Форма1!B1', 'Форма2!B1'}, set(plan.inversion_cells))
+        self.assertEqual([['Форма2!B1', 'Форма1!B1']], plan.cycles)
+
+    def test_recalculation_plan_self_cycle(self) -> None:
+        """Тестирование построения плана пересчета с ячейкой, ссылающейся на саму себя."""
+        form1 = SheetFormulaContainerCache('Форма1')
+        form1.add_formula('A1', '=A1 + 1')
+        form1.add_formula('B1', '=A1 * 2')
+        plan = RecalculationPlan.build([form1], ['Форма1!A1'])
+        self.assertEqual(['Форма1!A1', 'Форма1!B1'], plan.inversion_cells)
+        self.assertEqual([['Форма1!A1']], plan.cycles)
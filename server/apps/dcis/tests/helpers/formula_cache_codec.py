@@ -0,0 +1,37 @@
+"""Тестирование модуля компактного кодирования зависимостей формул."""
+
+from collections import Counter
+
+from django.test import TestCase
+
+from apps.dcis.helpers.formula_cache_codec import (
+    FORMAT_VERSION,
+    decode_coordinates,
+    decode_counter,
+    encode_coordinates,
+    encode_counter,
+)
+
+
+class FormulaCacheCodecTestCase(TestCase):
+    """Тестирование кодирования зависимостей формул."""
+
+    def test_coordinates(self) -> None:
+        """Тестирование кодирования координат."""
+        coordinates = ['B2', 'A1', 'Форма №2!XFD1048576', 'Форма №2!A1', 'A1:B2']
+        encoded = encode_coordinates(coordinates)
+        self.assertEqual(FORMAT_VERSION, encoded[0])
+        self.assertEqual(('Форма №2', 'A1:B2'), encoded[1])
+        self.assertEqual(coordinates, decode_coordinates(encoded))
+
+    def test_counter(self) -> None:
+        """Тестирование кодирования частотной зависимости."""
+        for counter in (Counter(), Counter(['A1', 'B1']), Counter(['A1', 'Лист2!A1', 'A1'])):
+            self.assertEqual(counter, decode_counter(encode_counter(counter)))
+        self.assertEqual(b'', encode_counter(Counter(['A1', 'B1']))[3])
+
+    def test_version(self) -> None:
+        """Тестирование декодирования данных другой версии формата."""
+        _, table, packed, counts = encode_coordinates(['A1'])
+        with self.assertRaises(ValueError):
+            decode_coordinates((FORMAT_VERSION + 1, table, packed, counts))
@@ -0,0 +1,52 @@
+"""Тестирование модуля скомпилированных моделей формул листа."""
+
+from django.test import TestCase
+from xlsx_evaluate import Evaluator
+
+from apps.dcis.helpers.formula_model import (
+    CompiledFormulaModel,
+    clear_compiled_formula_models,
+    get_compiled_formula_model,
+)
+
+
+class CompiledFormulaModelTestCase(TestCase):
+    """Тестирование класса `CompiledFormulaModel`."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        clear_compiled_formula_models()
+        self.formulas = {
+            'Лист1!D1': '=C1 * 2',
+            'Лист1!E1': '=D1 + Лист2!A1',
+            'Лист1!C1': '=SUM(A1:B1)',
+        }
+
+    def test_compile(self) -> None:
+        """Тестирование метода `compile`."""
+        model = CompiledFormulaModel.compile('Лист1', self.formulas)
+        self.assertEqual(('Лист1!C1', 'Лист1!D1', 'Лист1!E1'), model.order)
+        self.assertEqual({'Лист1!A1', 'Лист1!B1'}, model.range_cells)
+
+    def test_compile_sheets(self) -> None:
+        """Тестирование метода `compile_sheets`."""
+        model = CompiledFormulaModel.compile_sheets({
+            'Лист1': self.formulas,
+            'Лист2': {'Лист2!A1': '=A2 + Лист1!A1'},
+        })
+        self.assertEqual(('Лист1!C1', 'Лист2!A1', 'Лист1!D1', 'Лист1!E1'), model.order)
+        evaluator = Evaluator(model.build_model({'Лист1!A1': 1, 'Лист1!B1': 2, 'Лист2!A2': 3}))
+        self.assertEqual([3, 4, 6, 10], [evaluator.evaluate(c) for c in model.order])
+
+    def test_build_model(self) -> None:
+        """Тестирование метода `build_model`."""
+        model = CompiledFormulaModel.compile('Лист1', self.formulas)
+        for a, b, expected in ((1, 2, 11), (3, 4, 19)):
+            evaluator = Evaluator(model.build_model({'Лист1!A1': a, 'Лист1!B1': b, 'Лист2!A1': 5}))
+            self.assertEqual([a + b, (a + b) * 2, expected], [evaluator.evaluate(c) for c in model.order])
+
+    def test_get_compiled_formula_model(self) -> None:
+        """Тестирование функции `get_compiled_formula_model`."""
+        model = get_compiled_formula_model('Лист1', self.formulas)
+        self.assertIs(model, get_compiled_formula_model('Лист1', {**self.formulas}))
+        self.assertIsNot(model, get_compiled_formula_model('Лист1', {**self.formulas, 'Лист1!F1': '=E1'}))
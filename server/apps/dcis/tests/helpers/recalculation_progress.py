@@ -0,0 +1,122 @@
+"""Тестирование модуля хранения хода пересчета значений документов периода."""
+
+from types import SimpleNamespace
+
+import graphene
+from devind_dictionaries.models import Organization
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from graphql.execution import ExecutionResult
+
+from apps.core.models import User
+from apps.dcis.helpers.recalculation_progress import (
+    STATUS_FAILED,
+    STATUS_FINISHED,
+    STATUS_RUNNING,
+    add_recalculation_progress,
+    finish_recalculation_progress,
+    get_recalculation_progress,
+    start_recalculation_progress,
+)
+from apps.dcis.models import Period, Project
+from apps.dcis.schema.queries.period_queries import PeriodQueries
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RecalculationProgressTestCase(TestCase):
+    """Тестирование хода пересчета значений документов периода."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        cache.clear()
+
+    def test_recalculation_progress(self) -> None:
+        """Тестирование изменения хода пересчета."""
+        self.assertIsNone(get_recalculation_progress(1))
+        run_id = start_recalculation_progress(1, 3)
+        add_recalculation_progress(1, run_id)
+        add_recalculation_progress(1, run_id)
+        progress = get_recalculation_progress(1)
+        self.assertEqual((STATUS_RUNNING, 3, 2), (progress.status, progress.total, progress.processed))
+        self.assertIsNone(progress.finished_at)
+        add_recalculation_progress(1, run_id)
+        finish_recalculation_progress(1, run_id)
+        progress = get_recalculation_progress(1)
+        self.assertEqual((STATUS_FINISHED, 3, 3), (progress.status, progress.total, progress.processed))
+        self.assertIsNotNone(progress.finished_at)
+
+    def test_recalculation_progress_failed(self) -> None:
+        """Тестирование завершения пересчета с ошибкой."""
+        run_id = start_recalculation_progress(1, 2)
+        finish_recalculation_progress(1, run_id, STATUS_FAILED)
+        self.assertEqual(STATUS_FAILED, get_recalculation_progress(1).status)
+
+    def test_recalculation_progress_restarted(self) -> None:
+        """Тестирование независимости хода нового пересчета от частей предыдущего запуска."""
+        previous_run_id = start_recalculation_progress(1, 4)
+        add_recalculation_progress(1, previous_run_id)
+        run_id = start_recalculation_progress(1, 2)
+        self.assertNotEqual(previous_run_id, run_id)
+        add_recalculation_progress(1, previous_run_id, 3)
+        finish_recalculation_progress(1, previous_run_id, STATUS_FAILED)
+        add_recalculation_progress(1, run_id)
+        progress = get_recalculation_progress(1)
+        self.assertEqual((STATUS_RUNNING, 2, 1), (progress.status, progress.total, progress.processed))
+        add_recalculation_progress(1, run_id)
+        finish_recalculation_progress(1, run_id)
+        progress = get_recalculation_progress(1)
+        self.assertEqual((STATUS_FINISHED, 2, 2), (progress.status, progress.total, progress.processed))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PeriodRecalculationQueryTestCase(TestCase):
+    """Тестирование запроса `periodRecalculation`."""
+
+    schema = graphene.Schema(query=PeriodQueries)
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        cache.clear()
+        self.superuser = User.objects.create(username='superuser', email='superuser@gmail.com', is_superuser=True)
+        self.user = User.objects.create(username='user', email='user@gmail.com')
+        self.project = Project.objects.create(content_type=ContentType.objects.get_for_model(Organization))
+        self.period = Period.objects.create(project=self.project)
+
+    def test_period_recalculation(self) -> None:
+        """Тестирование получения хода пересчета значений документов периода."""
+        result = self._execute(self.superuser)
+        self.assertIsNone(result.errors)
+        self.assertIsNone(result.data['periodRecalculation'])
+        run_id = start_recalculation_progress(self.period.id, 3)
+        add_recalculation_progress(self.period.id, run_id, 2)
+        result = self._execute(self.superuser)
+        self.assertIsNone(result.errors)
+        progress = result.data['periodRecalculation']
+        self.assertEqual(
+            (STATUS_RUNNING, 3, 2, None),
+            (progress['status'], progress['total'], progress['processed'], progress['finishedAt']),
+        )
+        self.assertIsNotNone(progress['startedAt'])
+
+    def test_period_recalculation_permission_denied(self) -> None:
+        """Тестирование запрета получения хода пересчета без прав на просмотр периода."""
+        start_recalculation_progress(self.period.id, 1)
+        result = self._execute(self.user)
+        self.assertIsNotNone(result.errors)
+        self.assertIsNone(result.data['periodRecalculation'])
+
+    def _execute(self, user: User) -> ExecutionResult:
+        """Выполнение запроса хода пересчета от имени пользователя."""
+        return self.schema.execute(
+            """query {
+                periodRecalculation(periodId: "%s") {
+                    status
+                    total
+                    processed
+                    startedAt
+                    finishedAt
+                }
+            }""" % self.period.id,
+            context_value=SimpleNamespace(user=user),
+        )
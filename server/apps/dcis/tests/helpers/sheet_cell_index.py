@@ -0,0 +1,68 @@
+"""Тестирование модуля индекса ячеек листа по координатам."""
+
+from devind_dictionaries.models import Department
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from apps.dcis.helpers.cell import resolve_coordinates
+from apps.dcis.helpers.sheet_cell_index import (
+    get_sheet_cell_index,
+    get_sheet_cell_index_key,
+    get_sheets_cell_indices,
+)
+from apps.dcis.helpers.sheet_unload_cache import bump_sheet_version
+from apps.dcis.models import Cell, ColumnDimension, Document, Period, Project, RowDimension, Sheet
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SheetCellIndexTestCase(TestCase):
+    """Тестирование индекса ячеек листа."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        cache.clear()
+        self.project = Project.objects.create(content_type=ContentType.objects.get_for_model(Department))
+        self.period = Period.objects.create(project=self.project)
+        self.document = Document.objects.create(period=self.period)
+        self.sheet = Sheet.objects.create(name='Форма1', period=self.period)
+        self.column = ColumnDimension.objects.create(index=2, sheet=self.sheet)
+        self.row = RowDimension.objects.create(index=3, sheet=self.sheet)
+        self.child_row = RowDimension.objects.create(
+            index=1,
+            sheet=self.sheet,
+            parent=self.row,
+            document=self.document,
+        )
+        self.cell = Cell.objects.create(column=self.column, row=self.row, formula='=A1', default='1')
+        Cell.objects.create(column=self.column, row=self.child_row)
+
+    def test_get_sheet_cell_index(self) -> None:
+        """Тестирование функции `get_sheet_cell_index`."""
+        index = get_sheet_cell_index(self.sheet.id)
+        self.assertEqual(['B3'], list(index.keys()))
+        entry = index['B3']
+        self.assertEqual(
+            (self.cell.id, self.row.id, self.column.id, self.cell.kind, '1', '=A1', True),
+            tuple(entry),
+        )
+        self.assertEqual({self.sheet.id: index}, get_sheets_cell_indices([self.sheet.id]))
+
+    def test_bump_sheet_version(self) -> None:
+        """Тестирование построения нового индекса после изменения версии листа."""
+        get_sheet_cell_index(self.sheet.id)
+        self.cell.formula = '=A2'
+        self.cell.save(update_fields=('formula',))
+        self.assertEqual('=A1', get_sheet_cell_index(self.sheet.id)['B3'].formula)
+        bump_sheet_version(self.sheet.id)
+        self.assertEqual('=A2', get_sheet_cell_index(self.sheet.id)['B3'].formula)
+
+    def test_resolve_coordinates(self) -> None:
+        """Тестирование получения индексов только для листов, на которые ссылаются координаты."""
+        other_sheet = Sheet.objects.create(name='Форма2', period=self.period)
+        self.assertEqual(
+            [self.cell],
+            list(resolve_coordinates([self.sheet, other_sheet], ['Форма1!B3', 'Форма1!A1'])),
+        )
+        self.assertIsNotNone(cache.get(get_sheet_cell_index_key(self.sheet.id)))
+        self.assertIsNone(cache.get(get_sheet_cell_index_key(other_sheet.id)))
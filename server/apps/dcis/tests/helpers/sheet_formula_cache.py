@@ -0,0 +1,91 @@
+"""Тестирование модуля хранения зависимостей для расчета формул листа."""
+
+from collections import Counter
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from apps.dcis.helpers.sheet_formula_cache import SheetFormulaContainerCache
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SheetFormulaContainerCacheTestCase(TestCase):
+    """Тестирование класса `SheetFormulaContainerCache`."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        cache.clear()
+        self.container = SheetFormulaContainerCache('Лист1')
+        self.container.add_formula('C1', '=A1 + B1')
+        self.container.add_formula('D1', '=SUM(A1:C1) + Лист2!A1')
+        self.container.save(sheet_id=1)
+
+    def test_from_cache(self) -> None:
+        """Тестирование получения контейнера из кеша."""
+        container = SheetFormulaContainerCache.from_cache(1)
+        self.assertEqual('Лист1', container.sheet_name)
+        self.assertEqual(1, container.sheet_id)
+        self.assertEqual(
+            {'C1': Counter(['A1', 'B1']), 'D1': Counter(['A1', 'B1', 'C1', 'Лист2!A1'])},
+            container.dependency,
+        )
+        self.assertEqual(
+            {'A1': ['C1', 'D1'], 'B1': ['C1', 'D1'], 'C1': ['D1'], 'Лист2!A1': ['D1']},
+            container.inversion,
+        )
+
+    def test_delete_formula(self) -> None:
+        """Тестирование удаления формулы."""
+        self.container.delete_formula('C1')
+        self.assertEqual({'D1': Counter(['A1', 'B1', 'C1', 'Лист2!A1'])}, self.container.dependency)
+        self.assertEqual({'A1': ['D1'], 'B1': ['D1'], 'C1': ['D1'], 'Лист2!A1': ['D1']}, self.container.inversion)
+        self.container.save()
+        container = SheetFormulaContainerCache.from_cache(1)
+        self.assertEqual(self.container.dependency, container.dependency)
+        self.assertEqual(self.container.inversion, container.inversion)
+
+    def test_change_formula(self) -> None:
+        """Тестирование изменения формулы с сохранением только измененного узла."""
+        container = SheetFormulaContainerCache.from_cache(1)
+        container.change_formula('C1', '=A1 * 2')
+        self.assertEqual({'C1'}, container.dependency_cache.changed_coordinates)
+        container.save()
+        self.assertEqual(set(), container.dependency_cache.changed_coordinates)
+        self.assertEqual(self.container.dependency_cache.generation, container.dependency_cache.generation)
+        container = SheetFormulaContainerCache.from_cache(1)
+        self.assertEqual(
+            {'D1': Counter(['A1', 'B1', 'C1', 'Лист2!A1']), 'C1': Counter(['A1'])},
+            container.dependency,
+        )
+
+    def test_change_formula_index(self) -> None:
+        """Тестирование сохранения части индекса только при добавлении и удалении координат."""
+        container = SheetFormulaContainerCache.from_cache(1)
+        dependency_cache = container.dependency_cache
+        shard_key = dependency_cache.shard_key(dependency_cache.get_shard('C1'))
+        cache.delete(shard_key)
+        container.change_formula('C1', '=A1 * 2')
+        container.save()
+        self.assertIsNone(cache.get(shard_key))
+        container.delete_formula('C1')
+        container.save()
+        self.assertIsNotNone(cache.get(shard_key))
+        container.add_formula('E1', '=C1 + D1')
+        container.save()
+        container = SheetFormulaContainerCache.from_cache(1)
+        self.assertEqual(dependency_cache.generation, container.dependency_cache.generation)
+        self.assertEqual(
+            {'D1': Counter(['A1', 'B1', 'C1', 'Лист2!A1']), 'E1': Counter(['C1', 'D1'])},
+            container.dependency,
+        )
+
+    def test_missing_node(self) -> None:
+        """Тестирование получения контейнера при отсутствии узла в кеше."""
+        cache.delete(self.container.dependency_cache.node_key('C1'))
+        self.assertIsNone(SheetFormulaContainerCache.from_cache(1))
+
+    def test_missing_index_shard(self) -> None:
+        """Тестирование получения контейнера при отсутствии части индекса в кеше."""
+        dependency_cache = self.container.dependency_cache
+        cache.delete(dependency_cache.shard_key(dependency_cache.get_shard('D1')))
+        self.assertIsNone(SheetFormulaContainerCache.from_cache(1))
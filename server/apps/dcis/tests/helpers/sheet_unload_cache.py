@@ -0,0 +1,47 @@
+"""Тестирование модуля кеша выгруженной структуры листов."""
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from apps.dcis.helpers.sheet_unload_cache import (
+    bump_document_version,
+    bump_sheet_version,
+    get_sheet_rows,
+    get_sheet_rows_key,
+    set_sheet_rows,
+)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SheetUnloadCacheTestCase(TestCase):
+    """Тестирование кеша выгруженной структуры листов."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        cache.clear()
+        self.rows = [{'id': 1, 'cells': [{'id': 1, 'value': None}]}]
+
+    def test_get_sheet_rows_key(self) -> None:
+        """Тестирование функции `get_sheet_rows_key`."""
+        self.assertEqual(get_sheet_rows_key(1), get_sheet_rows_key(1))
+        self.assertEqual(get_sheet_rows_key(1, 1), get_sheet_rows_key(1, 1))
+        self.assertNotEqual(get_sheet_rows_key(1), get_sheet_rows_key(2))
+        self.assertNotEqual(get_sheet_rows_key(1, 1), get_sheet_rows_key(1, 2))
+
+    def test_bump_sheet_version(self) -> None:
+        """Тестирование функции `bump_sheet_version`."""
+        key = get_sheet_rows_key(1, 1)
+        set_sheet_rows(key, self.rows)
+        self.assertEqual(self.rows, get_sheet_rows(key))
+        bump_sheet_version(1)
+        self.assertIsNone(get_sheet_rows(get_sheet_rows_key(1, 1)))
+
+    def test_bump_document_version(self) -> None:
+        """Тестирование функции `bump_document_version`."""
+        sheet_key = get_sheet_rows_key(1)
+        document_key = get_sheet_rows_key(1, 1)
+        set_sheet_rows(sheet_key, self.rows)
+        set_sheet_rows(document_key, self.rows)
+        bump_document_version(1)
+        self.assertEqual(self.rows, get_sheet_rows(get_sheet_rows_key(1)))
+        self.assertIsNone(get_sheet_rows(get_sheet_rows_key(1, 1)))
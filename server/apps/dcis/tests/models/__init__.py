@@ -1,3 +1,4 @@
 from .document import DocumentModelTestCase, DocumentStatusModelTestCase
 from .methodical_support import PeriodMethodicalSupportModelTestCase
 from .project import ProjectModelTestCase
+from .sheet import CellStyleModelTestCase, ValueModelTestCase
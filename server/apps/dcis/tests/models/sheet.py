@@ -0,0 +1,101 @@
+"""Тесты моделей листа."""
+from devind_dictionaries.models import Organization
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from apps.dcis.models import (
+    Cell,
+    CellStyle,
+    ColumnDimension,
+    Document,
+    Period,
+    Project,
+    RowDimension,
+    Sheet,
+    Value,
+)
+from apps.dcis.models.sheet import get_value_number
+
+
+class CellStyleModelTestCase(TestCase):
+    """Тестирование модели `CellStyle`."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        self.organization_content_type = ContentType.objects.get_for_model(Organization)
+        self.project = Project.objects.create(content_type=self.organization_content_type)
+        self.period = Period.objects.create(project=self.project)
+        self.sheet = Sheet.objects.create(name='Лист', period=self.period)
+        self.columns = [ColumnDimension.objects.create(index=i, sheet=self.sheet) for i in range(1, 3)]
+        self.row = RowDimension.objects.create(index=1, sheet=self.sheet)
+
+    def test_get_or_create_style(self) -> None:
+        """Тестирование метода `get_or_create_style`."""
+        style = CellStyle.get_or_create_style({'strong': True, 'size': '14'})
+        self.assertTrue(style.strong)
+        self.assertEqual(14, style.size)
+        self.assertEqual('#FFFFFF', style.background)
+        styles: dict[str, CellStyle] = {}
+        self.assertEqual(style, CellStyle.get_or_create_style({'size': 14, 'strong': True}, styles))
+        with self.assertNumQueries(0):
+            self.assertEqual(style, CellStyle.get_or_create_style({'size': 14, 'strong': True}, styles))
+        self.assertNotEqual(style, CellStyle.get_or_create_style({'strong': True}))
+        self.assertEqual(2, CellStyle.objects.count())
+
+    def test_cell_style(self) -> None:
+        """Тестирование свойств стиля ячейки."""
+        cells = [Cell.objects.create(column=column, row=self.row, strong=True) for column in self.columns]
+        self.assertEqual(cells[0].style_id, cells[1].style_id)
+        cells[0].size = 14
+        cells[0].save(update_fields=('size',))
+        cells[0].refresh_from_db()
+        cells[1].refresh_from_db()
+        self.assertEqual(14, cells[0].size)
+        self.assertTrue(cells[0].strong)
+        self.assertEqual(12, cells[1].size)
+        self.assertNotEqual(cells[0].style_id, cells[1].style_id)
+
+    def test_cell_save_with_style(self) -> None:
+        """Тестирование сохранения ячейки с заранее найденным общим стилем без поиска стиля."""
+        style = CellStyle.get_or_create_style({})
+        with self.assertNumQueries(len(self.columns)):
+            cells = [Cell.objects.create(column=column, row=self.row, style=style) for column in self.columns]
+        self.assertEqual([style.id] * len(self.columns), [cell.style_id for cell in cells])
+        self.assertEqual(1, CellStyle.objects.count())
+
+
+class ValueModelTestCase(TestCase):
+    """Тестирование модели `Value`."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования."""
+        self.organization_content_type = ContentType.objects.get_for_model(Organization)
+        self.project = Project.objects.create(content_type=self.organization_content_type)
+        self.period = Period.objects.create(project=self.project)
+        self.document = Document.objects.create(period=self.period)
+        self.sheet = Sheet.objects.create(name='Лист', period=self.period)
+        self.column = ColumnDimension.objects.create(index=1, sheet=self.sheet)
+        self.row = RowDimension.objects.create(index=1, sheet=self.sheet)
+
+    def test_get_value_number(self) -> None:
+        """Тестирование функции `get_value_number`."""
+        self.assertEqual(1.5, get_value_number(' 1.5 '))
+        self.assertEqual(-2.0, get_value_number(-2.0))
+        self.assertIsNone(get_value_number('Нет'))
+        self.assertIsNone(get_value_number(''))
+        self.assertIsNone(get_value_number('inf'))
+        self.assertIsNone(get_value_number(None))
+
+    def test_save(self) -> None:
+        """Тестирование сохранения числового представления значения."""
+        value = Value.objects.create(
+            value='3.5',
+            document=self.document,
+            sheet=self.sheet,
+            column=self.column,
+            row=self.row,
+        )
+        self.assertEqual(3.5, Value.objects.get(pk=value.pk).number)
+        value.value = 'Текст'
+        value.save(update_fields=('value',))
+        self.assertIsNone(Value.objects.get(pk=value.pk).number)
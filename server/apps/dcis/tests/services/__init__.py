@@ -21,5 +21,6 @@ from .privilege_services import PrivilegeTestCase
 from .project_services import GetUserProjectsTestCase, ProjectTestCase
 from .row_dimension_services import RowDimensionTestCase
 from .sheet_services import ChangeCellFormulaTestCase, CheckCellOptionsTestCase, PasteTestCase
+from .sheet_unload_services import DocumentSheetUnloaderTestCase
 from .status_services import ArchivePeriodTestCase, CheckLimitationsTestCase, StatusTestCase
 from .values_services import RecalculateAllCellsTestCase, UpdateOrCreateValuesTestCase
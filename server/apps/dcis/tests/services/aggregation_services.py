@@ -11,7 +11,7 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from apps.core.models import User
 from apps.dcis.models import (
@@ -26,6 +26,7 @@ from apps.dcis.models import (
 from apps.dcis.services.aggregation_services import (
     add_aggregation_cell,
     add_cell_aggregation,
+    calculate_aggregations,
     check_cell_permission,
     delete_cells_aggregation,
     dependent_cells,
@@ -35,6 +36,7 @@ from apps.dcis.services.aggregation_services import (
 )
 
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class AggregationTestCase(TestCase):
     """Тестирование агрегации."""
 
@@ -133,6 +135,17 @@ class AggregationTestCase(TestCase):
         result = dependent_cells(self.form1_cell_aggregation.to_cells.all())
         self.assertListEqual(result, ["'Форма2'!A2", "'Форма2'!A3"])
 
+    def test_calculate_aggregations(self) -> None:
+        """Тестирование функции `calculate_aggregations`."""
+        self.assertEqual(
+            [3.5, 3.0, -1.0, 7.0, 0.0],
+            calculate_aggregations(
+                [Cell.AGGREGATION_SUM, Cell.AGGREGATION_AVG, Cell.AGGREGATION_MIN, Cell.AGGREGATION_MAX, None],
+                [0, 0, 1, 1, 2, 2, 3, 3, 4],
+                ['1', '2.5', '3', 'x', '4', '-1', '7', '2', 'x'],
+            )
+        )
+
     def test_add_aggregation_cell(self):
         """Тестирование функции `add_aggregation_cell`."""
         aggregation_cell = "'Форма2'!A1"
@@ -10,6 +10,7 @@ from django.test import TestCase
 
 from apps.core.models import User
 from apps.dcis.models import (
+    Cell,
     CuratorGroup,
     Division,
     Period,
@@ -272,6 +273,11 @@ class PeriodTestCase(TestCase):
         actual_period = self._create_period()
         expected_period = Period.objects.get(name='Test period')
         self.assertEqual(expected_period, actual_period)
+        sheet = actual_period.sheet_set.get()
+        self.assertEqual(9, sheet.columndimension_set.count())
+        self.assertEqual(11, sheet.rowdimension_set.count())
+        self.assertEqual(99, Cell.objects.filter(column__sheet=sheet, row__sheet=sheet).count())
+        self.assertEqual(13, sheet.mergedcell_set.count())
 
     def test_delete_period(self) -> None:
         """Тестирование функции `delete_period`."""
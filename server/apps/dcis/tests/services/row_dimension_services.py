@@ -4,6 +4,7 @@ from itertools import product
 from unittest.mock import patch
 
 from django.core.exceptions import PermissionDenied
+from django.test import override_settings
 
 from apps.dcis.models import Cell, ColumnDimension, Document, MergedCell, RowDimension
 from apps.dcis.services.row_dimension_services import (
@@ -11,9 +12,11 @@ from apps.dcis.services.row_dimension_services import (
     change_row_dimensions_fixed,
     get_relative_rows,
 )
+from apps.dcis.services.sheet_unload_services import SheetColumnsUnloader, SheetPartialRowsUploader
 from .common import TableTestCase
 
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class RowDimensionTestCase(TableTestCase):
     """Тесты модуля, отвечающего за работу со строками."""
 
@@ -60,6 +63,28 @@ class RowDimensionTestCase(TableTestCase):
         for k, v in self.root_row_dimension_change_data.items():
             self.assertEqual(v, getattr(changed_row, k))
 
+    def test_unload_partial_rows(self) -> None:
+        """Тестирование выгрузки вложенной дочерней строки с родительскими строками."""
+        parent = self.root_row_dimension
+        rows: list[RowDimension] = []
+        for _ in range(3):
+            parent = RowDimension.objects.create(sheet=self.sheet, index=1, parent=parent, document=self.document)
+            for column in self.column_dimensions:
+                Cell.objects.create(row=parent, column=column)
+            rows.append(parent)
+        unloaded_row = SheetPartialRowsUploader(
+            columns_unloader=SheetColumnsUnloader(self.sheet.columndimension_set.all()),
+            rows=[rows[-1]],
+            cells=Cell.objects.filter(row=rows[-1]),
+            merged_cells=self.sheet.mergedcell_set.all(),
+            values=[],
+            rows_global_indices_map={row.id: i for i, row in enumerate([self.root_row_dimension, *rows], 1)},
+        ).unload()[0]
+        self.assertEqual(rows[-1].id, unloaded_row['id'])
+        self.assertEqual('1.1.1.1', unloaded_row['name'])
+        self.assertEqual(4, unloaded_row['global_index'])
+        self.assertEqual(len(self.column_dimensions), len(unloaded_row['cells']))
+
     def test_get_relative_rows(self) -> None:
         """Тестирование функции `get_relative_rows`."""
         self.assertEqual([self.root_row_dimension], get_relative_rows(self.root_row_dimension))
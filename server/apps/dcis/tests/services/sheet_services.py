@@ -22,6 +22,7 @@ from apps.dcis.services.value_services import ValueInput, update_or_create_value
 from apps.dcis.tasks import recalculate_cell_task
 
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class CheckCellOptionsTestCase(TestCase):
     """Тестирование класса `CheckCellOptions`."""
 
@@ -258,6 +259,7 @@ class ChangeCellFormulaTestCase(TestCase):
             self.assertEqual(expected_value, actual_value)
 
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class PasteTestCase(TestCase):
     """Тестирование функции `paste_into_cells`."""
 
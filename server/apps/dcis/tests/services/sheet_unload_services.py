@@ -0,0 +1,154 @@
+"""Тесты модуля для выгрузки листов."""
+
+from itertools import product
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from apps.dcis.helpers.sheet_unload_cache import get_sheet_rows, get_sheet_rows_key
+from apps.dcis.models import Cell, ColumnDimension, Document, MergedCell, RowDimension, Value
+from apps.dcis.services.sheet_unload_services import DocumentSheetUnloader
+from .common import TableTestCase
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DocumentSheetUnloaderTestCase(TableTestCase):
+    """Тестирование выгрузки листа документа по диапазону строк."""
+
+    def setUp(self) -> None:
+        """Создание данных для тестирования.
+
+        Плоская структура строк: 1, 2, 2.1, 2.1.1, 2.2, 3, 4, 5.
+        """
+        super().setUp()
+        cache.clear()
+        self.document = Document.objects.create(period=self.period)
+        self.context = SimpleNamespace(user=self.superuser)
+
+        self.columns = [ColumnDimension.objects.create(sheet=self.sheet, index=i) for i in range(1, 3)]
+        self.root_rows = [RowDimension.objects.create(sheet=self.sheet, index=i) for i in range(1, 6)]
+        self.child_row = self._create_child_row(self.root_rows[1], 1)
+        self.grandchild_row = self._create_child_row(self.child_row, 1)
+        self.second_child_row = self._create_child_row(self.root_rows[1], 2)
+        for row, column in product(self.root_rows, self.columns):
+            Cell.objects.create(row=row, column=column)
+        self.flat_rows = [
+            self.root_rows[0],
+            self.root_rows[1],
+            self.child_row,
+            self.grandchild_row,
+            self.second_child_row,
+            *self.root_rows[2:],
+        ]
+
+        MergedCell.objects.create(sheet=self.sheet, min_col=1, min_row=1, max_col=1, max_row=2)
+        MergedCell.objects.create(sheet=self.sheet, min_col=2, min_row=3, max_col=2, max_row=4)
+        self.value = Value.objects.create(
+            document=self.document,
+            sheet=self.sheet,
+            row=self.grandchild_row,
+            column=self.columns[0],
+            value='10',
+        )
+
+    def test_rows_global_indices_map(self) -> None:
+        """Тестирование индексов строк в плоской структуре."""
+        unloader = self._create_unloader(['rows_count'])
+        self.assertEqual(
+            {row.id: i for i, row in enumerate(self.flat_rows, 1)},
+            unloader.rows_global_indices_map,
+        )
+        self.assertEqual(len(self.flat_rows), unloader.unload()['rows_count'])
+
+    def test_window_inside_child_rows(self) -> None:
+        """Тестирование диапазона, начинающегося внутри дочерних строк.
+
+        Диапазон содержит строки 2.1.1 и 2.2, поэтому выгружаются родительские строки 2 и 2.1,
+        а также строка 1, в которой начинается объединение, пересекающее строку 2.
+        """
+        expected_rows = [
+            (self.root_rows[0].id, 1, '1'),
+            (self.root_rows[1].id, 2, '2'),
+            (self.child_row.id, 3, '2.1'),
+            (self.grandchild_row.id, 4, '2.1.1'),
+            (self.second_child_row.id, 5, '2.2'),
+        ]
+        self.assertEqual(
+            {row_id for row_id, _, _ in expected_rows},
+            self._create_unloader(['rows'], 4, 5)._find_window_row_ids(),
+        )
+        rows = self._create_unloader(['rows'], 4, 5).unload()['rows']
+        self._test_rows(expected_rows, rows, self.root_rows[0], self.columns[0])
+        self._test_full_rows_cached()
+        cached_rows = self._create_unloader(['rows'], 4, 5).unload()['rows']
+        self._test_rows(expected_rows, cached_rows, self.root_rows[0], self.columns[0])
+        self.assertEqual(self._get_cells_ids(rows), self._get_cells_ids(cached_rows))
+
+    def test_window_merged_cells_edge(self) -> None:
+        """Тестирование диапазона, край которого пересекает объединение."""
+        expected_rows = [
+            (self.root_rows[2].id, 6, '3'),
+            (self.root_rows[3].id, 7, '4'),
+            (self.root_rows[4].id, 8, '5'),
+        ]
+        rows = self._create_unloader(['rows'], 7).unload()['rows']
+        self._test_rows(expected_rows, rows, self.root_rows[2], self.columns[1])
+        self._test_full_rows_cached()
+        cached_rows = self._create_unloader(['rows'], 7).unload()['rows']
+        self._test_rows(expected_rows, cached_rows, self.root_rows[2], self.columns[1])
+        self.assertEqual(self._get_cells_ids(rows), self._get_cells_ids(cached_rows))
+
+    def _create_child_row(self, parent: RowDimension, index: int) -> RowDimension:
+        """Создание дочерней строки документа с ячейками."""
+        row = RowDimension.objects.create(
+            sheet=self.sheet,
+            index=index,
+            parent=parent,
+            document=self.document,
+        )
+        for column in self.columns:
+            Cell.objects.create(row=row, column=column)
+        return row
+
+    def _create_unloader(
+        self,
+        fields: list[str],
+        first_global_index: int | None = None,
+        last_global_index: int | None = None,
+    ) -> DocumentSheetUnloader:
+        """Создание выгрузчика листа документа."""
+        return DocumentSheetUnloader(
+            self.context,
+            sheet=self.sheet,
+            document_id=self.document.id,
+            fields=fields,
+            first_global_index=first_global_index,
+            last_global_index=last_global_index,
+        )
+
+    def _test_full_rows_cached(self) -> None:
+        """Тестирование сохранения полной структуры листа в кеш."""
+        rows = self._create_unloader(['rows']).unload()['rows']
+        self.assertEqual([row.id for row in self.flat_rows], [row['id'] for row in rows])
+        self.assertIsNotNone(get_sheet_rows(get_sheet_rows_key(self.sheet.id, self.document.id)))
+
+    def _test_rows(
+        self,
+        expected_rows: list[tuple[int, int, str]],
+        rows: list[dict],
+        merged_row: RowDimension,
+        merged_column: ColumnDimension,
+    ) -> None:
+        """Тестирование выгруженных строк, начальной ячейки объединения и значений документа."""
+        self.assertEqual(expected_rows, [(row['id'], row['global_index'], row['name']) for row in rows])
+        cells = {(cell['row_id'], cell['column_id']): cell for row in rows for cell in row['cells']}
+        self.assertEqual(2, cells[(merged_row.id, merged_column.id)]['rowspan'])
+        value_cell = cells.get((self.value.row_id, self.value.column_id))
+        if value_cell is not None:
+            self.assertEqual(self.value.value, value_cell['value'])
+
+    @staticmethod
+    def _get_cells_ids(rows: list[dict]) -> list[tuple[int, list[int]]]:
+        """Получение идентификаторов ячеек строк."""
+        return [(row['id'], [cell['id'] for cell in row['cells']]) for row in rows]
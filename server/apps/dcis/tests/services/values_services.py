@@ -1,19 +1,55 @@
 """Тесты модуля, отвечающего за работу со значениями."""
 
 from dataclasses import dataclass
+from datetime import timedelta
 from typing import Iterable
+from unittest.mock import patch
 
+from celery.exceptions import Retry
 from devind_dictionaries.models import Organization
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db.models import Q
+from django.db.models.signals import post_init
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 from openpyxl.utils import get_column_letter
 
 from apps.core.models import User
+from apps.dcis.helpers.aggregation_queue import get_pending_aggregations, mark_aggregations_pending
+from apps.dcis.helpers.recalculation_progress import (
+    STATUS_FINISHED,
+    get_recalculation_progress,
+    start_recalculation_progress,
+)
 from apps.dcis.helpers.sheet_formula_cache import SheetFormulaContainerCache
+from apps.dcis.helpers.sheet_unload_cache import get_sheet_rows_key
 from apps.dcis.models import Cell, ColumnDimension, Document, Period, Project, RowDimension, Sheet
 from apps.dcis.models.sheet import KindCell, Value
-from apps.dcis.services.value_services import ValueInput, recalculate_all_cells, update_or_create_values
+from apps.dcis.services.value_services import (
+    AggregationTree,
+    PeriodRecalculationPlan,
+    RecalculationData,
+    ValueData,
+    ValueInput,
+    bulk_update_or_create_values,
+    get_all_recalculation_cells,
+    get_document_sheet_values,
+    get_recalculation_cells,
+    recalculate_all_cells,
+    recalculate_pending_aggregations,
+    update_or_create_value,
+    update_or_create_values,
+)
+from apps.dcis.tasks import (
+    AGGREGATION_TASK_RETRY_DELAY,
+    recalculate_aggregations_task,
+    recalculate_all_cells_task,
+    recalculate_cell_task,
+    recalculate_documents_task,
+)
+from devind.celery import app
 
 
 @dataclass
@@ -25,7 +61,10 @@ class CellData:
     error: str | None = None
 
 
-@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    AGGREGATION_PROPAGATION_DELAY=None,
+)
 class UpdateOrCreateValuesTestCase(TestCase):
     """Тестирование сервисов для создания или обновления значений."""
 
@@ -253,9 +292,7 @@ class UpdateOrCreateValuesTestCase(TestCase):
         formula_cell_q = Q(column__sheet_id=self.forms[0].id, column__index=4, row__index=2)
         formula_cell1 = Cell.objects.get(formula_cell_q)
         q |= formula_cell_q
-        formula_cell_q = Q(column__sheet_id=self.forms[1].id, column__index=4, row__index=2)
-        formula_cell2 = Cell.objects.get(formula_cell_q)
-        q |= formula_cell_q
+        formula_cell2 = Cell.objects.get(column__sheet_id=self.forms[1].id, column__index=4, row__index=2)
         formula_cell1.formula = '=SUM(B3:C3) / 0'
         formula_cell1.save(update_fields=('formula',))
         result = update_or_create_values(
@@ -274,6 +311,26 @@ class UpdateOrCreateValuesTestCase(TestCase):
             set(Value.objects.filter(q & Q(document=self.parent_document))),
             set(result.values)
         )
+        self.assertFalse(Value.objects.filter(
+            column=formula_cell2.column,
+            row=formula_cell2.row,
+            document=self.parent_document,
+        ).first() in result.values)
+        self._test_values(self.expected_values, self.parent_document)
+
+    def test_formula_unchanged(self) -> None:
+        """Тестирование изменения ячейки, после которого значения зависимых формул не изменяются."""
+        form = self.forms[0]
+        q = Q(column__sheet_id=form.id, column__index=2, row__index=1)
+        cell = Cell.objects.get(q)
+        result = update_or_create_values(
+            user=self.user,
+            document=self.parent_document,
+            sheet_id=form.id,
+            value_inputs=[ValueInput(cell=cell, value='1.0')]
+        )
+        self.assertEqual([Value.objects.get(q & Q(document=self.parent_document))], result.values)
+        self.expected_values[cell] = CellData(True, '1.0')
         self._test_values(self.expected_values, self.parent_document)
 
     def test_formula_multiple(self) -> None:
@@ -355,6 +412,60 @@ class UpdateOrCreateValuesTestCase(TestCase):
         self.assertTrue(aggregation_value in result.values)
         self._test_value(aggregation_value, ('15.0', None))
 
+    def test_aggregation_tree(self) -> None:
+        """Тестирование пересчета агрегации по нескольким уровням дерева дивизионов."""
+        grandchild_organization = Organization.objects.create(attributes='', parent=self.children_organizations[0])
+        self.period.division_set.create(object_id=grandchild_organization.id)
+        grandchild_document = Document.objects.create(period=self.period, object_id=grandchild_organization.id)
+        grandchild_document.sheets.set(self.forms)
+        top_cell = Cell.objects.create(
+            kind=KindCell.NUMERIC,
+            aggregation=Cell.AGGREGATION_SUM,
+            column=ColumnDimension.objects.create(index=5, sheet=self.aggregation_form),
+            row=self.aggregation_row,
+        )
+        top_cell.to_cells.create(from_cell=self.aggregation_cell)
+        form = self.forms[0]
+        cell = Cell.objects.get(column__sheet_id=form.id, column__index=1, row__index=3)
+        result = update_or_create_values(
+            user=self.user,
+            document=grandchild_document,
+            sheet_id=form.id,
+            value_inputs=[ValueInput(cell, value='5.0')]
+        )
+        aggregation_value = Value.objects.get(
+            document=self.children_documents[0],
+            column=self.aggregation_cell.column,
+            row=self.aggregation_cell.row,
+        )
+        self.assertTrue(aggregation_value in result.values)
+        self._test_value(aggregation_value, ('6.0', None))
+        top_value = Value.objects.get(document=self.parent_document, column=top_cell.column, row=top_cell.row)
+        self.assertTrue(top_value in result.values)
+        self._test_value(top_value, ('24.0', None))
+
+    def test_aggregation_tree_loads(self) -> None:
+        """Тестирование загрузки связей и дивизионов только для цепочки пересчета."""
+        document = self.children_documents[0]
+        cell = Cell.objects.get(column__sheet_id=self.forms[0].id, column__index=1, row__index=3)
+        with self.assertNumQueries(0):
+            tree = AggregationTree(self.period, document.version)
+        tree.recalculate(document, [RecalculationData(cell=cell, value=None)])
+        self.assertEqual([cell.id], list(tree.targets.keys()))
+        self.assertEqual([self.aggregation_cell.id], list(tree.sources.keys()))
+        self.assertEqual(
+            {self.children_organizations[0].id: document.id, self.parent_organization.id: self.parent_document.id},
+            tree.documents,
+        )
+        self.assertCountEqual(
+            [child_document.id for child_document in self.children_documents],
+            tree.children[self.parent_organization.id],
+        )
+        self.assertEqual({document.id, self.parent_document.id}, set(tree.document_objects.keys()))
+        with CaptureQueriesContext(connection) as context:
+            tree.recalculate(document, [RecalculationData(cell=cell, value=None)])
+        self.assertFalse(any('FROM "dcis_document"' in query['sql'] for query in context.captured_queries))
+
     def test_aggregation_depends_on_formula(self) -> None:
         """Тестирование изменения ячейки, от которой зависит формула.
 
@@ -427,6 +538,176 @@ class UpdateOrCreateValuesTestCase(TestCase):
         self.assertTrue(formula_value in result.values)
         self._test_value(formula_value, ('32.0', None))
 
+    def test_bulk_update_or_create_values(self) -> None:
+        """Тестирование функции `bulk_update_or_create_values`."""
+        form = self.forms[0]
+        q = Q(column__sheet_id=form.id, column__index__lte=2, row__index=3)
+        cells = list(Cell.objects.filter(q).order_by('column__index'))
+        rows_key = get_sheet_rows_key(form.id, self.parent_document.id)
+        with self.assertNumQueries(3):
+            values = bulk_update_or_create_values(
+                document=self.parent_document,
+                values_data=[
+                    ValueData(cell=cell, sheet_id=form.id, value=f'{10 + i:.1f}', error=f'error{i}')
+                    for i, cell in enumerate(cells)
+                ],
+            )
+        self.assertEqual([(cell.column_id, cell.row_id) for cell in cells], [(v.column_id, v.row_id) for v in values])
+        self.assertEqual(rows_key, get_sheet_rows_key(form.id, self.parent_document.id))
+        for i, cell in enumerate(cells):
+            self._test_value(
+                Value.objects.get(column=cell.column, row=cell.row, document=self.parent_document),
+                (f'{10 + i:.1f}', f'error{i}')
+            )
+
+    def test_bulk_update_or_create_values_diagonal(self) -> None:
+        """Тестирование загрузки существующих значений только для изменяемых ячеек."""
+        form = self.forms[0]
+        cells = [
+            Cell.objects.get(column__sheet_id=form.id, column__index=i, row__index=i) for i in range(1, 3)
+        ]
+        loaded_values: list[Value] = []
+
+        def on_value_init(sender, instance: Value, **kwargs) -> None:
+            loaded_values.append(instance)
+
+        post_init.connect(on_value_init, sender=Value)
+        try:
+            values = bulk_update_or_create_values(
+                document=self.parent_document,
+                values_data=[ValueData(cell=cell, sheet_id=form.id, value='7.0', error=None) for cell in cells],
+            )
+        finally:
+            post_init.disconnect(on_value_init, sender=Value)
+        # Загружается значение ячейки A1 и создается значение ячейки B2, значение ячейки A2 не загружается
+        self.assertEqual(2, len(loaded_values))
+        self.assertEqual([cell.row_id for cell in cells], [value.row_id for value in values])
+        document_values = Value.objects.filter(document=self.parent_document, sheet=form)
+        self.assertEqual(
+            ['7.0', '7.0', '2.0'],
+            [
+                document_values.get(column__index=column_index, row__index=row_index).value
+                for column_index, row_index in ((1, 1), (2, 2), (1, 2))
+            ],
+        )
+
+    @override_settings(AGGREGATION_PROPAGATION_DELAY=5)
+    def test_aggregation_deferred(self) -> None:
+        """Тестирование отложенного пересчета агрегации родительского документа."""
+        form = self.forms[0]
+        document = self.children_documents[0]
+        cell = Cell.objects.get(column__sheet_id=form.id, column__index=1, row__index=3)
+        parent_value = update_or_create_value(
+            document=self.parent_document,
+            sheet_id=self.aggregation_form.id,
+            cell=self.aggregation_cell,
+            value='0.0',
+        )
+        with patch('apps.dcis.services.value_services.recalculate_aggregations_task') as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                update_or_create_values(self.user, document, form.id, [ValueInput(cell, value='3.0')])
+            with self.captureOnCommitCallbacks(execute=True):
+                update_or_create_values(self.user, document, form.id, [ValueInput(cell, value='4.0')])
+        task.apply_async.assert_called_once_with((self.parent_document.id, [self.aggregation_cell.id]), countdown=5)
+        self._test_value(Value.objects.get(pk=parent_value.pk), ('0.0', None))
+        self.assertEqual(
+            [True],
+            [
+                value['pending'] for value in get_document_sheet_values(self.parent_document, self.aggregation_form.id)
+                if value['column_id'] == self.aggregation_cell.column_id
+            ],
+        )
+        recalculate_pending_aggregations(self.parent_document, [self.aggregation_cell.id])
+        self._test_value(Value.objects.get(pk=parent_value.pk), ('11.0', None))
+        self.assertFalse(any(
+            value['pending'] for value in get_document_sheet_values(self.parent_document, self.aggregation_form.id)
+        ))
+
+    def test_aggregation_deferred_enqueue_failed(self) -> None:
+        """Тестирование снятия пометок ожидания пересчета при ошибке постановки задачи в очередь."""
+        form = self.forms[0]
+        document = self.children_documents[0]
+        cell = Cell.objects.get(column__sheet_id=form.id, column__index=1, row__index=3)
+        with patch('apps.dcis.services.value_services.recalculate_aggregations_task') as task:
+            task.apply_async.side_effect = ConnectionError
+            with self.assertRaises(ConnectionError):
+                with self.captureOnCommitCallbacks(execute=True):
+                    update_or_create_values(self.user, document, form.id, [ValueInput(cell, value='3.0')])
+            self.assertEqual({}, get_pending_aggregations(self.parent_document.id, [self.aggregation_cell.id]))
+            task.apply_async.side_effect = None
+            with self.captureOnCommitCallbacks(execute=True):
+                update_or_create_values(self.user, document, form.id, [ValueInput(cell, value='4.0')])
+        self.assertEqual(2, task.apply_async.call_count)
+        task.apply_async.assert_called_with((self.parent_document.id, [self.aggregation_cell.id]), countdown=5)
+
+    @override_settings(AGGREGATION_PROPAGATION_DELAY=5)
+    def test_aggregation_deferred_loads(self) -> None:
+        """Тестирование загрузки только родительского уровня при отложенном пересчете агрегации."""
+        root_organization = Organization.objects.create(attributes='')
+        self.parent_organization.parent = root_organization
+        self.parent_organization.save(update_fields=('parent',))
+        self.period.division_set.create(object_id=root_organization.id)
+        Document.objects.create(period=self.period, object_id=root_organization.id)
+        document = self.children_documents[0]
+        cell = Cell.objects.get(column__sheet_id=self.forms[0].id, column__index=1, row__index=3)
+        tree = AggregationTree(self.period, document.version)
+        with patch('apps.dcis.services.value_services.recalculate_aggregations_task') as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                tree.recalculate(document, [RecalculationData(cell=cell, value=None)], propagate=False)
+        task.apply_async.assert_called_once_with((self.parent_document.id, [self.aggregation_cell.id]), countdown=5)
+        self.assertEqual(
+            {self.children_organizations[0].id: document.id, self.parent_organization.id: self.parent_document.id},
+            tree.documents,
+        )
+        self.assertEqual({self.children_organizations[0].id, self.parent_organization.id}, set(tree.parents.keys()))
+        self.assertEqual([cell.id], list(tree.targets.keys()))
+
+    def test_recalculate_aggregations_task_retry(self) -> None:
+        """Тестирование восстановления пометок ожидания пересчета при повторе задачи."""
+        cell_ids = [self.aggregation_cell.id]
+        with patch(
+            'apps.dcis.services.value_services.recalculate_pending_aggregations',
+            side_effect=ConnectionError,
+        ), patch.object(recalculate_aggregations_task, 'retry', side_effect=Retry) as retry:
+            with self.assertRaises(Retry):
+                recalculate_aggregations_task(self.parent_document.id, cell_ids)
+        self.assertEqual(AGGREGATION_TASK_RETRY_DELAY, retry.call_args.kwargs['countdown'])
+        self.assertEqual(cell_ids, list(get_pending_aggregations(self.parent_document.id, cell_ids).keys()))
+
+    def test_recalculate_aggregations_task_deleted_document(self) -> None:
+        """Тестирование задачи пересчета для удаленного документа без повторов."""
+        document_id = self.parent_document.id
+        cell_ids = [self.aggregation_cell.id]
+        mark_aggregations_pending(document_id, cell_ids)
+        self.parent_document.delete()
+        with patch.object(recalculate_aggregations_task, 'retry') as retry:
+            with self.assertRaises(Document.DoesNotExist):
+                recalculate_aggregations_task(document_id, cell_ids)
+        retry.assert_not_called()
+        self.assertEqual({}, get_pending_aggregations(document_id, cell_ids))
+
+    def test_get_document_sheet_values(self) -> None:
+        """Тестирование функции `get_document_sheet_values`."""
+        form = self.forms[0]
+        expected_values = [
+            {
+                'row_id': value.row_id,
+                'column_id': value.column_id,
+                'value': value.value,
+                'error': value.error,
+                'pending': False,
+            } for value in Value.objects.filter(document=self.parent_document, sheet=form)
+        ]
+        self.assertCountEqual(expected_values, get_document_sheet_values(self.parent_document, form.id))
+        row = form.rowdimension_set.get(index=1)
+        RowDimension.objects.filter(sheet=form).update(updated_at=now() - timedelta(days=1))
+        updated_since = now()
+        RowDimension.objects.filter(pk=row.pk).update(updated_at=updated_since)
+        self.assertCountEqual(
+            [value for value in expected_values if value['row_id'] == row.id],
+            get_document_sheet_values(self.parent_document, form.id, updated_since)
+        )
+
     def _test_values(self, values: dict[Cell, CellData], document: Document) -> None:
         """Тестирование значений ячеек."""
         for form in self.forms:
@@ -449,7 +730,10 @@ class UpdateOrCreateValuesTestCase(TestCase):
         self.assertEqual(value.error, data[1])
 
 
-@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    AGGREGATION_PROPAGATION_DELAY=None,
+)
 class RecalculateAllCellsTestCase(TestCase):
     """Тестирование функции `recalculate_all_cells`."""
 
@@ -570,6 +854,52 @@ class RecalculateAllCellsTestCase(TestCase):
         ))
         self._test_values(self.parent_document, [self.aggregation_column], (('0.0', False),))
         recalculate_all_cells(self.superuser, self.period)
+        self._test_recalculated_values()
+
+    def test_recalculate_all_cells_task(self) -> None:
+        """Тестирование задачи `recalculate_all_cells_task`, выполняемой частями."""
+        self._run_tasks_eagerly()
+        with patch('apps.dcis.tasks.RECALCULATION_CHUNK_SIZE', 2):
+            recalculate_all_cells_task.delay(self.superuser.id, self.period.id)
+        self._test_recalculated_values()
+        progress = get_recalculation_progress(self.period.id)
+        self.assertEqual((STATUS_FINISHED, 3, 3), (progress.status, progress.total, progress.processed))
+        self.assertIsNotNone(progress.finished_at)
+
+    def test_recalculate_cell_task(self) -> None:
+        """Тестирование задачи `recalculate_cell_task`."""
+        self._run_tasks_eagerly()
+        cell = Cell.objects.get(column=self.columns[1])
+        recalculate_cell_task.delay(self.superuser.id, cell.id)
+        self._test_values(self.documents[0], self.columns[:3], (('12.0', True), ('2.0', False), ('10.0', True)))
+        self._test_values(self.documents[1], self.columns[:3], (('5.0', True), ('2.0', False), ('3.0', False)))
+        progress = get_recalculation_progress(self.period.id)
+        self.assertEqual((STATUS_FINISHED, 3, 3), (progress.status, progress.total, progress.processed))
+
+    def test_recalculate_documents_task_queries(self) -> None:
+        """Тестирование построения плана пересчета один раз для части документов."""
+        dependency_cells = get_recalculation_cells(self.period, get_all_recalculation_cells(self.period))
+        document_ids = [document.id for document in self.documents]
+        run_id = start_recalculation_progress(self.period.id, len(document_ids))
+        with CaptureQueriesContext(connection) as context:
+            recalculate_documents_task(self.superuser.id, self.period.id, run_id, document_ids, dependency_cells)
+        period_sheets_sql = f'FROM "dcis_sheet" WHERE "dcis_sheet"."period_id" = {self.period.id}'
+        self.assertEqual(1, len([query for query in context.captured_queries if period_sheets_sql in query['sql']]))
+        self.assertEqual(len(document_ids), get_recalculation_progress(self.period.id).processed)
+        self._test_values(self.documents[0], self.columns[:1], (('12.0', True),))
+        self._test_values(self.documents[1], self.columns[3:4], (('13.0', True),))
+
+    def _run_tasks_eagerly(self) -> None:
+        """Выполнение задач Celery синхронно до окончания теста."""
+        eager_settings = {
+            'task_always_eager': app.conf.task_always_eager,
+            'task_eager_propagates': app.conf.task_eager_propagates,
+        }
+        app.conf.update(task_always_eager=True, task_eager_propagates=True)
+        self.addCleanup(app.conf.update, **eager_settings)
+
+    def _test_recalculated_values(self) -> None:
+        """Тестирование значений ячеек после пересчета всех ячеек периода."""
         self._test_values(self.documents[0], self.columns, (
             ('12.0', True),
             ('2.0', False),
@@ -590,6 +920,20 @@ class RecalculateAllCellsTestCase(TestCase):
         ))
         self._test_values(self.parent_document, [self.aggregation_column], (('30.0', True),))
 
+    def test_period_recalculation_plan(self) -> None:
+        """Тестирование построения плана пересчета один раз для всех документов периода."""
+        plan = PeriodRecalculationPlan(self.period)
+        cells = plan.resolve_coordinates(['Форма №1!B1', 'Форма №1!C1'])
+        self.assertEqual(2, len(cells))
+        sheets = plan.get_document_sheets(self.documents[0])
+        formula_plan, resolved_cells = plan.get_formula_plan(sheets, cells)
+        self.assertIn('Форма №1!A1', formula_plan.inversion_cells)
+        self.assertTrue(resolved_cells)
+        with self.assertNumQueries(0):
+            self.assertIs(formula_plan, plan.get_formula_plan(sheets, reversed(cells))[0])
+        version = self.documents[0].version
+        self.assertIs(plan.get_aggregation_tree(version), plan.get_aggregation_tree(version))
+
     def _test_values(
         self,
         document: Document,
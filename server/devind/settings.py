@@ -183,6 +183,10 @@ CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_ENABLE_UTC = True
 CELERY_RESULT_EXPIRES = None
 
+# Задержка в секундах, в течение которой пересчеты агрегации родительских документов объединяются.
+# При пустом значении агрегация родительских документов пересчитывается сразу при сохранении значений.
+AGGREGATION_PROPAGATION_DELAY: int | None = int(os.getenv('AGGREGATION_PROPAGATION_DELAY', '5') or 0) or None
+
 
 CACHES = {
     'default': {